@@ -0,0 +1,124 @@
+# activity.py
+"""
+Per-user daily activity rollup (DailyActivity: one row per user and local calendar day).
+
+Counters are bumped in the same transaction as the write they count, from the two commit
+paths every task and ledger change already goes through:
+  - UserTask created                   → orders
+  - UserTask status → APPROVED         → commission_cents (commission_used)
+  - WalletTxn kind DEPOSIT             → deposit_cents / deposits (signed, so reversals net out)
+  - WalletTxn kind in WITHDRAW_KINDS   → withdraw_cents / withdrawals (cash out, positive)
+Readers (task dashboard, /bo/) then fetch one indexed (user, date) row, or sum one date,
+instead of counting `created_at__date=...` (a function on the column, so no index use).
+`manage.py backfill_activity` rebuilds days from the source tables.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import BigIntegerField, Case, F, Sum, Value, When
+from django.utils import timezone
+
+WITHDRAW_KINDS = ("WITHDRAW", "PAYOUT", "CASH_OUT")
+COUNTERS = ("orders", "commission_cents", "deposit_cents", "deposits", "withdraw_cents", "withdrawals")
+
+
+# ---- writes ----
+def bump(user_id: int, day=None, **deltas) -> None:
+    """Add deltas to one (user, day) row: one UPDATE, plus an INSERT on the user's first event of the day."""
+    from .models import DailyActivity  # local import to avoid circulars
+
+    deltas = {k: int(v) for k, v in deltas.items() if v}
+    if not deltas or not user_id:
+        return
+    day = day or timezone.localdate()
+    changes = {k: F(k) + v for k, v in deltas.items()}
+    if DailyActivity.objects.filter(user_id=user_id, date=day).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            DailyActivity.objects.create(user_id=user_id, date=day, **deltas)
+    except IntegrityError:
+        # another transaction created the row first
+        DailyActivity.objects.filter(user_id=user_id, date=day).update(**changes)
+
+
+def bump_many(rows, day=None) -> None:
+    """rows: iterable of (user_id, {counter: delta}); one INSERT IGNORE + one UPDATE per counter."""
+    from .models import DailyActivity
+
+    per_user = defaultdict(lambda: defaultdict(int))
+    for uid, deltas in rows:
+        if not uid:
+            continue
+        for k, v in deltas.items():
+            per_user[uid][k] += int(v)
+    per_user = {uid: {k: v for k, v in d.items() if v} for uid, d in per_user.items()}
+    per_user = {uid: d for uid, d in per_user.items() if d}
+    if not per_user:
+        return
+    if len(per_user) == 1:
+        (uid, deltas), = per_user.items()
+        return bump(uid, day, **deltas)
+
+    day = day or timezone.localdate()
+    uids = sorted(per_user)
+    DailyActivity.objects.bulk_create(
+        [DailyActivity(user_id=uid, date=day) for uid in uids], ignore_conflicts=True,
+    )
+    changes = {}
+    for counter in COUNTERS:
+        whens = [When(user_id=uid, then=Value(d[counter])) for uid, d in per_user.items() if d.get(counter)]
+        if whens:
+            changes[counter] = F(counter) + Case(*whens, default=Value(0), output_field=BigIntegerField())
+    DailyActivity.objects.filter(user_id__in=uids, date=day).update(**changes)
+
+
+def txn_deltas(kind: str, amount_cents: int) -> dict:
+    """Counter deltas for one ledger row ({} when the kind isn't tracked)."""
+    amount_cents = int(amount_cents or 0)
+    if kind == "DEPOSIT":
+        return {"deposit_cents": amount_cents, "deposits": 1 if amount_cents > 0 else 0}
+    if kind in WITHDRAW_KINDS:
+        return {"withdraw_cents": -amount_cents, "withdrawals": 1 if amount_cents < 0 else 0}
+    return {}
+
+
+def record_task_status(task, old, *, created: bool = False) -> None:
+    """
+    Call wherever a UserTask is created or changes status (post_save, or next to an .update()).
+    `old` is the status before this write; on an existing row None means unknown, and
+    commission is only counted for a known move into APPROVED.
+    """
+    from .task_currency import to_cents
+
+    if created:
+        bump(task.user_id, orders=1)
+    if task.status == "APPROVED" and old != "APPROVED" and (created or old is not None):
+        bump(task.user_id, commission_cents=to_cents(task.commission_used or 0))
+
+
+# ---- reads ----
+def for_user(user, day=None):
+    """The user's DailyActivity for a day (unsaved zero row when nothing happened)."""
+    from .models import DailyActivity
+
+    day = day or timezone.localdate()
+    user_id = getattr(user, "pk", user)
+    return (
+        DailyActivity.objects.filter(user_id=user_id, date=day).first()
+        or DailyActivity(user_id=user_id, date=day)
+    )
+
+
+def totals_for_day(day=None) -> dict:
+    """Site-wide sums for one day plus the number of users with any activity."""
+    from .models import DailyActivity
+
+    day = day or timezone.localdate()
+    qs = DailyActivity.objects.filter(date=day)
+    out = qs.aggregate(**{c: Sum(c) for c in COUNTERS})
+    out = {k: int(v or 0) for k, v in out.items()}
+    out["active_users"] = qs.count()
+    return out
@@ -30,14 +30,17 @@ from .models import (
     CustomUser,
     FortuneCardRule,
     FortuneCardGrant,
-    Wallet, WalletTxn,
+    Wallet, WalletTxn, WalletHold, LedgerEntry, VersionConflict,
     Country, Hotel, Favorite,
-    PayoutAddress, WithdrawalRequest,
-    DepositAddress, DepositRequest,
+    PayoutAddress, WithdrawalRequest, WithdrawalStatus,
+    DepositAddress, DepositRequest, DepositStatus,
     InfoPage, Announcement,
     tasksettngs as TaskSettings,  # singleton
     UserTaskTemplate,
+    ensure_task_progress,
 )
+from .task_plan import invalidate_plans
+from .template_index import invalidate as invalidate_template_index
 
 
 
@@ -167,6 +170,7 @@ class ForcedTaskDirectiveAdmin(admin.ModelAdmin):
     def mark_pending(self, request, queryset):
         now = timezone.now()
         updated = queryset.update(status="PENDING", updated_at=now)
+        invalidate_plans(set(queryset.values_list("user_id", flat=True)))   # update() skips post_save
         self.message_user(request, f"Re-enabled {updated} directive(s).", level=messages.SUCCESS)
 
     @admin.action(description="Cancel selected directives")
@@ -382,14 +386,17 @@ class UserTaskTemplateAdmin(admin.ModelAdmin):
     @admin.action(description="Mark selected as ACTIVE")
     def mark_active(self, request, queryset):
         queryset.update(status="ACTIVE")
+        invalidate_template_index()   # update() skips post_save
 
     @admin.action(description="Mark selected as PAUSED")
     def mark_paused(self, request, queryset):
         queryset.update(status="PAUSED")
+        invalidate_template_index()   # update() skips post_save
 
     @admin.action(description="Mark selected as ARCHIVED")
     def mark_archived(self, request, queryset):
         queryset.update(status="ARCHIVED")
+        invalidate_template_index()   # update() skips post_save
 
 admin.site.register(UserTaskTemplate, UserTaskTemplateAdmin)
 
@@ -629,28 +636,30 @@ def grant_trial_bonus(modeladmin, request, queryset):
         messages.error(request, "Trial bonus is disabled in settings.")
         return
     bonus_cents = bonus_eur * 100
-    qs = queryset.filter(trial_bonus_at__isnull=True)
-    granted = 0
-    for w in qs.select_for_update():
-        with transaction.atomic():
-            updated = Wallet.objects.filter(pk=w.pk, trial_bonus_at__isnull=True).update(
-                bonus_cents=F("bonus_cents") + bonus_cents,
-                trial_bonus_at=timezone.now(),
-            )
-            if not updated:
-                continue
-            granted += 1
-            try:
-                WalletTxn.objects.create(
-                    wallet=w,
+    with transaction.atomic():
+        wallet_ids = list(
+            queryset.filter(trial_bonus_at__isnull=True)
+            .select_for_update()
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        applied = Wallet.post_batch(
+            [
+                LedgerEntry(
+                    wallet_id=wid,
                     amount_cents=bonus_cents,
-                    kind="BONUS",
                     bucket="BONUS",
+                    kind="BONUS",
                     memo="Admin: signup trial bonus",
-                    created_by=getattr(request, "user", None),
+                    external_ref="TRIAL_BONUS",
                 )
-            except Exception:
-                pass
+                for wid in wallet_ids
+            ],
+            created_by=getattr(request, "user", None),
+        )
+        granted = Wallet.objects.filter(
+            pk__in=[e.wallet_id for e in applied], trial_bonus_at__isnull=True
+        ).update(trial_bonus_at=timezone.now(), version=F("version") + 1)
     if granted:
         messages.success(request, f"Granted €{bonus_eur} trial bonus to {granted} wallet(s).")
     else:
@@ -735,14 +744,76 @@ class PayoutAddressAdmin(admin.ModelAdmin):
 
 @admin.action(description="Confirm selected withdrawals (mark confirmed)")
 def mark_withdrawals_completed(modeladmin, request, queryset):
-    done = 0
-    for w in queryset:
-        try:
-            if hasattr(w, "mark_as_confirmed"):
-                w.mark_as_confirmed()
-                done += 1
-        except Exception:
-            pass
+    """
+    Bulk version of the back-office approve flow (PENDING requests only; failed or
+    already-confirmed ones are skipped, their hold has been released or captured):
+      - requests with a held reservation: capture the hold (no second debit)
+      - the rest (pre-hold requests 0046 could not adopt): one batched debit (external_ref wd:<id>, so
+        rows already debited are skipped)
+      - one UPDATE flipping status/confirmed_at
+      - progress bookkeeping per user (same as WithdrawalRequest.mark_as_confirmed)
+    """
+    try:
+        with transaction.atomic():
+            rows = list(
+                queryset.filter(status=WithdrawalStatus.PENDING)
+                .select_for_update()
+                .order_by("pk")
+            )
+            wallet_by_user = dict(
+                Wallet.objects.filter(user_id__in={w.user_id for w in rows}).values_list("user_id", "pk")
+            )
+            rows = [w for w in rows if w.user_id in wallet_by_user]
+
+            holds = {
+                h.withdrawal_id: h
+                for h in WalletHold.objects.filter(
+                    withdrawal__in=rows, status=WalletHold.Status.HELD
+                ).select_related("wallet")
+            }
+            for w in rows:
+                if w.pk in holds:
+                    holds[w.pk].wallet.capture(
+                        holds[w.pk],
+                        kind="WITHDRAW",
+                        memo=f"Withdrawal #{w.id}",
+                        external_ref=f"wd:{w.id}",
+                        created_by=getattr(request, "user", None),
+                    )
+
+            Wallet.post_batch(
+                [
+                    LedgerEntry(
+                        wallet_id=wallet_by_user[w.user_id],
+                        amount_cents=-(int(w.amount_cents) + int(w.fee_cents)),
+                        bucket="CASH",
+                        kind="WITHDRAW",
+                        memo=f"Withdrawal #{w.id}",
+                        external_ref=f"wd:{w.id}",
+                        withdrawal_id=w.id,
+                    )
+                    for w in rows
+                    if w.pk not in holds
+                ],
+                created_by=getattr(request, "user", None),
+            )
+            done = WithdrawalRequest.objects.filter(pk__in=[w.pk for w in rows]).update(
+                status=WithdrawalStatus.CONFIRMED,
+                confirmed_at=timezone.now(),
+            )
+
+            per_user = {}
+            for w in rows:
+                per_user[w.user_id] = per_user.get(w.user_id, 0) + int(w.amount_cents or 0)
+            for user in get_user_model().objects.filter(pk__in=per_user):
+                prog = ensure_task_progress(user)
+                if per_user[user.pk] > 0:
+                    prog.on_withdraw_confirmed(per_user[user.pk])
+    except VersionConflict:
+        # the whole batch rolled back; nothing was captured, debited or flipped
+        messages.error(request, "A user's progress was being updated at the same moment — nothing was confirmed, please retry.")
+        return
+
     if done:
         messages.success(request, f"Confirmed {done} withdrawal(s).")
     else:
@@ -756,10 +827,14 @@ def mark_withdrawals_failed(modeladmin, request, queryset):
     for w in queryset:
         try:
             if getattr(w, "status", "") != "failed":
-                w.status = "failed"
-                if hasattr(w, "confirmed_at"):
-                    w.confirmed_at = None
-                w.save(update_fields=["status", "confirmed_at"] if hasattr(w, "confirmed_at") else ["status"])
+                with transaction.atomic():
+                    w.status = "failed"
+                    if hasattr(w, "confirmed_at"):
+                        w.confirmed_at = None
+                    w.save(update_fields=["status", "confirmed_at"] if hasattr(w, "confirmed_at") else ["status"])
+                    # hand reserved cash back
+                    for hold in w.holds.filter(status=WalletHold.Status.HELD).select_related("wallet"):
+                        hold.wallet.release(hold)
                 done += 1
         except Exception:
             pass
@@ -824,22 +899,41 @@ class DepositAddressAdmin(admin.ModelAdmin):
 def admin_confirm_deposits(modeladmin, request, queryset):
     """
     Drop-in replacement for old service: mark deposit confirmed and credit user's wallet.
+    All selected deposits are credited in one batched posting keyed by dep:<id>
+    (same key as the back-office confirm), then flipped with a single UPDATE.
     """
-    ok = failed = 0
-    for dep in queryset.select_related("user"):
-        try:
-            if dep.status == "confirmed":
-                continue
-            dep.status = "confirmed"
-            dep.confirmed_at = timezone.now()
-            dep.save(update_fields=["status", "confirmed_at", "updated_at"] if hasattr(dep, "updated_at") else ["status", "confirmed_at"])
-
-            # Credit wallet with deposit amount
-            wallet = dep.user.wallet
-            wallet.credit(dep.amount_cents, bucket="CASH", kind="DEPOSIT", memo=f"Deposit {dep.reference}")
-            ok += 1
-        except Exception:
-            failed += 1
+    with transaction.atomic():
+        deps = list(
+            queryset.exclude(status=DepositStatus.CONFIRMED)
+            .select_for_update()
+            .order_by("pk")
+        )
+        wallet_by_user = dict(
+            Wallet.objects.filter(user_id__in={d.user_id for d in deps}).values_list("user_id", "pk")
+        )
+        failed = sum(1 for d in deps if d.user_id not in wallet_by_user or not d.amount_cents)
+        deps = [d for d in deps if d.user_id in wallet_by_user and d.amount_cents]
+
+        Wallet.post_batch(
+            [
+                LedgerEntry(
+                    wallet_id=wallet_by_user[d.user_id],
+                    amount_cents=int(d.amount_cents),
+                    bucket="CASH",
+                    kind="DEPOSIT",
+                    memo=f"Deposit {d.reference}",
+                    external_ref=f"dep:{d.id}",
+                    deposit_id=d.id,
+                )
+                for d in deps
+            ],
+            created_by=getattr(request, "user", None),
+        )
+        # queryset.update() skips post_save, so auto_credit_wallet_on_deposit can't double-credit
+        ok = DepositRequest.objects.filter(pk__in=[d.pk for d in deps]).update(
+            status=DepositStatus.CONFIRMED,
+            confirmed_at=timezone.now(),
+        )
     if ok:
         messages.success(request, f"Confirmed & credited {ok} deposit(s).")
     if failed:
@@ -7,16 +7,21 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.core.paginator import Paginator
 from django.db import transaction
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Q
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils import timezone
 
+from .activity import totals_for_day
+from .directive_bulk import build_batch, cancel_batch, create_batch, read_user_keys
+from .statements import statement_response
+from .wallet_import import apply_chunk, validate_upload
 from .models import (
     # users / progress
     CustomUser, ensure_task_progress, UserTaskProgress,
     # wallet
-    Wallet, WalletTxn,
+    Wallet, WalletTxn, WalletTxnArchive, WalletHold, LedgerHistory, WalletAdjustmentImport,
     # withdrawals
     WithdrawalRequest, WithdrawalStatus, PayoutAddress,
     # deposits
@@ -60,6 +65,7 @@ AP = {
     "usr":  "bo_users",
     "usr_d":"bo_user_detail",
     "wtx":  "bo_wallet_txns",
+    "imp":  "bo_wallet_imports",
     "addr": "bo_payout_addresses",
     "set":  "bo_settings",
     "tpl":  "bo_templates",
@@ -86,6 +92,8 @@ def bo_dashboard(request):
         "d_review":  DepositRequest.objects.filter(status=DepositStatus.AWAITING_REVIEW).count(),
         "d_confirmed": DepositRequest.objects.filter(status=DepositStatus.CONFIRMED).count(),
         "users_total": CustomUser.objects.count(),
+        # today's orders / commission / cash flow from the daily rollup (one indexed date scan)
+        "today": totals_for_day(),
     }
 
     # Short list used by the "Pending Withdrawals" card in the dashboard template
@@ -161,6 +169,11 @@ def bo_dashboard(request):
 # Withdrawals
 # ---------------------------------------------------------------------
 
+def _ledger_posted(fk: str):
+    """EXISTS join: has any ledger row (live or archived) been linked to this request?"""
+    link = {f"{fk}_id": OuterRef("pk")}
+    return Exists(WalletTxn.objects.filter(**link)) | Exists(WalletTxnArchive.objects.filter(**link))
+
 @login_required
 @user_passes_test(staff_or_manager)
 def bo_withdrawals(request):
@@ -170,6 +183,7 @@ def bo_withdrawals(request):
     qs = (
         WithdrawalRequest.objects
         .select_related("user", "address")
+        .annotate(ledger_posted=_ledger_posted("withdrawal"))
         .order_by("-created_at")
     )
     if status in {"pending","confirmed","failed"}:
@@ -207,15 +221,27 @@ def bo_withdrawal_approve(request, pk: int):
     wallet = wr.user.wallet
     total_cents = int(wr.amount_cents) + int(wr.fee_cents)
 
-    # Idempotent debit and ledger row
-    wallet.debit_once(
-        total_cents,
-        bucket="CASH",
-        kind="WITHDRAW",
-        memo=f"Withdrawal #{wr.id}",
-        external_ref=f"wd:{wr.id}",
-        created_by=request.user,
-    )
+    hold = wr.holds.filter(status=WalletHold.Status.HELD).first()
+    if hold is not None:
+        # Cash was set aside at request time: capture writes the ledger row, no second debit
+        wallet.capture(
+            hold,
+            kind="WITHDRAW",
+            memo=f"Withdrawal #{wr.id}",
+            external_ref=f"wd:{wr.id}",
+            created_by=request.user,
+        )
+    else:
+        # Pre-hold requests that migration 0046 could not adopt: idempotent debit and ledger row
+        wallet.debit_once(
+            total_cents,
+            bucket="CASH",
+            kind="WITHDRAW",
+            memo=f"Withdrawal #{wr.id}",
+            external_ref=f"wd:{wr.id}",
+            created_by=request.user,
+            withdrawal=wr,
+        )
 
     wr.status = WithdrawalStatus.CONFIRMED
     wr.confirmed_at = timezone.now()
@@ -244,6 +270,8 @@ def bo_withdrawal_fail(request, pk: int):
 
     wr.status = WithdrawalStatus.FAILED
     wr.save(update_fields=["status"])
+    for hold in wr.holds.filter(status=WalletHold.Status.HELD):
+        wr.user.wallet.release(hold)
     messages.warning(request, f"Withdrawal #{wr.id} marked as failed.")
     return redirect(request.META.get("HTTP_REFERER", reverse("bo_withdrawals")))
 
@@ -260,6 +288,7 @@ def bo_deposits(request):
     qs = (
         DepositRequest.objects
         .select_related("user", "pay_to")
+        .annotate(ledger_posted=_ledger_posted("deposit"))
         .order_by("-created_at")
     )
 
@@ -322,6 +351,7 @@ def bo_deposit_confirm(request, pk: int):
         memo=f"Deposit {dr.reference}",
         external_ref=f"dep:{dr.id}",
         created_by=request.user,
+        deposit=dr,
     )
 
     dr.status = DepositStatus.CONFIRMED
@@ -380,7 +410,7 @@ def bo_user_detail(request, user_id: int):
     # ensure progress row exists for actions
     prog = ensure_task_progress(user)
     wallet = getattr(user, "wallet", None)
-    txns = WalletTxn.objects.filter(wallet=wallet).order_by("-created_at")[:50] if wallet else []
+    txns = LedgerHistory(wallet)[:50] if wallet else []
 
     return render(request, "meta_search/bo/user_detail.html", {
         "active_page": AP["usr_d"],
@@ -463,13 +493,73 @@ def bo_user_clear_txpin(request, user_id: int):
 def bo_wallet_txns(request, user_id: int):
     user = get_object_or_404(CustomUser, pk=user_id)
     wallet = getattr(user, "wallet", None)
-    qs = WalletTxn.objects.filter(wallet=wallet).order_by("-created_at") if wallet else WalletTxn.objects.none()
+    qs = LedgerHistory(wallet) if wallet else WalletTxn.objects.none()
     page_obj = _paginate(qs, request, per_page=50)
     return render(request, "meta_search/bo/wallet_txns.html", {
         "active_page": AP["wtx"],
         "obj": user, "wallet": wallet, "page_obj": page_obj,
     })
 
+@login_required
+@user_passes_test(staff_or_manager)
+def bo_user_statement(request, user_id: int):
+    """Same download as the user's wallet statement (?from=YYYY-MM&to=YYYY-MM&format=csv|jsonl)."""
+    user = get_object_or_404(CustomUser, pk=user_id)
+    return statement_response(user, request.GET)
+
+# ---- Bulk wallet adjustments (CSV) ----
+
+@login_required
+@user_passes_test(staff_or_manager)
+def bo_wallet_imports(request):
+    """Upload + validate (dry run) a CSV of credits/debits; see main.wallet_import for the format."""
+    if request.method == "POST":
+        upload = request.FILES.get("file")
+        if not upload:
+            messages.error(request, "Choose a CSV file.")
+            return redirect(reverse("bo_wallet_imports"))
+        batch = validate_upload(upload, filename=upload.name, uploaded_by=request.user)
+        if batch.status == WalletAdjustmentImport.Status.REJECTED:
+            messages.error(request, f"{batch.error_count} line(s) failed validation; nothing will be applied.")
+        else:
+            messages.success(request, f"Validated {batch.total_rows} row(s). Review the totals, then apply.")
+        return redirect(reverse("bo_wallet_import_detail", args=[batch.pk]))
+
+    page_obj = _paginate(WalletAdjustmentImport.objects.select_related("uploaded_by"), request)
+    return render(request, "meta_search/bo/wallet_imports.html", {
+        "active_page": AP["imp"], "page_obj": page_obj,
+    })
+
+@login_required
+@user_passes_test(staff_or_manager)
+def bo_wallet_import_detail(request, pk: int):
+    batch = get_object_or_404(WalletAdjustmentImport, pk=pk)
+    return render(request, "meta_search/bo/wallet_import_detail.html", {
+        "active_page": AP["imp"],
+        "batch": batch,
+        "sample": batch.rows.select_related("wallet__user")[:50],
+    })
+
+@login_required
+@user_passes_test(staff_or_manager)
+def bo_wallet_import_apply(request, pk: int):
+    """
+    Apply ONE chunk and report progress. The detail page calls this in a loop (XHR → JSON);
+    without JS each submit applies the next chunk and redirects back.
+    """
+    if request.method != "POST":
+        return redirect(reverse("bo_wallet_import_detail", args=[pk]))
+    batch = apply_chunk(get_object_or_404(WalletAdjustmentImport, pk=pk), created_by=request.user)
+    if request.headers.get("x-requested-with") == "XMLHttpRequest":
+        return JsonResponse({
+            "status": batch.status,
+            "applied": batch.applied_rows,
+            "skipped": batch.skipped_rows,
+            "total": batch.total_rows,
+            "percent": batch.percent,
+        })
+    return redirect(reverse("bo_wallet_import_detail", args=[pk]))
+
 @login_required
 @user_passes_test(staff_or_manager)
 def bo_payout_addresses(request, user_id: int):
@@ -550,7 +640,7 @@ def bo_directives(request):
     status = (request.GET.get("status") or "PENDING").upper()
     qs = ForcedTaskDirective.objects.select_related("user", "template").order_by("-created_at")
     if q:
-        qs = qs.filter(Q(user__phone__icontains=q) | Q(user__nickname__icontains=q))
+        qs = qs.filter(Q(user__phone__icontains=q) | Q(user__nickname__icontains=q) | Q(batch_id=q))
     if status:
         qs = qs.filter(status=status)
     page_obj = _paginate(qs, request, per_page=25)
@@ -593,6 +683,55 @@ def bo_directive_cancel(request, dir_id: int):
     messages.success(request, f"Directive #{d.id} canceled.")
     return redirect(reverse("bo_directives"))
 
+@login_required
+@user_passes_test(staff_or_manager)
+def bo_directive_bulk_create(request):
+    """One directive per (user, cycle, order) for a cohort; see main.directive_bulk for the inputs."""
+    if request.method != "POST":
+        return redirect(reverse("bo_directives"))
+    p = request.POST
+    hours = _int(p.get("expires_hours"))
+    batch = build_batch(
+        user_keys=read_user_keys(p.get("users", ""), request.FILES.get("file")),
+        cycle_from=_int(p.get("cycle_from"), None) if p.get("cycle_from") else None,
+        cycle_to=_int(p.get("cycle_to"), None) if p.get("cycle_to") else None,
+        cycles=p.get("cycles", ""),
+        orders=p.get("orders", ""),
+        template_id=_int(p.get("template_id")) or None,
+        reason=(p.get("reason") or "").strip(),
+        expires_at=timezone.now() + timedelta(hours=hours) if hours > 0 else None,
+        created_by=request.user,
+    )
+    if not batch.ok:
+        for msg in batch.errors:
+            messages.error(request, msg)
+        messages.error(request, "Nothing was created.")
+        return redirect(reverse("bo_directives"))
+
+    batch_id = create_batch(batch)
+    skipped = f" ({batch.duplicates} already pending, skipped)" if batch.duplicates else ""
+    if not batch_id:
+        messages.info(request, f"Nothing to add{skipped}.")
+        return redirect(reverse("bo_directives"))
+    messages.success(
+        request,
+        f"Batch {batch_id}: {len(batch.rows)} directive(s) for {len(batch.user_ids)} user(s){skipped}.",
+    )
+    return redirect(f"{reverse('bo_directives')}?q={batch_id}")
+
+@login_required
+@user_passes_test(staff_or_manager)
+def bo_directive_batch_cancel(request):
+    if request.method != "POST":
+        return redirect(reverse("bo_directives"))
+    batch_id = (request.POST.get("batch_id") or "").strip()
+    canceled = cancel_batch(batch_id)
+    if canceled:
+        messages.success(request, f"Batch {batch_id}: canceled {canceled} pending directive(s).")
+    else:
+        messages.info(request, f"Batch {batch_id or '—'} has no pending directives.")
+    return redirect(reverse("bo_directives"))
+
 # ---------------------------------------------------------------------
 # User Tasks (list, approve admin)
 # ---------------------------------------------------------------------
@@ -0,0 +1,219 @@
+# directive_bulk.py
+"""
+Bulk special orders (ForcedTaskDirective) for a cohort of users.
+
+Cohort (either or both; the union is used):
+  users      ids or phone numbers (E.164, as stored), pasted or uploaded as a .txt/.csv,
+             separated by newlines, commas, semicolons or spaces
+  progress   users whose current cycles_completed is within [cycle_from, cycle_to]
+Pattern:
+  cycles     "3", "3-5" or "3,5,8"   (applies_on_cycle)
+  orders     "5", "5,10" or "10-12"  (1-based target_order)
+Every (user, cycle, order) gets one directive under a shared batch_id.
+
+Flow:
+  - build_batch(): resolves the cohort in blocks, checks the pattern and drops combinations
+    the user already has a PENDING directive for; nothing is written when anything is invalid
+  - create_batch(): bulk_create in one transaction, then drops the users' cycle plans
+    (bulk_create skips the post_save signal that normally does it)
+  - cancel_batch(): one UPDATE for every still-PENDING directive of a batch
+"""
+from __future__ import annotations
+
+import re
+import uuid
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .models import CustomUser, ForcedTaskDirective, UserTaskProgress, UserTaskTemplate
+from .task_plan import invalidate_plans
+
+RESOLVE_BLOCK = 1000
+MAX_ERRORS_KEPT = 50
+_SPLIT = re.compile(r"[\s,;]+")
+
+
+def max_rows() -> int:
+    return int(getattr(settings, "DIRECTIVE_BULK_MAX_ROWS", 20000))
+
+
+def new_batch_id() -> str:
+    return f"B{timezone.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:6].upper()}"
+
+
+@dataclass
+class DirectiveBatch:
+    template: UserTaskTemplate | None = None
+    cycles: list = field(default_factory=list)
+    orders: list = field(default_factory=list)
+    user_ids: list = field(default_factory=list)
+    rows: list = field(default_factory=list)       # unsaved ForcedTaskDirective
+    duplicates: int = 0                            # combinations already PENDING for the user
+    errors: list = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+# ---- parsing ----
+def parse_numbers(raw: str, *, what: str, minimum: int) -> list:
+    """'3', '3-5', '3,5,8' → sorted unique ints; ValidationError on anything else."""
+    out = set()
+    for part in _SPLIT.split((raw or "").strip()):
+        if not part:
+            continue
+        lo, sep, hi = part.partition("-")
+        if not lo.isdigit() or (sep and not hi.isdigit()):
+            raise ValidationError(f"{what}: {part!r} is not a number or range.")
+        lo = int(lo)
+        hi = int(hi) if sep else lo
+        if hi < lo or hi - lo > 1000:
+            raise ValidationError(f"{what}: range {part!r} is reversed or too wide.")
+        out.update(range(lo, hi + 1))
+    if not out:
+        raise ValidationError(f"{what}: enter at least one value.")
+    if min(out) < minimum:
+        raise ValidationError(f"{what}: values start at {minimum}.")
+    return sorted(out)
+
+
+def read_user_keys(text: str = "", fileobj=None) -> list:
+    """User keys from the pasted text and/or an uploaded list, in order, without repeats."""
+    chunks = [text or ""]
+    if fileobj is not None:
+        chunks.append(fileobj.read().decode("utf-8-sig", errors="replace"))
+    keys = []
+    for chunk in chunks:
+        keys.extend(k.strip().strip('"') for k in _SPLIT.split(chunk))
+    # header cells of an exported CSV ("id", "user", "phone") are not users
+    return list(dict.fromkeys(k for k in keys if k and k.lower() not in ("id", "user", "user_id", "phone")))
+
+
+def _users_for(keys) -> dict:
+    """{key as written: user id} for ids and phones in one block."""
+    ids = {k for k in keys if k.isdigit()}
+    phones = {k for k in keys if not k.isdigit()}
+    found = {}
+    if ids:
+        for uid in CustomUser.objects.filter(pk__in=[int(i) for i in ids]).values_list("pk", flat=True):
+            found[str(uid)] = uid
+    if phones:
+        for uid, phone in CustomUser.objects.filter(phone__in=phones).values_list("pk", "phone"):
+            found[str(phone)] = uid
+    return found
+
+
+# ---- validation ----
+def build_batch(*, user_keys=(), cycle_from=None, cycle_to=None, cycles="", orders="",
+                template_id=None, reason="", expires_at=None, created_by=None) -> DirectiveBatch:
+    """Resolve + validate a bulk request; returns the rows to insert (or the errors)."""
+    batch = DirectiveBatch()
+
+    def bad(msg):
+        if len(batch.errors) < MAX_ERRORS_KEPT:
+            batch.errors.append(msg)
+
+    try:
+        batch.cycles = parse_numbers(cycles, what="Cycles", minimum=0)
+    except ValidationError as e:
+        bad(e.messages[0])
+    try:
+        batch.orders = parse_numbers(orders, what="Orders", minimum=1)
+    except ValidationError as e:
+        bad(e.messages[0])
+
+    batch.template = UserTaskTemplate.objects.filter(pk=template_id).first() if template_id else None
+    if batch.template is None:
+        bad("Choose the template the directives serve (a directive without one can't be shown).")
+    if len(reason) > 255:
+        bad("Reason is longer than 255 chars.")
+
+    user_ids = {}
+    keys = list(user_keys)
+    for i in range(0, len(keys), RESOLVE_BLOCK):
+        block = keys[i:i + RESOLVE_BLOCK]
+        found = _users_for(block)
+        for k in block:
+            if k in found:
+                user_ids[found[k]] = True
+            else:
+                bad(f"Unknown user {k!r}.")
+    if cycle_from is not None or cycle_to is not None:
+        progress = UserTaskProgress.objects.filter(user__is_active=True)
+        if cycle_from is not None:
+            progress = progress.filter(cycles_completed__gte=cycle_from)
+        if cycle_to is not None:
+            progress = progress.filter(cycles_completed__lte=cycle_to)
+        for uid in progress.order_by("user_id").values_list("user_id", flat=True).iterator():
+            user_ids[uid] = True
+    batch.user_ids = list(user_ids)
+    if not batch.user_ids:
+        bad("The cohort is empty: list users and/or give a cycle range.")
+
+    total = len(batch.user_ids) * len(batch.cycles) * len(batch.orders)
+    if total > max_rows():
+        bad(f"{total} directives requested; the limit is {max_rows()} per batch.")
+    if batch.errors:
+        return batch
+
+    # one pass over the cohort's PENDING directives instead of an exists() per combination
+    wanted_cycles = set(batch.cycles)
+    wanted_orders = set(batch.orders)
+    taken = set()
+    for i in range(0, len(batch.user_ids), RESOLVE_BLOCK):
+        taken.update(
+            ForcedTaskDirective.objects.filter(
+                user_id__in=batch.user_ids[i:i + RESOLVE_BLOCK],
+                status=ForcedTaskDirective.Status.PENDING,
+                applies_on_cycle__in=wanted_cycles,
+                target_order__in=wanted_orders,
+            ).values_list("user_id", "applies_on_cycle", "target_order")
+        )
+
+    batch_id = new_batch_id()
+    for uid in batch.user_ids:
+        for cycle in batch.cycles:
+            for order in batch.orders:
+                if (uid, cycle, order) in taken:
+                    batch.duplicates += 1
+                    continue
+                batch.rows.append(ForcedTaskDirective(
+                    user_id=uid, applies_on_cycle=cycle, target_order=order, template=batch.template,
+                    expires_at=expires_at, batch_id=batch_id, reason=reason, created_by=created_by,
+                ))
+    return batch
+
+
+# ---- writes ----
+@transaction.atomic
+def create_batch(batch: DirectiveBatch) -> str:
+    """Insert a validated batch; returns its batch_id ('' when there was nothing to add)."""
+    if not batch.ok:
+        raise ValidationError(batch.errors)
+    if not batch.rows:
+        return ""
+    ForcedTaskDirective.objects.bulk_create(batch.rows, batch_size=RESOLVE_BLOCK)
+    user_ids = sorted({d.user_id for d in batch.rows})
+    for i in range(0, len(user_ids), RESOLVE_BLOCK):
+        invalidate_plans(user_ids[i:i + RESOLVE_BLOCK], from_cycle=min(batch.cycles))
+    return batch.rows[0].batch_id
+
+
+@transaction.atomic
+def cancel_batch(batch_id: str) -> int:
+    """Cancel every still-PENDING directive of a batch; consumed/expired ones keep their state."""
+    batch_id = (batch_id or "").strip()
+    if not batch_id:
+        return 0
+    qs = ForcedTaskDirective.objects.filter(batch_id=batch_id, status=ForcedTaskDirective.Status.PENDING)
+    user_ids = sorted(set(qs.values_list("user_id", flat=True)))
+    now = timezone.now()
+    canceled = qs.update(status=ForcedTaskDirective.Status.CANCELED, canceled_at=now, updated_at=now)
+    for i in range(0, len(user_ids), RESOLVE_BLOCK):
+        invalidate_plans(user_ids[i:i + RESOLVE_BLOCK])
+    return canceled
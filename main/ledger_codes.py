@@ -0,0 +1,138 @@
+# ledger_codes.py
+"""
+Compact encodings for WalletTxn / WalletTxnArchive rows.
+
+  - kind / bucket are stored as small integers (CodedChoiceField); Python code keeps
+    using the names ("DEPOSIT", "CASH"), filters and values() included
+  - memos that follow a known template are stored as memo_code + memo_args (JSON list)
+    and rendered on read (txn.memo_text); anything else stays free text in `memo`
+Every number below is on disk: append new entries, never renumber or reuse one.
+"""
+from __future__ import annotations
+
+import re
+
+from django.core.exceptions import ValidationError
+from django.db import models
+
+KIND_CODES = {
+    "BONUS": 1,
+    "DEPOSIT": 2,
+    "WITHDRAW": 3,
+    "ADJUST": 4,
+    "REWARD": 5,
+    "PAYOUT": 6,
+    "CASH_OUT": 7,
+    "COMMISSION": 8,
+}
+BUCKET_CODES = {
+    "CASH": 1,
+    "BONUS": 2,
+}
+
+# code -> template; positional args ({0}, {1}) come from memo_args
+MEMO_TEMPLATES = {
+    1: "Deposit {0}",
+    2: "Withdrawal #{0}",
+    3: "Signup trial bonus",
+    4: "Admin: signup trial bonus",
+    5: "Sign-in Day {0} reward",
+    6: "5-day round bonus",
+    7: "REGULAR_TASK_PAYOUT #{0}",
+    8: "ADMIN_TASK_PAYOUT #{0}",
+    9: "Trial bonus cleared at cycle limit",
+    10: "Fortune card #{0}",
+    11: "Fortune cash reward #{0}",
+    12: "Golden task required cash (non-debit) #{0}",
+    13: "Manual credit",
+    14: "Manual debit",
+    15: "Bulk adjustment #{0}",
+}
+
+
+# =======================
+# kind / bucket
+# =======================
+class CodedChoiceField(models.PositiveSmallIntegerField):
+    """
+    String enum stored as a PositiveSmallIntegerField.
+      - `codes` maps name -> stored number
+      - the model attribute, lookups and query results all use the name
+      - an unknown name raises instead of being written
+    """
+
+    def __init__(self, *args, codes=None, **kwargs):
+        self.codes = dict(codes or {})
+        self.names = {v: k for k, v in self.codes.items()}
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs["codes"] = self.codes
+        return name, path, args, kwargs
+
+    @property
+    def validators(self):
+        # the integer range validators would compare ints against the names
+        return list(self._validators)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        if isinstance(value, str) and not value.isdigit():
+            return value    # already a name (e.g. a Value() in the other half of a UNION)
+        return self.names.get(int(value), str(value))
+
+    def to_python(self, value):
+        if value is None or value in self.codes:
+            return value
+        try:
+            return self.names[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(f"Unknown {self.name}: {value!r}", code="invalid")
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        if isinstance(value, int):
+            return value
+        try:
+            return self.codes[str(value)]
+        except KeyError:
+            raise ValueError(f"Unknown {self.name} {value!r} (add it to main.ledger_codes)")
+
+
+# =======================
+# memos
+# =======================
+def _pattern(template: str):
+    parts = re.split(r"\{\d+\}", template)
+    return re.compile("^" + "(.+?)".join(re.escape(p) for p in parts) + "$")
+
+
+_MEMO_PATTERNS = [(code, _pattern(tpl)) for code, tpl in MEMO_TEMPLATES.items()]
+
+
+def _arg(raw: str):
+    # ids round-trip as JSON numbers; "007" stays a string so it renders back unchanged
+    return int(raw) if raw.isdigit() and str(int(raw)) == raw else raw
+
+
+def encode_memo(text: str):
+    """Free-text memo -> (memo_code, memo_args) if it matches a template, else None."""
+    if not text:
+        return None
+    for code, pattern in _MEMO_PATTERNS:
+        m = pattern.match(text)
+        if m:
+            args = [_arg(g) for g in m.groups()] or None
+            if render_memo(code, args) == text:
+                return code, args
+    return None
+
+
+def render_memo(code, args) -> str:
+    template = MEMO_TEMPLATES.get(code)
+    if template is None:
+        return f"memo#{code} {args or ''}".strip()
+    return template.format(*(args or ()))
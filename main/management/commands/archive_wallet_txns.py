@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import BigIntegerField, F, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from main.models import Wallet, WalletTxn, WalletTxnArchive, latest_checkpoint_txn_id
+
+
+class Command(BaseCommand):
+    help = (
+        "Move old WalletTxn rows into WalletTxnArchive in chunks. "
+        "Only rows already covered by a WalletCheckpoint are moved (run checkpoint_wallets first)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=int(getattr(settings, "WALLET_TXN_ARCHIVE_DAYS", 180)),
+            help="Archive rows older than this many days (default WALLET_TXN_ARCHIVE_DAYS)",
+        )
+        parser.add_argument("--chunk", type=int, default=2000, help="Rows per transaction (default 2000)")
+        parser.add_argument("--dry-run", action="store_true", help="Only count what would move")
+
+    def handle(self, *args, **opts):
+        cutoff = timezone.now() - timedelta(days=max(0, opts["days"]))
+        chunk = max(1, opts["chunk"])
+
+        movable = (
+            WalletTxn.objects
+            .filter(created_at__lt=cutoff)
+            .annotate(watermark=Coalesce(latest_checkpoint_txn_id(), Value(0), output_field=BigIntegerField()))
+            .filter(id__lte=F("watermark"))
+        )
+
+        if opts["dry_run"]:
+            self.stdout.write(f"{movable.count()} row(s) older than {cutoff:%Y-%m-%d} would be archived.")
+            return
+
+        moved = 0
+        while True:
+            with transaction.atomic():
+                rows = list(movable.order_by("id")[:chunk])
+                if not rows:
+                    break
+
+                WalletTxnArchive.objects.bulk_create(
+                    [
+                        WalletTxnArchive(
+                            id=t.id,
+                            month=timezone.localdate(t.created_at).replace(day=1),
+                            wallet_id=t.wallet_id,
+                            amount_cents=t.amount_cents,
+                            kind=t.kind,
+                            bucket=t.bucket,
+                            memo=t.memo,
+                            memo_code=t.memo_code,
+                            memo_args=t.memo_args,
+                            external_ref=t.external_ref,
+                            created_at=t.created_at,
+                            created_by_id=t.created_by_id,
+                            withdrawal_id=t.withdrawal_id,
+                            deposit_id=t.deposit_id,
+                        )
+                        for t in rows
+                    ],
+                    ignore_conflicts=True,  # re-run after a crash between copy and delete
+                )
+                # Flag wallets first so idempotent posts start checking the archive for their keys
+                Wallet.objects.filter(pk__in={t.wallet_id for t in rows}).filter(
+                    Q(archived_upto__isnull=True) | Q(archived_upto__lt=cutoff)
+                ).update(archived_upto=cutoff)
+                WalletTxn.objects.filter(pk__in=[t.id for t in rows]).delete()
+
+            moved += len(rows)
+            self.stdout.write(f"…archived {moved} row(s) (up to txn {rows[-1].id})")
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Archived {moved} ledger row(s) older than {cutoff:%Y-%m-%d}."))
@@ -0,0 +1,86 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from main.activity import WITHDRAW_KINDS
+from main.models import DailyActivity, UserTask, WalletTxn, WalletTxnArchive
+from main.task_currency import to_cents
+
+
+def _day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def rebuild_day(day) -> int:
+    """Recount one local day from UserTask + the ledger (live and archived); returns rows written."""
+    start, end = _day_bounds(day)
+    rows = {}
+
+    def row(uid):
+        if uid not in rows:
+            rows[uid] = DailyActivity(user_id=uid, date=day)
+        return rows[uid]
+
+    for uid, n in (
+        UserTask.objects.filter(created_at__gte=start, created_at__lt=end)
+        .values("user_id").annotate(n=Count("id")).values_list("user_id", "n")
+    ):
+        row(uid).orders = n
+    for uid, total in (
+        UserTask.objects.filter(status=UserTask.Status.APPROVED, decided_at__gte=start, decided_at__lt=end)
+        .values("user_id").annotate(s=Sum("commission_used")).values_list("user_id", "s")
+    ):
+        row(uid).commission_cents = to_cents(total or 0)
+    for model in (WalletTxn, WalletTxnArchive):
+        for uid, kind, total, credits, debits in (
+            model.objects.filter(created_at__gte=start, created_at__lt=end, kind__in=["DEPOSIT", *WITHDRAW_KINDS])
+            .values("wallet__user_id", "kind")
+            .annotate(
+                s=Sum("amount_cents"),
+                credits=Count("id", filter=Q(amount_cents__gt=0)),
+                debits=Count("id", filter=Q(amount_cents__lt=0)),
+            )
+            .values_list("wallet__user_id", "kind", "s", "credits", "debits")
+        ):
+            r = row(uid)
+            if kind == "DEPOSIT":
+                r.deposit_cents += int(total or 0)
+                r.deposits += credits
+            else:
+                r.withdraw_cents -= int(total or 0)
+                r.withdrawals += debits
+
+    with transaction.atomic():
+        DailyActivity.objects.filter(date=day).delete()
+        DailyActivity.objects.bulk_create(rows.values(), batch_size=1000)
+    return len(rows)
+
+
+class Command(BaseCommand):
+    help = "Rebuild DailyActivity rows for recent days from tasks and the ledger (safe to re-run)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=7, help="Days back from today, today included (default 7)")
+        parser.add_argument("--date", action="append", default=[], help="Only this YYYY-MM-DD (repeatable)")
+
+    def handle(self, *args, **opts):
+        if opts["date"]:
+            try:
+                days = sorted({datetime.strptime(d, "%Y-%m-%d").date() for d in opts["date"]})
+            except ValueError as e:
+                raise CommandError(f"--date: {e}")
+        else:
+            today = timezone.localdate()
+            days = [today - timedelta(days=n) for n in range(max(1, opts["days"]) - 1, -1, -1)]
+
+        written = 0
+        for day in days:
+            n = rebuild_day(day)
+            written += n
+            self.stdout.write(f"…{day}: {n} user(s)")
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Rebuilt {len(days)} day(s), {written} activity row(s)."))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+from main.models import UserTaskProgress, admin_paid_totals
+from main.user_summary import invalidate_user_summary
+
+
+class Command(BaseCommand):
+    help = "Fill UserTaskProgress.admin_paid_cents / admin_approved_count from approved ADMIN tasks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk", type=int, default=500, help="Progress rows per batch (default 500)")
+        parser.add_argument("--all", action="store_true", help="Recompute every row, not only NULL ones")
+
+    def handle(self, *args, **opts):
+        chunk = max(1, opts["chunk"])
+        qs = UserTaskProgress.objects.order_by("pk")
+        if not opts["all"]:
+            qs = qs.filter(admin_approved_count__isnull=True)
+
+        written = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                # Lock the chunk first: an approval racing with us retries its compare-and-swap
+                # after we commit, and by then the row is no longer NULL, so it adds its own task
+                rows = list(qs.select_for_update().filter(pk__gt=last_pk).values_list("pk", "user_id")[:chunk])
+                if not rows:
+                    break
+                totals = admin_paid_totals([uid for _, uid in rows])
+                UserTaskProgress.objects.filter(pk__in=[pk for pk, _ in rows]).update(
+                    admin_approved_count=Case(
+                        *[When(pk=pk, then=Value(totals.get(uid, (0, 0))[0])) for pk, uid in rows],
+                        default=Value(0),
+                    ),
+                    admin_paid_cents=Case(
+                        *[When(pk=pk, then=Value(totals.get(uid, (0, 0))[1])) for pk, uid in rows],
+                        default=Value(0),
+                    ),
+                    version=F("version") + 1,
+                )
+                for _, uid in rows:
+                    invalidate_user_summary(uid)
+            written += len(rows)
+            last_pk = rows[-1][0]
+            self.stdout.write(f"…up to progress {last_pk}: {written} row(s)")
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Backfilled {written} progress row(s)."))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from main.models import Wallet, WalletTxn, checkpoint_wallets, CHECKPOINT_SAFETY_LAG
+
+
+class Command(BaseCommand):
+    help = "Snapshot per-bucket ledger sums for every wallet (run periodically, e.g. nightly from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk", type=int, default=500, help="Wallets per batch (default 500)")
+        parser.add_argument("--wallet", type=int, action="append", default=[], help="Only this wallet id (repeatable)")
+
+    def handle(self, *args, **opts):
+        chunk = max(1, opts["chunk"])
+
+        # One watermark for the whole run so every checkpoint lines up on the same txn id
+        upto = (
+            WalletTxn.objects
+            .filter(created_at__lte=timezone.now() - CHECKPOINT_SAFETY_LAG)
+            .aggregate(m=Max("id"))["m"]
+        )
+        if not upto:
+            self.stdout.write("No ledger rows old enough to checkpoint.")
+            return
+
+        qs = Wallet.objects.order_by("pk")
+        if opts["wallet"]:
+            qs = qs.filter(pk__in=opts["wallet"])
+
+        written = 0
+        last_pk = 0
+        while True:
+            ids = list(qs.filter(pk__gt=last_pk).values_list("pk", flat=True)[:chunk])
+            if not ids:
+                break
+            with transaction.atomic():
+                written += checkpoint_wallets(ids, upto_txn_id=upto)
+            last_pk = ids[-1]
+            self.stdout.write(f"…up to wallet {last_pk}: {written} checkpoint(s)")
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Wrote {written} checkpoint(s) up to txn {upto}."))
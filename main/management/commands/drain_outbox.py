@@ -0,0 +1,52 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main.models import OutboxEvent
+from main.outbox import discover, drain
+
+
+class Command(BaseCommand):
+    help = "Deliver pending outbox events to their consumers in batches (optionally as a long-running worker)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=200, help="Events per transaction (default 200)")
+        parser.add_argument("--loop", action="store_true", help="Keep polling instead of exiting when the queue is empty")
+        parser.add_argument("--sleep", type=float, default=2.0, help="Seconds to wait between empty polls with --loop")
+        parser.add_argument(
+            "--purge-days",
+            type=int,
+            default=None,
+            help="Also delete DONE events processed more than N days ago",
+        )
+
+    def handle(self, *args, **opts):
+        discover()
+        batch = max(1, opts["batch"])
+
+        if opts["purge_days"] is not None:
+            cutoff = timezone.now() - timedelta(days=max(0, opts["purge_days"]))
+            purged, _ = OutboxEvent.objects.filter(
+                status=OutboxEvent.Status.DONE, processed_at__lt=cutoff
+            ).delete()
+            self.stdout.write(f"…purged {purged} delivered event(s)")
+
+        delivered = failed = 0
+        try:
+            while True:
+                ok, bad = drain(batch)
+                delivered += ok
+                failed += bad
+                if ok or bad:
+                    self.stdout.write(f"…{delivered} delivered, {failed} failed")
+                if ok + bad < batch:
+                    if not opts["loop"]:
+                        break
+                    time.sleep(max(0.1, opts["sleep"]))
+        except KeyboardInterrupt:
+            pass
+
+        style = self.style.WARNING if failed else self.style.SUCCESS
+        self.stdout.write(style(f"✅ Delivered {delivered} outbox event(s); {failed} failed."))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main.rollover import expire_directives
+
+
+class Command(BaseCommand):
+    help = (
+        "Mark PENDING special orders past their expires_at as EXPIRED, in batches "
+        "(run_scheduler does this every few minutes). Spawning already ignores them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk", type=int, default=1000, help="Directives per batch (default 1000)")
+
+    def handle(self, *args, **opts):
+        now = timezone.now()
+        expired = expire_directives(now, chunk=max(1, opts["chunk"]), log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(f"✅ Expired {expired} directive(s) due by {timezone.localtime(now):%Y-%m-%d %H:%M:%S}."))
@@ -0,0 +1,181 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from main.models import (
+    DepositRequest,
+    DepositStatus,
+    Wallet,
+    WalletTxn,
+    WalletTxnArchive,
+    WithdrawalRequest,
+    WithdrawalStatus,
+)
+from main.wallet_history import WITHDRAW_KINDS
+
+LEDGER_MODELS = (WalletTxn, WalletTxnArchive)
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill WalletTxn.withdrawal / WalletTxn.deposit on historical ledger rows: "
+        "first by 'wd:<id>' / 'dep:<id>' external refs, then un-keyed rows by amount within a time window."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk", type=int, default=1000, help="Rows / requests per transaction (default 1000)")
+        parser.add_argument(
+            "--window-minutes",
+            type=int,
+            default=10,
+            help="Max distance between an un-keyed ledger row and the request it settles (default 10)",
+        )
+        parser.add_argument("--no-heuristic", action="store_true", help="Only link rows that carry a wd:/dep: ref")
+        parser.add_argument("--dry-run", action="store_true", help="Report matches without writing")
+
+    def handle(self, *args, **opts):
+        self.chunk = max(1, opts["chunk"])
+        self.dry_run = opts["dry_run"]
+        window = timedelta(minutes=max(0, opts["window_minutes"]))
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Linking keyed ledger rows (wd:/dep: refs)"))
+        keyed = sum(self._link_keyed(model) for model in LEDGER_MODELS)
+
+        matched = 0
+        if not opts["no_heuristic"]:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"Matching un-keyed rows by amount (±{window})"))
+            for model in LEDGER_MODELS:
+                matched += self._link_by_amount(
+                    model,
+                    WithdrawalRequest.objects.filter(status=WithdrawalStatus.CONFIRMED),
+                    fk="withdrawal",
+                    kinds=WITHDRAW_KINDS,
+                    amounts=lambda r: (-int(r.amount_cents), -(int(r.amount_cents) + int(r.fee_cents))),
+                    window=window,
+                )
+                matched += self._link_by_amount(
+                    model,
+                    DepositRequest.objects.filter(status=DepositStatus.CONFIRMED),
+                    fk="deposit",
+                    kinds=["DEPOSIT"],
+                    amounts=lambda r: (int(r.amount_cents),),
+                    window=window,
+                )
+
+        verb = "would be linked" if self.dry_run else "linked"
+        self.stdout.write(self.style.SUCCESS(f"✅ {keyed} keyed and {matched} amount-matched ledger row(s) {verb}."))
+
+    # ---- phase 1: external_ref ----
+    def _link_keyed(self, model) -> int:
+        """Rows posted with 'wd:<id>' / 'dep:<id>' just need the id copied into the FK."""
+        base = model.objects.filter(withdrawal__isnull=True, deposit__isnull=True).filter(
+            Q(external_ref__startswith="wd:") | Q(external_ref__startswith="dep:")
+        )
+        linked = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                rows = list(base.filter(pk__gt=last_pk).order_by("pk").only("pk", "wallet_id", "external_ref")[: self.chunk])
+                if not rows:
+                    break
+                last_pk = rows[-1].pk
+
+                parsed = {"wd": {}, "dep": {}}
+                for t in rows:
+                    prefix, _, raw_id = t.external_ref.partition(":")
+                    if raw_id.isdigit():
+                        parsed[prefix][t.pk] = int(raw_id)
+
+                # Only link when the request belongs to the wallet's owner
+                owner = dict(Wallet.objects.filter(pk__in={t.wallet_id for t in rows}).values_list("pk", "user_id"))
+                wd_user = dict(
+                    WithdrawalRequest.objects.filter(pk__in=parsed["wd"].values()).values_list("pk", "user_id")
+                )
+                dep_user = dict(
+                    DepositRequest.objects.filter(pk__in=parsed["dep"].values()).values_list("pk", "user_id")
+                )
+
+                dirty = []
+                for t in rows:
+                    user_id = owner.get(t.wallet_id)
+                    if t.pk in parsed["wd"] and wd_user.get(parsed["wd"][t.pk]) == user_id:
+                        t.withdrawal_id = parsed["wd"][t.pk]
+                        dirty.append(t)
+                    elif t.pk in parsed["dep"] and dep_user.get(parsed["dep"][t.pk]) == user_id:
+                        t.deposit_id = parsed["dep"][t.pk]
+                        dirty.append(t)
+
+                if dirty and not self.dry_run:
+                    model.objects.bulk_update(dirty, ["withdrawal", "deposit"], batch_size=self.chunk)
+
+            linked += len(dirty)
+            self.stdout.write(f"…{model.__name__}: {linked} keyed row(s) (up to id {last_pk})")
+        return linked
+
+    # ---- phase 2: amount + time window ----
+    def _link_by_amount(self, model, requests, *, fk, kinds, amounts, window) -> int:
+        """
+        For confirmed requests with no linked row anywhere, pick the closest un-keyed,
+        unlinked ledger row on the owner's wallet with a matching amount, within `window`
+        of the request's created_at or confirmed_at. Each ledger row is used at most once.
+        """
+        link = {f"{fk}_id": OuterRef("pk")}
+        pending = (
+            requests
+            .exclude(Exists(WalletTxn.objects.filter(**link)))
+            .exclude(Exists(WalletTxnArchive.objects.filter(**link)))
+        )
+        linked = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                reqs = list(pending.filter(pk__gt=last_pk).order_by("pk")[: self.chunk])
+                if not reqs:
+                    break
+                last_pk = reqs[-1].pk
+
+                wallet_by_user = dict(
+                    Wallet.objects.filter(user_id__in={r.user_id for r in reqs}).values_list("user_id", "pk")
+                )
+                anchors = [t for r in reqs for t in (r.created_at, r.confirmed_at) if t]
+                candidates = {}
+                for t in (
+                    model.objects.filter(
+                        wallet_id__in=wallet_by_user.values(),
+                        external_ref__isnull=True,
+                        kind__in=kinds,
+                        withdrawal__isnull=True,
+                        deposit__isnull=True,
+                        created_at__gte=min(anchors) - window,
+                        created_at__lte=max(anchors) + window,
+                    )
+                    .only("pk", "wallet_id", "amount_cents", "created_at")
+                    .order_by("pk")
+                ):
+                    candidates.setdefault((t.wallet_id, int(t.amount_cents)), []).append(t)
+
+                dirty = []
+                used = set()
+                for r in reqs:
+                    wid = wallet_by_user.get(r.user_id)
+                    best, best_gap = None, None
+                    for amount in amounts(r):
+                        for t in candidates.get((wid, amount), ()):
+                            if t.pk in used:
+                                continue
+                            gap = min(abs(t.created_at - a) for a in (r.created_at, r.confirmed_at) if a)
+                            if gap <= window and (best_gap is None or gap < best_gap):
+                                best, best_gap = t, gap
+                    if best is not None:
+                        used.add(best.pk)
+                        setattr(best, f"{fk}_id", r.pk)
+                        dirty.append(best)
+
+                if dirty and not self.dry_run:
+                    model.objects.bulk_update(dirty, [fk], batch_size=self.chunk)
+
+            linked += len(dirty)
+            self.stdout.write(f"…{model.__name__}/{fk}: {linked} matched row(s) (up to request {last_pk})")
+        return linked
@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import BigIntegerField, F, Max, Min, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from main.models import Wallet, WalletCheckpoint, WalletTxn, WalletTxnArchive, latest_checkpoint_txn_id
+
+
+def _close_db():
+    # Forked workers must not share the parent's DB sockets
+    connections.close_all()
+
+
+def _drift_rows(wid, user_id, cash, held, bonus, sums, checkpoint_txn_id) -> list[dict]:
+    rows = []
+    # held cash stays in the CASH ledger until its hold is captured
+    for bucket, stored in (("CASH", int(cash or 0) + int(held or 0)), ("BONUS", int(bonus or 0))):
+        ledger = sums.get(bucket, 0)
+        if stored != ledger:
+            rows.append({
+                "wallet_id": wid,
+                "user_id": user_id,
+                "bucket": bucket,
+                "stored_cents": stored,
+                "ledger_cents": ledger,
+                "drift_cents": stored - ledger,
+                "checkpoint_txn_id": checkpoint_txn_id,
+            })
+    return rows
+
+
+def recheck_wallet(wid: int, checkpoint: dict | None = None, checkpoint_txn_id: int | None = None) -> list[dict]:
+    """
+    Drift rows for one wallet, compared with its Wallet row locked.
+    Every post updates the Wallet row in the same transaction as its ledger row, so under the
+    lock the stored balances and the ledger sums read afterwards describe the same commits.
+    """
+    with transaction.atomic():
+        row = (
+            Wallet.objects.select_for_update().filter(pk=wid)
+            .values_list("user_id", "balance_cents", "pending_cents", "bonus_cents")
+            .first()
+        )
+        if row is None:
+            return []
+        sums = dict(checkpoint or {"CASH": 0, "BONUS": 0})
+        for model in (WalletTxn, WalletTxnArchive):
+            txns = model.objects.filter(wallet_id=wid).order_by()
+            if checkpoint_txn_id is not None:
+                txns = txns.filter(id__gt=checkpoint_txn_id)
+            for bucket, total in txns.values("bucket").annotate(total=Sum("amount_cents")).values_list("bucket", "total"):
+                sums[bucket] = sums.get(bucket, 0) + int(total or 0)
+        user_id, cash, held, bonus = row
+        return _drift_rows(wid, user_id, cash, held, bonus, sums, checkpoint_txn_id)
+
+
+def reconcile_range(lo: int, hi: int, chunk: int = 2000, use_checkpoints: bool = True) -> tuple[int, list[dict]]:
+    """
+    Compare Wallet.balance_cents (+ pending_cents) / bonus_cents with ledger sums for wallets lo..hi.
+      - Starts from each wallet's newest WalletCheckpoint (unless disabled).
+      - Ledger sums are GROUP BY'd in the DB and streamed back with iterator(chunk).
+      - The sums and the Wallet rows are separate reads, so a post landing between them looks
+        like drift: flagged wallets are re-checked one by one under a row lock (recheck_wallet).
+    Returns (wallets_checked, drift_rows).
+    """
+    latest = latest_checkpoint_txn_id()
+    checkpoints = {}  # wallet_id -> {"CASH": .., "BONUS": ..} at its checkpoint
+    watermark = {}    # wallet_id -> last_txn_id
+    if use_checkpoints:
+        for wid, top, cash, bonus in (
+            WalletCheckpoint.objects
+            .filter(wallet_id__gte=lo, wallet_id__lte=hi, last_txn_id=latest)
+            .values_list("wallet_id", "last_txn_id", "cash_cents", "bonus_cents")
+            .iterator(chunk_size=chunk)
+        ):
+            checkpoints[wid] = {"CASH": int(cash), "BONUS": int(bonus)}
+            watermark[wid] = int(top)
+    base = {wid: dict(sums) for wid, sums in checkpoints.items()}   # wallet_id -> running ledger sums
+
+    # live + archived ledger (archived rows normally sit under a checkpoint already)
+    for model in (WalletTxn, WalletTxnArchive):
+        txns = model.objects.filter(wallet_id__gte=lo, wallet_id__lte=hi).order_by()
+        if watermark:
+            txns = (
+                txns.annotate(watermark=Coalesce(latest, Value(0), output_field=BigIntegerField()))
+                .filter(id__gt=F("watermark"))
+            )
+        for wid, bucket, total in (
+            txns.values("wallet_id", "bucket")
+            .annotate(total=Sum("amount_cents"))
+            .values_list("wallet_id", "bucket", "total")
+            .iterator(chunk_size=chunk)
+        ):
+            sums = base.setdefault(wid, {"CASH": 0, "BONUS": 0})
+            sums[bucket] = sums.get(bucket, 0) + int(total or 0)
+
+    checked = 0
+    flagged = []
+    for wid, user_id, cash, held, bonus in (
+        Wallet.objects.filter(pk__range=(lo, hi))
+        .order_by("pk")
+        .values_list("pk", "user_id", "balance_cents", "pending_cents", "bonus_cents")
+        .iterator(chunk_size=chunk)
+    ):
+        checked += 1
+        sums = base.get(wid, {"CASH": 0, "BONUS": 0})
+        if _drift_rows(wid, user_id, cash, held, bonus, sums, watermark.get(wid)):
+            flagged.append(wid)
+
+    drift = []
+    for wid in flagged:
+        drift.extend(recheck_wallet(wid, checkpoints.get(wid), watermark.get(wid)))
+    return checked, drift
+
+
+def _reconcile_range_worker(lo, hi, chunk, use_checkpoints):
+    try:
+        return lo, hi, reconcile_range(lo, hi, chunk, use_checkpoints)
+    finally:
+        _close_db()
+
+
+class Command(BaseCommand):
+    help = "Compare every wallet's stored balances with its ledger and write a JSONL drift report."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (1 = run inline)")
+        parser.add_argument("--range-size", type=int, default=5000, help="Wallet ids per work unit (default 5000)")
+        parser.add_argument("--chunk", type=int, default=2000, help="Iterator chunk size (default 2000)")
+        parser.add_argument("--out", default=None, help="Report path (default reconcile-YYYYMMDD-HHMMSS.jsonl)")
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue a previous run: append to --out and skip ranges listed in its .state file",
+        )
+        parser.add_argument("--no-checkpoints", action="store_true", help="Ignore WalletCheckpoint and sum the full ledger")
+
+    def handle(self, *args, **opts):
+        range_size = max(1, opts["range_size"])
+        chunk = max(1, opts["chunk"])
+        workers = max(1, opts["workers"])
+        use_checkpoints = not opts["no_checkpoints"]
+
+        out = opts["out"]
+        if opts["resume"] and not out:
+            raise CommandError("--resume needs --out pointing at the report of the run to continue.")
+        out = out or f"reconcile-{timezone.now():%Y%m%d-%H%M%S}.jsonl"
+        state_path = f"{out}.state"
+
+        # ---- resume state: one JSON line per finished range ----
+        done = set()
+        if opts["resume"] and os.path.exists(state_path):
+            with open(state_path) as fh:
+                for line in fh:
+                    row = json.loads(line)
+                    if row.get("range_size") != range_size:
+                        raise CommandError(
+                            f"State file was written with --range-size {row.get('range_size')}; rerun with the same value."
+                        )
+                    done.add(row["lo"])
+        elif not opts["resume"]:
+            for path in (out, state_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        bounds = Wallet.objects.aggregate(lo=Min("pk"), hi=Max("pk"))
+        if bounds["lo"] is None:
+            self.stdout.write("No wallets.")
+            return
+
+        ranges = [
+            (lo, min(lo + range_size - 1, bounds["hi"]))
+            for lo in range(bounds["lo"], bounds["hi"] + 1, range_size)
+            if lo not in done
+        ]
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Reconciling wallets {bounds['lo']}..{bounds['hi']}: {len(ranges)} range(s) to go, {len(done)} already done"
+        ))
+
+        checked = drifted = 0
+        with open(out, "a") as report, open(state_path, "a") as state:
+            def record(lo, hi, result):
+                nonlocal checked, drifted
+                n, rows = result
+                for row in rows:
+                    report.write(json.dumps(row) + "\n")
+                report.flush()
+                state.write(json.dumps({"lo": lo, "hi": hi, "range_size": range_size, "wallets": n, "drift": len(rows)}) + "\n")
+                state.flush()
+                checked += n
+                drifted += len(rows)
+                self.stdout.write(f"…{lo}-{hi}: {n} wallet(s), {len(rows)} drift row(s)")
+
+            if workers == 1 or len(ranges) <= 1:
+                for lo, hi in ranges:
+                    record(lo, hi, reconcile_range(lo, hi, chunk, use_checkpoints))
+            else:
+                _close_db()  # don't hand open sockets to forked children
+                with ProcessPoolExecutor(max_workers=workers, initializer=_close_db) as pool:
+                    futures = [
+                        pool.submit(_reconcile_range_worker, lo, hi, chunk, use_checkpoints)
+                        for lo, hi in ranges
+                    ]
+                    for fut in as_completed(futures):
+                        record(*fut.result())
+
+        style = self.style.WARNING if drifted else self.style.SUCCESS
+        self.stdout.write(style(f"Checked {checked} wallet(s); {drifted} drift row(s) written to {out}."))
@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from main.rollover import expire_directives, next_midnight, run_daily
+
+
+class Command(BaseCommand):
+    help = (
+        "Local scheduler (keep it running under the process manager): the daily rollover "
+        "(main.rollover) right after local midnight, plus directive expiry every few minutes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Run the daily rollover now and exit")
+        parser.add_argument("--grace", type=int, default=30, help="Seconds after midnight to start (default 30)")
+        parser.add_argument("--expire-every", type=int, default=10, help="Minutes between directive expiry runs (default 10)")
+        parser.add_argument("--chunk", type=int, default=1000, help="Rows per batch (default 1000)")
+
+    def handle(self, *args, **opts):
+        chunk = max(1, opts["chunk"])
+        if opts["once"]:
+            self._daily(chunk)
+            return
+
+        grace = timezone.timedelta(seconds=max(0, opts["grace"]))
+        every = timezone.timedelta(minutes=max(1, opts["expire_every"]))
+        # Catch up on start: a restart mid-day still gets today's rollover (every step is idempotent)
+        next_daily = timezone.now()
+        next_expire = timezone.now()
+        self.stdout.write(self.style.MIGRATE_HEADING("Scheduler running (Ctrl+C to stop)."))
+        try:
+            while True:
+                now = timezone.now()
+                if now >= next_daily:
+                    self._daily(chunk)
+                    next_daily = next_midnight(now) + grace
+                    next_expire = timezone.now() + every    # the rollover just expired them
+                    self.stdout.write(f"Next rollover at {timezone.localtime(next_daily):%Y-%m-%d %H:%M:%S}")
+                elif now >= next_expire:
+                    n = expire_directives(now, chunk=chunk)
+                    if n:
+                        self.stdout.write(f"{timezone.localtime(now):%H:%M:%S} expired {n} directive(s)")
+                    next_expire = now + every
+                close_old_connections()   # don't sit on a connection the server will time out
+                wait = (min(next_daily, next_expire) - timezone.now()).total_seconds()
+                time.sleep(min(max(wait, 1), 60))
+        except KeyboardInterrupt:
+            self.stdout.write("Scheduler stopped.")
+
+    def _daily(self, chunk):
+        started = timezone.now()
+        done = run_daily(chunk=chunk, log=self.stdout.write)
+        summary = ", ".join(f"{k}={v}" for k, v in done.items())
+        took = (timezone.now() - started).total_seconds()
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Rollover for {timezone.localdate(started)}: {summary} ({took:.1f}s)"
+        ))
@@ -7,6 +7,7 @@ from typing import Optional
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth import get_user_model
 from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
 
 from main.models import (
@@ -83,7 +84,7 @@ class Command(BaseCommand):
         if grant_bonus is not None:
             if w.bonus_cents < grant_bonus:
                 delta = grant_bonus - w.bonus_cents
-                Wallet.objects.filter(pk=w.pk).update(bonus_cents=w.bonus_cents + delta)
+                Wallet.objects.filter(pk=w.pk).update(bonus_cents=w.bonus_cents + delta, version=F("version") + 1)
         return w
 
     def handle(self, *args, **opts):
@@ -0,0 +1,439 @@
+from __future__ import annotations
+
+import logging
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.messages import constants as message_levels
+from django.contrib.messages import get_messages
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Count, F, Sum
+from django.test import Client
+from django.urls import reverse
+
+from main.forms import MIN_EUR
+from main.models import (
+    AddressType,
+    CustomUser,
+    PayoutAddress,
+    UserTask,
+    UserTaskProgress,
+    UserTaskTemplate,
+    VersionConflict,
+    Wallet,
+    WalletHold,
+    WalletTxn,
+    WithdrawalRequest,
+    WithdrawalStatus,
+    ensure_task_progress,
+    ledger_drift,
+)
+from main.task_currency import to_cents
+
+OPS = ("submit", "do_task", "withdraw", "approve")
+PHONE_PREFIX = "+1999"
+TX_PIN = "246810"
+LOCAL_HOSTS = ("", "localhost", "127.0.0.1", "::1")
+
+
+# =======================
+# DB instrumentation
+# =======================
+def _lock_error(exc) -> str | None:
+    """Classify a DB exception as a lock problem (MySQL error codes, SQLite busy), else None."""
+    code = exc.args[0] if exc.args and isinstance(exc.args[0], int) else None
+    text = str(exc).lower()
+    if code == 1213 or "deadlock" in text:
+        return "deadlock"
+    if code == 1205 or "lock wait timeout" in text:
+        return "lock_wait_timeout"
+    if "database is locked" in text or "database table is locked" in text:
+        return "sqlite_busy"
+    return None
+
+
+class _StatementTimer:
+    """
+    connection.execute_wrapper for one worker: times every statement and counts lock errors,
+    including the ones a view catches and turns into a flash message.
+    """
+    WRITES = ("INSERT", "UPDATE", "DELETE", "REPLACE", "SAVEPOINT", "RELEASE")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.write_seconds = 0.0
+        self.slowest = 0.0
+        self.lock_errors = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except Exception as e:
+            kind = _lock_error(e)
+            if kind:
+                self.lock_errors[kind] += 1
+            raise
+        finally:
+            dt = time.perf_counter() - t0
+            self.statements += 1
+            self.db_seconds += dt
+            self.slowest = max(self.slowest, dt)
+            if sql.lstrip()[:9].upper().startswith(self.WRITES):
+                self.write_seconds += dt
+
+
+def _mysql_lock_status() -> dict:
+    if connection.vendor != "mysql":
+        return {}
+    with connection.cursor() as cur:
+        cur.execute(
+            "SHOW GLOBAL STATUS WHERE Variable_name IN "
+            "('Innodb_row_lock_waits', 'Innodb_row_lock_time', 'Innodb_deadlocks')"
+        )
+        return {name: int(value) for name, value in cur.fetchall()}
+
+
+# =======================
+# operations (one user each, run the way a request would)
+# =======================
+def _host() -> str:
+    hosts = [h for h in settings.ALLOWED_HOSTS if h and h != "*" and not h.startswith(".")]
+    return hosts[0] if hosts else "localhost"
+
+
+def _client(clients: dict, user) -> Client:
+    c = clients.get(user.pk)
+    if c is None:
+        c = clients[user.pk] = Client(HTTP_HOST=_host(), **{"wsgi.url_scheme": "https"})
+        c.force_login(user)
+    return c
+
+
+def _call(client: Client, method: str, url: str, data=None) -> str:
+    """
+    One request; a view that answered with an error/info flash message refused the action.
+    Flash messages of earlier (never rendered) redirects are dropped first so they can't
+    be read back as this request's answer.
+    """
+    client.cookies.pop("messages", None)
+    response = getattr(client, method)(url, data or {})
+    levels = [m.level for m in get_messages(response.wsgi_request)]
+    refused = any(lvl in (message_levels.ERROR, message_levels.WARNING, message_levels.INFO) for lvl in levels)
+    return "rejected" if refused or response.status_code >= 400 else "ok"
+
+
+def op_submit(user, ctx) -> str:
+    task = (
+        UserTask.objects.select_related("user")
+        .filter(user=user, status=UserTask.Status.IN_PROGRESS)
+        .order_by("-created_at")
+        .first()
+    )
+    if task is None:
+        return "rejected"
+    task.submit()
+    return "ok"
+
+
+def op_do_task(user, ctx) -> str:
+    result = _call(_client(ctx["clients"], user), "get", reverse("do_task"))
+    if result == "rejected":
+        prog = ensure_task_progress(user)
+        if prog.is_blocked:
+            prog.unblock()      # stand in for the back office so the user keeps generating load
+            ctx["events"]["unblocked"] += 1
+    return result
+
+
+def op_withdraw(user, ctx) -> str:
+    c = _client(ctx["clients"], user)
+    # Harness-only: reopen the cycle window so every attempt reaches the hold
+    UserTaskProgress.objects.filter(user=user).update(last_withdraw_cycle=0, version=F("version") + 1)
+    c.get(reverse("withdrawal"))
+    amount = ctx["rng"].randint(MIN_EUR * 100, MIN_EUR * 100 + 999) / 100
+    return _call(c, "post", reverse("withdrawal"), {
+        "amount": f"{amount:.2f}",
+        "currency": "EUR",
+        "address_id": ctx["addresses"][user.pk],
+        "tx_pin": TX_PIN,
+        "wdw_token": c.session.get("wdw_token", ""),
+    })
+
+
+def op_approve(user, ctx) -> str:
+    wr_id = (
+        WithdrawalRequest.objects.filter(user=user, status=WithdrawalStatus.PENDING)
+        .order_by("created_at").values_list("pk", flat=True).first()
+    )
+    if wr_id is None:
+        return "rejected"
+    staff = ctx["staff"]
+    return _call(_client(ctx["clients"], staff), "post", reverse("bo_withdrawal_approve", args=[wr_id]))
+
+
+OP_FUNCS = {
+    "submit": op_submit,
+    "do_task": op_do_task,
+    "withdraw": op_withdraw,
+    "approve": op_approve,
+}
+
+
+def run_worker(worker_no: int, user_ids: list, staff_id: int, ops: list, seconds: float, seed: int) -> dict:
+    """Hammer random (op, user) pairs until the deadline; returns plain counters (picklable)."""
+    rng = random.Random(seed * 1000 + worker_no)
+    timer = _StatementTimer()
+    stats = {op: {"ok": 0, "rejected": 0, "error": 0, "ms": []} for op in ops}
+    errors = Counter()
+    ctx = {"clients": {}, "events": Counter(), "rng": rng}
+    try:
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cur:
+                cur.execute("PRAGMA journal_mode=WAL")
+        users = {u.pk: u for u in CustomUser.objects.filter(pk__in=user_ids)}
+        ctx["staff"] = CustomUser.objects.get(pk=staff_id)
+        ctx["addresses"] = dict(PayoutAddress.objects.filter(user_id__in=user_ids).values_list("user_id", "pk"))
+
+        deadline = time.monotonic() + seconds
+        with connection.execute_wrapper(timer):
+            while time.monotonic() < deadline:
+                op = rng.choice(ops)
+                user = users[rng.choice(user_ids)]
+                t0 = time.perf_counter()
+                try:
+                    result = OP_FUNCS[op](user, ctx)
+                except ValidationError:
+                    result = "rejected"
+                except VersionConflict:
+                    ctx["events"]["version_conflict"] += 1
+                    result = "error"
+                except Exception as e:
+                    errors[f"{op}: {type(e).__name__}: {str(e)[:120]}"] += 1
+                    result = "error"
+                stats[op][result] += 1
+                stats[op]["ms"].append((time.perf_counter() - t0) * 1000)
+    finally:
+        connections.close_all()   # this thread's / process's connections only
+
+    return {
+        "stats": stats,
+        "errors": errors,
+        "events": ctx["events"],
+        "db": {
+            "statements": timer.statements,
+            "db_seconds": timer.db_seconds,
+            "write_seconds": timer.write_seconds,
+            "slowest": timer.slowest,
+        },
+        "lock_errors": timer.lock_errors,
+    }
+
+
+# =======================
+# fixtures + invariants
+# =======================
+def prepare(tag: str, n_users: int, deposit_cents: int) -> tuple[list, int]:
+    """Create the harness users (wallet deposit, PIN, verified address, one cycle done) and a staff user."""
+    user_ids = []
+    for i in range(n_users):
+        u = CustomUser.objects.create_user(phone=f"{PHONE_PREFIX}{tag}{i:03d}", password=None)
+        u.set_tx_pin(TX_PIN)
+        PayoutAddress.objects.create(
+            user=u, label="stress", address_type=AddressType.TRC20, address=f"TSTRESS{tag}{i:03d}", is_verified=True,
+        )
+        wallet, _ = Wallet.objects.get_or_create(user=u)
+        wallet.credit_once(deposit_cents, kind="DEPOSIT", memo="Stress deposit", external_ref=f"stress-{tag}-{i}")
+        ensure_task_progress(u)
+        UserTaskProgress.objects.filter(user=u).update(cycles_completed=1, version=F("version") + 1)
+        user_ids.append(u.pk)
+    staff = CustomUser.objects.create_user(phone=f"{PHONE_PREFIX}{tag}999", password=None, is_staff=True)
+
+    affordable = UserTaskTemplate.objects.filter(
+        status=UserTaskTemplate.Status.ACTIVE, is_admin_task=False,
+    ).exists()
+    if not affordable:
+        for i in range(3):
+            UserTaskTemplate.objects.create(
+                hotel_name=f"Stress hotel {tag}-{i}", slug=f"stress-{tag}-{i}", country="Test", city="Test",
+                status=UserTaskTemplate.Status.ACTIVE, task_price=MIN_EUR, task_commission="0.50",
+            )
+    return user_ids, staff.pk
+
+
+def check_invariants(user_ids) -> list[str]:
+    """Ledger, hold, task and progress rules that must hold however the operations interleaved."""
+    problems = []
+
+    held = dict(
+        WalletHold.objects.filter(wallet__user_id__in=user_ids, status=WalletHold.Status.HELD)
+        .values("wallet_id").annotate(s=Sum("amount_cents")).values_list("wallet_id", "s")
+    )
+    for w in Wallet.objects.filter(user_id__in=user_ids):
+        drift = ledger_drift(w)
+        if any(drift.values()):
+            problems.append(f"wallet {w.pk}: stored balances differ from the ledger {drift}")
+        if min(w.balance_cents, w.bonus_cents, w.pending_cents) < 0:
+            problems.append(f"wallet {w.pk}: negative bucket (cash={w.balance_cents} bonus={w.bonus_cents} "
+                            f"pending={w.pending_cents})")
+        if int(w.pending_cents) != int(held.get(w.pk) or 0):
+            problems.append(f"wallet {w.pk}: pending_cents={w.pending_cents} but HELD holds sum to {held.get(w.pk) or 0}")
+
+    for row in (
+        UserTask.objects.filter(user_id__in=user_ids, status__in=[UserTask.Status.IN_PROGRESS, UserTask.Status.SUBMITTED])
+        .values("user_id").annotate(n=Count("id")).filter(n__gt=1)
+    ):
+        problems.append(f"user {row['user_id']}: {row['n']} open tasks at once")
+
+    approved = list(
+        UserTask.objects.filter(user_id__in=user_ids, status=UserTask.Status.APPROVED)
+        .values_list("pk", "user_id", "task_kind", "commission_used")
+    )
+    paid_refs = set(
+        WalletTxn.objects.filter(wallet__user_id__in=user_ids, external_ref__startswith="REGULAR_TASK_PAYOUT#")
+        .values_list("external_ref", flat=True)
+    )
+    earned = Counter()
+    for pk, uid, kind, commission in approved:
+        earned[uid] += to_cents(commission)
+        if kind == UserTask.Kind.REGULAR and to_cents(commission) > 0 and f"REGULAR_TASK_PAYOUT#{pk}" not in paid_refs:
+            problems.append(f"task {pk}: APPROVED without its payout ledger row")
+
+    for p in UserTaskProgress.objects.filter(user_id__in=user_ids):
+        if not 0 <= p.dividends_paid_cents <= p.dividends_cents:
+            problems.append(f"progress {p.pk}: dividends_paid={p.dividends_paid_cents} outside 0..{p.dividends_cents}")
+        if p.dividends_cents != earned[p.user_id]:
+            problems.append(f"progress {p.pk}: dividends={p.dividends_cents} but approved commissions={earned[p.user_id]}")
+        if p.current_task_index > p.limit_snapshot:
+            problems.append(f"progress {p.pk}: index {p.current_task_index} past limit {p.limit_snapshot}")
+
+    withdrawals = WithdrawalRequest.objects.filter(user_id__in=user_ids)
+    for wr_id, status in withdrawals.values_list("pk", "status"):
+        rows = WalletTxn.objects.filter(external_ref=f"wd:{wr_id}").count()
+        holds = WalletHold.objects.filter(withdrawal_id=wr_id, status=WalletHold.Status.HELD).count()
+        if status == WithdrawalStatus.CONFIRMED and rows != 1:
+            problems.append(f"withdrawal {wr_id}: CONFIRMED with {rows} ledger row(s)")
+        if status == WithdrawalStatus.PENDING and holds != 1:
+            problems.append(f"withdrawal {wr_id}: pending with {holds} HELD hold(s)")
+    return problems
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Concurrency stress test on a LOCAL database: N workers submit tasks, start tasks, request and approve "
+        "withdrawals for the same few users, then report throughput, lock trouble and invariant violations."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8, help="Concurrent workers (default 8)")
+        parser.add_argument("--mode", choices=("threads", "processes"), default="threads")
+        parser.add_argument("--users", type=int, default=4, help="Harness users shared by all workers (default 4)")
+        parser.add_argument("--seconds", type=float, default=20, help="Run time per worker (default 20)")
+        parser.add_argument("--ops", default=",".join(OPS), help=f"Comma list from {', '.join(OPS)}")
+        parser.add_argument("--deposit", type=int, default=500000, help="Cash cents credited to each user (default 500000)")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--cleanup", action="store_true", help="Delete the harness users afterwards")
+
+    def handle(self, *args, **opts):
+        db = connection.settings_dict
+        if connection.vendor == "sqlite":
+            if str(db["NAME"]) == ":memory:" or "mode=memory" in str(db["NAME"]):
+                raise CommandError("Point the SQLite stand-in at a file; workers can't share an in-memory DB.")
+        elif connection.vendor == "mysql":
+            if (db.get("HOST") or "") not in LOCAL_HOSTS:
+                raise CommandError(f"Refusing to stress a non-local MySQL host ({db.get('HOST')}).")
+        else:
+            raise CommandError(f"Unsupported database vendor for the harness: {connection.vendor}")
+
+        ops = [o.strip() for o in opts["ops"].split(",") if o.strip()]
+        unknown = sorted(set(ops) - set(OPS))
+        if unknown or not ops:
+            raise CommandError(f"Unknown op(s): {', '.join(unknown) or '(none given)'}")
+        workers = max(1, opts["workers"])
+
+        tag = f"{int(time.time()) % 100000:05d}"
+        user_ids, staff_id = prepare(tag, max(1, opts["users"]), opts["deposit"])
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Stress run {tag}: {workers} {opts['mode']} × {opts['seconds']:g}s on {len(user_ids)} user(s) "
+            f"[{connection.vendor}] ops={','.join(ops)}"
+        ))
+
+        # Failed requests are counted below; don't dump a traceback per failure from django.request
+        logging.getLogger("django.request").setLevel(logging.CRITICAL)
+        before = _mysql_lock_status()
+        connections.close_all()   # don't hand open sockets to forked children
+        pool_cls = ThreadPoolExecutor if opts["mode"] == "threads" else ProcessPoolExecutor
+        started = time.monotonic()
+        with pool_cls(max_workers=workers) as pool:
+            futures = [
+                pool.submit(run_worker, n, user_ids, staff_id, ops, opts["seconds"], opts["seed"])
+                for n in range(workers)
+            ]
+            results = [f.result() for f in futures]
+        elapsed = time.monotonic() - started
+        after = _mysql_lock_status()
+
+        self._report(results, elapsed)
+        if before:
+            self.stdout.write("InnoDB: " + ", ".join(
+                f"{k} +{after.get(k, 0) - v}" for k, v in sorted(before.items())
+            ) + " (server-wide; Innodb_row_lock_time in ms)")
+
+        problems = check_invariants(user_ids)
+        if opts["cleanup"]:
+            CustomUser.objects.filter(phone__startswith=f"{PHONE_PREFIX}{tag}").delete()
+            UserTaskTemplate.objects.filter(slug__startswith=f"stress-{tag}-").delete()
+        else:
+            self.stdout.write(f"Harness users kept: phone {PHONE_PREFIX}{tag}*")
+
+        if problems:
+            for line in problems:
+                self.stdout.write(self.style.ERROR(f"  ✗ {line}"))
+            raise CommandError(f"{len(problems)} invariant violation(s).")
+        self.stdout.write(self.style.SUCCESS("✅ All invariants hold."))
+
+    def _report(self, results, elapsed):
+        ops = list(results[0]["stats"])
+        self.stdout.write(f"{'op':<10}{'ok':>8}{'rejected':>10}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}")
+        total = 0
+        for op in ops:
+            ok = sum(r["stats"][op]["ok"] for r in results)
+            rejected = sum(r["stats"][op]["rejected"] for r in results)
+            errors = sum(r["stats"][op]["error"] for r in results)
+            ms = [x for r in results for x in r["stats"][op]["ms"]]
+            total += len(ms)
+            self.stdout.write(
+                f"{op:<10}{ok:>8}{rejected:>10}{errors:>8}"
+                f"{_percentile(ms, .5):>9.1f}{_percentile(ms, .95):>9.1f}{max(ms, default=0):>9.1f}"
+            )
+
+        db = {k: sum(r["db"][k] for r in results) for k in ("statements", "db_seconds", "write_seconds")}
+        slowest = max(r["db"]["slowest"] for r in results)
+        locks = sum((r["lock_errors"] for r in results), Counter())
+        events = sum((r["events"] for r in results), Counter())
+        errors = sum((r["errors"] for r in results), Counter())
+
+        self.stdout.write(f"Throughput: {total / elapsed:.1f} ops/s ({total} ops in {elapsed:.1f}s)")
+        self.stdout.write(
+            f"DB: {db['statements']} statements, {db['db_seconds']:.2f}s in the DB, "
+            f"{db['write_seconds']:.2f}s in writes (includes lock/busy waits), slowest {slowest * 1000:.0f} ms"
+        )
+        self.stdout.write(
+            "Lock errors: " + ", ".join(f"{k}={locks.get(k, 0)}" for k in ("deadlock", "lock_wait_timeout", "sqlite_busy"))
+            + f"; version conflicts={events.get('version_conflict', 0)}; harness unblocks={events.get('unblocked', 0)}"
+        )
+        for msg, n in errors.most_common(10):
+            self.stdout.write(self.style.WARNING(f"  {n}× {msg}"))
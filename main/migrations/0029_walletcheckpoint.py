@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0028_fortunecardrule_target_user_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_txn_id', models.BigIntegerField()),
+                ('as_of', models.DateTimeField()),
+                ('cash_cents', models.BigIntegerField(default=0)),
+                ('bonus_cents', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='main.wallet')),
+            ],
+            options={
+                'ordering': ('-last_txn_id',),
+                'indexes': [models.Index(fields=['wallet', '-last_txn_id'], name='main_wallet_wallet__0ea0ee_idx'), models.Index(fields=['wallet', '-as_of'], name='main_wallet_wallet__b666f6_idx')],
+                'constraints': [models.UniqueConstraint(fields=('wallet', 'last_txn_id'), name='uniq_wallet_checkpoint_watermark')],
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+from django.db import migrations
+
+SUCCESS_STATUSES = ("confirmed", "completed", "credited", "success")
+CHUNK = 1000
+
+
+def backfill_deposit_refs(apps, schema_editor):
+    """
+    Deposits credited by the old post_save signal were keyed only by memo
+    ("Deposit <reference>"). Stamp external_ref="dep:<id>" on the first such
+    ledger row so the signal's external_ref check also covers them.
+    """
+    DepositRequest = apps.get_model("main", "DepositRequest")
+    Wallet = apps.get_model("main", "Wallet")
+    WalletTxn = apps.get_model("main", "WalletTxn")
+
+    last_pk = 0
+    while True:
+        deps = list(
+            DepositRequest.objects.filter(pk__gt=last_pk, status__in=SUCCESS_STATUSES)
+            .order_by("pk")
+            .values_list("pk", "user_id", "reference")[:CHUNK]
+        )
+        if not deps:
+            break
+        last_pk = deps[-1][0]
+
+        wallet_by_user = dict(
+            Wallet.objects.filter(user_id__in={d[1] for d in deps}).values_list("user_id", "pk")
+        )
+        keyed = set(
+            WalletTxn.objects.filter(
+                wallet_id__in=wallet_by_user.values(),
+                external_ref__in=[f"dep:{d[0]}" for d in deps],
+            ).values_list("wallet_id", "external_ref")
+        )
+        for pk, user_id, reference in deps:
+            wid = wallet_by_user.get(user_id)
+            ref = f"dep:{pk}"
+            if not wid or (wid, ref) in keyed:
+                continue
+            txn_id = (
+                WalletTxn.objects.filter(wallet_id=wid, kind="DEPOSIT", memo=f"Deposit {reference}", external_ref="")
+                .order_by("pk")
+                .values_list("pk", flat=True)
+                .first()
+            )
+            if txn_id:
+                WalletTxn.objects.filter(pk=txn_id).update(external_ref=ref)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0029_walletcheckpoint"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_deposit_refs, migrations.RunPython.noop),
+    ]
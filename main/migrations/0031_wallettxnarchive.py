@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0030_backfill_deposit_external_ref'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='archived_upto',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='WalletTxnArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('month', models.DateField()),
+                ('amount_cents', models.BigIntegerField(default=0)),
+                ('kind', models.CharField(choices=[('BONUS', 'Bonus'), ('DEPOSIT', 'Deposit'), ('WITHDRAW', 'Withdraw'), ('ADJUST', 'Adjust')], max_length=20)),
+                ('bucket', models.CharField(choices=[('CASH', 'Cash'), ('BONUS', 'Bonus')], default='CASH', max_length=10)),
+                ('memo', models.CharField(blank=True, max_length=255)),
+                ('external_ref', models.CharField(blank=True, default='', max_length=64)),
+                ('created_at', models.DateTimeField()),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_txns', to='main.wallet')),
+            ],
+            options={
+                'ordering': ('-created_at',),
+                'indexes': [models.Index(fields=['wallet', '-created_at'], name='main_wallet_wallet__8bd5f9_idx'), models.Index(fields=['month', 'wallet'], name='main_wallet_month_2f8f72_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('external_ref', ''), _negated=True), fields=('wallet', 'external_ref'), name='uniq_archive_wallet_external_ref')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0031_wallettxnarchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallettxn',
+            name='deposit',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_rows', to='main.depositrequest'),
+        ),
+        migrations.AddField(
+            model_name='wallettxn',
+            name='withdrawal',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_rows', to='main.withdrawalrequest'),
+        ),
+        migrations.AddField(
+            model_name='wallettxnarchive',
+            name='deposit',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_ledger_rows', to='main.depositrequest'),
+        ),
+        migrations.AddField(
+            model_name='wallettxnarchive',
+            name='withdrawal',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_ledger_rows', to='main.withdrawalrequest'),
+        ),
+    ]
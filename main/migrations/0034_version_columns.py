@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0033_outboxevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usertaskprogress',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='wallet',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
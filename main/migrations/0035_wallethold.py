@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0034_version_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount_cents', models.BigIntegerField()),
+                ('status', models.CharField(choices=[('HELD', 'Held'), ('CAPTURED', 'Captured'), ('RELEASED', 'Released')], default='HELD', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('settled_at', models.DateTimeField(blank=True, null=True)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='main.wallet')),
+                ('withdrawal', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='holds', to='main.withdrawalrequest')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['wallet', 'status'], name='main_wallet_wallet__15e42c_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('withdrawal__isnull', False)), fields=('withdrawal',), name='uniq_hold_per_withdrawal')],
+            },
+        ),
+    ]
@@ -0,0 +1,144 @@
+from django.db import migrations, models, transaction
+from django.db.models import Case, Value, When
+
+# Codes are append-only (see main.ledger_codes), so importing the live tables is safe here
+from main.ledger_codes import BUCKET_CODES, KIND_CODES, CodedChoiceField, encode_memo, render_memo
+
+LEDGER_MODELS = ("WalletTxn", "WalletTxnArchive")
+CHUNK = 5000
+
+KIND_CHOICES = [("BONUS", "Bonus"), ("DEPOSIT", "Deposit"), ("WITHDRAW", "Withdraw"), ("ADJUST", "Adjust")]
+BUCKET_CHOICES = [("CASH", "Cash"), ("BONUS", "Bonus")]
+
+
+def _pk_chunks(model):
+    """(lo, hi) pk ranges of at most CHUNK rows; each range is written in its own transaction."""
+    last_pk = 0
+    while True:
+        pks = list(model.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:CHUNK])
+        if not pks:
+            return
+        last_pk = pks[-1]
+        yield pks[0], pks[-1]
+
+
+def _mapped(src, mapping, output_field):
+    return Case(
+        *[When(**{src: k}, then=Value(v)) for k, v in mapping.items()],
+        default=None,
+        output_field=output_field,
+    )
+
+
+def pack_rows(apps, schema_editor):
+    """varchar kind/bucket -> *_code columns, templated memos -> memo_code/memo_args."""
+    for name in LEDGER_MODELS:
+        model = apps.get_model("main", name)
+        for field, codes in (("kind", KIND_CODES), ("bucket", BUCKET_CODES)):
+            unknown = set(model.objects.exclude(**{f"{field}__in": codes}).values_list(field, flat=True))
+            if unknown:
+                raise RuntimeError(
+                    f"{name}.{field} has values without a code: {sorted(unknown)} (add them to main.ledger_codes)"
+                )
+
+        for lo, hi in _pk_chunks(model):
+            with transaction.atomic():
+                rows = model.objects.filter(pk__gte=lo, pk__lte=hi)
+                rows.filter(kind_code__isnull=True).update(
+                    kind_code=_mapped("kind", KIND_CODES, models.PositiveSmallIntegerField()),
+                    bucket_code=_mapped("bucket", BUCKET_CODES, models.PositiveSmallIntegerField()),
+                )
+                dirty = []
+                for t in rows.filter(memo_code__isnull=True).exclude(memo="").only("pk", "memo"):
+                    packed = encode_memo(t.memo)
+                    if packed:
+                        t.memo_code, t.memo_args = packed
+                        t.memo = ""
+                        dirty.append(t)
+                model.objects.bulk_update(dirty, ["memo", "memo_code", "memo_args"])
+
+
+def unpack_rows(apps, schema_editor):
+    for name in LEDGER_MODELS:
+        model = apps.get_model("main", name)
+        by_kind = {v: k for k, v in KIND_CODES.items()}
+        by_bucket = {v: k for k, v in BUCKET_CODES.items()}
+        for lo, hi in _pk_chunks(model):
+            with transaction.atomic():
+                rows = model.objects.filter(pk__gte=lo, pk__lte=hi)
+                rows.update(
+                    kind=_mapped("kind_code", by_kind, models.CharField()),
+                    bucket=_mapped("bucket_code", by_bucket, models.CharField()),
+                )
+                dirty = []
+                for t in rows.filter(memo_code__isnull=False).only("pk", "memo_code", "memo_args"):
+                    t.memo = render_memo(t.memo_code, t.memo_args)
+                    t.memo_code = t.memo_args = None
+                    dirty.append(t)
+                model.objects.bulk_update(dirty, ["memo", "memo_code", "memo_args"])
+
+
+def _coded(codes, choices, **kwargs):
+    return CodedChoiceField(codes=codes, choices=choices, **kwargs)
+
+
+class Migration(migrations.Migration):
+    # Big table: every chunk commits on its own instead of one transaction for the whole ledger
+    atomic = False
+
+    dependencies = [
+        ('main', '0035_wallethold'),
+    ]
+
+    operations = [
+        *[
+            op
+            for model in ("wallettxn", "wallettxnarchive")
+            for op in (
+                migrations.AddField(
+                    model_name=model,
+                    name='memo_code',
+                    field=models.PositiveSmallIntegerField(blank=True, null=True),
+                ),
+                migrations.AddField(
+                    model_name=model,
+                    name='memo_args',
+                    field=models.JSONField(blank=True, null=True),
+                ),
+                migrations.AddField(
+                    model_name=model,
+                    name='kind_code',
+                    field=_coded(KIND_CODES, KIND_CHOICES, null=True),
+                ),
+                migrations.AddField(
+                    model_name=model,
+                    name='bucket_code',
+                    field=_coded(BUCKET_CODES, BUCKET_CHOICES, null=True),
+                ),
+            )
+        ],
+        migrations.RunPython(pack_rows, unpack_rows),
+        *[
+            op
+            for model in ("wallettxn", "wallettxnarchive")
+            for op in (
+                # a default on the old columns lets the reverse re-add them to a populated table
+                migrations.AlterField(model_name=model, name='kind', field=models.CharField(max_length=20, default='')),
+                migrations.AlterField(model_name=model, name='bucket', field=models.CharField(max_length=10, default='CASH')),
+                migrations.RemoveField(model_name=model, name='kind'),
+                migrations.RemoveField(model_name=model, name='bucket'),
+                migrations.RenameField(model_name=model, old_name='kind_code', new_name='kind'),
+                migrations.RenameField(model_name=model, old_name='bucket_code', new_name='bucket'),
+                migrations.AlterField(
+                    model_name=model,
+                    name='kind',
+                    field=_coded(KIND_CODES, KIND_CHOICES),
+                ),
+                migrations.AlterField(
+                    model_name=model,
+                    name='bucket',
+                    field=_coded(BUCKET_CODES, BUCKET_CHOICES, default='CASH'),
+                ),
+            )
+        ],
+    ]
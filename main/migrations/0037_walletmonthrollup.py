@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0036_compact_ledger_rows'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletMonthRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('cash_opening_cents', models.BigIntegerField(default=0)),
+                ('cash_in_cents', models.BigIntegerField(default=0)),
+                ('cash_out_cents', models.BigIntegerField(default=0)),
+                ('bonus_opening_cents', models.BigIntegerField(default=0)),
+                ('bonus_in_cents', models.BigIntegerField(default=0)),
+                ('bonus_out_cents', models.BigIntegerField(default=0)),
+                ('txn_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='month_rollups', to='main.wallet')),
+            ],
+            options={
+                'ordering': ('wallet', 'month'),
+                'constraints': [models.UniqueConstraint(fields=('wallet', 'month'), name='uniq_wallet_month_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0037_walletmonthrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletAdjustmentImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.CharField(blank=True, max_length=255)),
+                ('status', models.CharField(choices=[('VALIDATED', 'Validated'), ('REJECTED', 'Rejected'), ('APPLYING', 'Applying'), ('DONE', 'Done')], default='VALIDATED', max_length=10)),
+                ('total_rows', models.PositiveIntegerField(default=0)),
+                ('credit_cents', models.BigIntegerField(default=0)),
+                ('debit_cents', models.BigIntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('error_count', models.PositiveIntegerField(default=0)),
+                ('applied_rows', models.PositiveIntegerField(default=0)),
+                ('skipped_rows', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('uploaded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('-created_at',),
+            },
+        ),
+        migrations.CreateModel(
+            name='WalletAdjustmentRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('line_no', models.PositiveIntegerField()),
+                ('amount_cents', models.BigIntegerField()),
+                ('bucket', models.CharField(default='CASH', max_length=10)),
+                ('memo', models.CharField(blank=True, max_length=255)),
+                ('external_ref', models.CharField(max_length=64)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('APPLIED', 'Applied'), ('SKIPPED', 'Skipped')], default='PENDING', max_length=10)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rows', to='main.walletadjustmentimport')),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.wallet')),
+            ],
+            options={
+                'ordering': ('batch', 'line_no'),
+                'indexes': [models.Index(fields=['batch', 'status', 'id'], name='main_wallet_batch_i_e1ad38_idx')],
+            },
+        ),
+    ]
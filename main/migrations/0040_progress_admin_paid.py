@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0039_cacheversion'),
+    ]
+
+    # Existing rows stay NULL ("not backfilled") until manage.py backfill_admin_paid runs;
+    # only rows created afterwards start at 0.
+    operations = [
+        migrations.AddField(
+            model_name='usertaskprogress',
+            name='admin_approved_count',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='usertaskprogress',
+            name='admin_paid_cents',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='usertaskprogress',
+            name='admin_approved_count',
+            field=models.PositiveIntegerField(default=0, null=True),
+        ),
+        migrations.AlterField(
+            model_name='usertaskprogress',
+            name='admin_paid_cents',
+            field=models.BigIntegerField(default=0, null=True),
+        ),
+    ]
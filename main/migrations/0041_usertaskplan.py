@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-16 21:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0040_progress_admin_paid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserTaskPlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cycle_number', models.PositiveIntegerField()),
+                ('reset_at', models.DateTimeField(blank=True, null=True)),
+                ('slots', models.PositiveIntegerField(default=0)),
+                ('draws', models.JSONField(default=list)),
+                ('directives', models.JSONField(default=dict)),
+                ('fortunes', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_plans', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'cycle_number'), name='uniq_task_plan_per_cycle')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-16 21:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0041_usertaskplan'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='forcedtaskdirective',
+            index=models.Index(fields=['batch_id', 'status'], name='main_forced_batch_i_860758_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-16 21:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0042_directive_batch_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('commission_cents', models.BigIntegerField(default=0)),
+                ('deposit_cents', models.BigIntegerField(default=0)),
+                ('deposits', models.PositiveIntegerField(default=0)),
+                ('withdraw_cents', models.BigIntegerField(default=0)),
+                ('withdrawals', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_activity', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date'], name='main_dailya_date_7f7f69_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'date'), name='uniq_daily_activity')],
+            },
+        ),
+    ]
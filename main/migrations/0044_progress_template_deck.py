@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-16 21:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0043_daily_activity'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='usertaskplan',
+            name='draws',
+        ),
+        migrations.AddField(
+            model_name='usertaskprogress',
+            name='deck',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
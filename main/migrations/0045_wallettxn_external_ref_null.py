@@ -0,0 +1,78 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:24
+
+from django.db import migrations, models
+from django.db.models import Count
+
+CHUNK = 1000
+
+
+def blank_refs_to_null(apps, schema_editor):
+    """
+    "" meant "no key"; it becomes NULL so the unique constraint can drop its condition.
+    On MySQL the conditional constraint was never created, so replayed keys may already
+    be in the ledger more than once: keep the first row's key and suffix the later ones
+    with "~dup<id>" (the rows and the balances they moved stay; reconcile_wallets sees them).
+    """
+    for name in ("WalletTxn", "WalletTxnArchive"):
+        model = apps.get_model("main", name)
+        while model.objects.filter(external_ref="").exists():
+            ids = list(model.objects.filter(external_ref="").values_list("pk", flat=True)[:CHUNK])
+            model.objects.filter(pk__in=ids).update(external_ref=None)
+
+        dupes = (
+            model.objects.exclude(external_ref__isnull=True)
+            .values("wallet_id", "external_ref")
+            .annotate(n=Count("pk"))
+            .filter(n__gt=1)
+        )
+        for d in dupes:
+            ids = list(
+                model.objects.filter(wallet_id=d["wallet_id"], external_ref=d["external_ref"])
+                .order_by("pk")
+                .values_list("pk", flat=True)
+            )
+            for pk in ids[1:]:
+                suffix = f"~dup{pk}"
+                model.objects.filter(pk=pk).update(external_ref=d["external_ref"][: 64 - len(suffix)] + suffix)
+
+
+def null_refs_to_blank(apps, schema_editor):
+    for name in ("WalletTxn", "WalletTxnArchive"):
+        apps.get_model("main", name).objects.filter(external_ref__isnull=True).update(external_ref="")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0044_progress_template_deck'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='wallettxn',
+            name='uniq_wallet_external_ref',
+        ),
+        migrations.RemoveConstraint(
+            model_name='wallettxnarchive',
+            name='uniq_archive_wallet_external_ref',
+        ),
+        migrations.AlterField(
+            model_name='wallettxn',
+            name='external_ref',
+            field=models.CharField(blank=True, db_index=True, default=None, max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name='wallettxnarchive',
+            name='external_ref',
+            field=models.CharField(blank=True, default=None, max_length=64, null=True),
+        ),
+        migrations.RunPython(blank_refs_to_null, null_refs_to_blank),
+        migrations.AddConstraint(
+            model_name='wallettxn',
+            constraint=models.UniqueConstraint(fields=('wallet', 'external_ref'), name='uniq_wallet_external_ref'),
+        ),
+        migrations.AddConstraint(
+            model_name='wallettxnarchive',
+            constraint=models.UniqueConstraint(fields=('wallet', 'external_ref'), name='uniq_archive_wallet_external_ref'),
+        ),
+    ]
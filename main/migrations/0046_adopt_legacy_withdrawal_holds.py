@@ -0,0 +1,82 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:26
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+CHUNK = 500
+
+
+def adopt_legacy_withdrawals(apps, schema_editor):
+    """
+    Withdrawals requested before holds existed moved `amount_cents` from balance_cents
+    into pending_cents and nothing else; approving one would debit amount + fee from
+    balance_cents and leave pending_cents stuck. Give each such request a HELD hold
+    for amount + fee (the fee moves from balance to pending now, as approve would have
+    charged it), so approve captures it and fail releases it like any other request.
+
+    A request is only adopted while the wallet's un-held pending_cents still covers its
+    amount and no wd:<id> row is in the ledger; anything else keeps the debit_once path.
+    """
+    WithdrawalRequest = apps.get_model("main", "WithdrawalRequest")
+    Wallet = apps.get_model("main", "Wallet")
+    WalletHold = apps.get_model("main", "WalletHold")
+    WalletTxn = apps.get_model("main", "WalletTxn")
+
+    last_pk = 0
+    while True:
+        reqs = list(
+            WithdrawalRequest.objects.filter(pk__gt=last_pk, status="pending", holds__isnull=True)
+            .order_by("pk")
+            .values_list("pk", "user_id", "amount_cents", "fee_cents")[:CHUNK]
+        )
+        if not reqs:
+            break
+        last_pk = reqs[-1][0]
+
+        wallets = {
+            w.user_id: w for w in Wallet.objects.filter(user_id__in={r[1] for r in reqs}).only("pk", "user_id", "pending_cents")
+        }
+        held = dict(
+            WalletHold.objects.filter(wallet__in=wallets.values(), status="HELD")
+            .values("wallet_id")
+            .annotate(total=Sum("amount_cents"))
+            .values_list("wallet_id", "total")
+        )
+        posted = set(
+            WalletTxn.objects.filter(external_ref__in=[f"wd:{r[0]}" for r in reqs]).values_list("external_ref", flat=True)
+        )
+        for pk, user_id, amount, fee in reqs:
+            wallet = wallets.get(user_id)
+            if wallet is None or f"wd:{pk}" in posted:
+                continue
+            free = wallet.pending_cents - held.get(wallet.pk, 0)
+            if free < amount:
+                continue
+            WalletHold.objects.create(wallet_id=wallet.pk, withdrawal_id=pk, amount_cents=amount + fee, status="HELD")
+            held[wallet.pk] = held.get(wallet.pk, 0) + amount + fee
+            if fee:
+                Wallet.objects.filter(pk=wallet.pk).update(
+                    balance_cents=F("balance_cents") - fee,
+                    pending_cents=F("pending_cents") + fee,
+                    version=F("version") + 1,
+                )
+                wallet.pending_cents += fee
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0045_wallettxn_external_ref_null'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='wallethold',
+            name='uniq_hold_per_withdrawal',
+        ),
+        migrations.RunPython(adopt_legacy_withdrawals, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='wallethold',
+            constraint=models.UniqueConstraint(fields=('withdrawal',), name='uniq_hold_per_withdrawal'),
+        ),
+    ]
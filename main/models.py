@@ -1,8 +1,14 @@
 # models.py
 from __future__ import annotations
 from decimal import Decimal
+from contextlib import contextmanager
+from dataclasses import dataclass
+from itertools import islice
+import copy
+import heapq
+import time
 import uuid
-import random
+from types import SimpleNamespace
 from django.db.models import Q
 from django.core.exceptions import ValidationError
 from django.conf import settings
@@ -13,13 +19,15 @@ from django.urls import reverse
 from django.utils.text import slugify
 from django.utils.crypto import get_random_string
 from django.utils import timezone
-from django.db import models, transaction
-from django.db.models import F
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Case, When, Value, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Least
 from django.core.validators import URLValidator
 from typing import Optional
 from django.utils.translation import gettext_lazy as _
 # models.py (top of file)
 from .task_currency import to_cents
+from .ledger_codes import BUCKET_CODES, KIND_CODES, CodedChoiceField, encode_memo, render_memo
 from datetime import timedelta
 from django.contrib.auth.hashers import make_password, check_password
 
@@ -375,9 +383,97 @@ class Network(models.TextChoices):
     ETH   = "ETH", "Ethereum (ERC20)"
     TRC20 = "TRC20", "USDT (TRC20)"
 
+# =======================
+# Optimistic concurrency
+# =======================
+class VersionConflict(Exception):
+    """cas_update() kept losing the race; the caller decides whether to retry later."""
+
+
+class InsufficientFunds(Exception):
+    """Wallet.reserve(): available cash is below the requested hold."""
+
+
+class _VersionedModel(models.Model):
+    """
+    Adds a `version` counter bumped by every write:
+      - cas_update(): read → compute → UPDATE … WHERE version = <read>; retry on conflict
+      - save(): blind writes still bump it (SQL `version + 1`), so a CAS never
+        overwrites a concurrent save unnoticed
+    Raw queryset updates of these models must also bump `version=F("version") + 1`.
+    """
+    version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+        self.version = F("version") + 1
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "version"}
+        super().save(*args, **kwargs)
+        del self.__dict__["version"]   # deferred: re-read on next access
+
+    @classmethod
+    def cas_update(cls, pk, mutate, *, attempts: int = 5):
+        """
+        Compare-and-swap one row without holding a lock across the read.
+          - mutate(obj) returns {field: new_value}, or None to abort (nothing written)
+          - conflicting writers make the UPDATE match 0 rows → re-read and retry
+        Returns the object with the new values applied, or None if mutate aborted.
+        Raises VersionConflict after `attempts` lost races.
+        """
+        for _ in range(max(1, attempts)):
+            obj = cls.objects.get(pk=pk)
+            changes = mutate(obj)
+            if changes is None:
+                return None
+            if any(f.name == "updated_at" for f in cls._meta.concrete_fields):
+                changes.setdefault("updated_at", timezone.now())
+            won = cls.objects.filter(pk=pk, version=obj.version).update(version=F("version") + 1, **changes)
+            if won:
+                for field, value in changes.items():
+                    setattr(obj, field, value)
+                obj.version += 1
+                # queryset.update() skips post_save; both versioned models feed the summary cache
+                from .user_summary import invalidate_user_summary
+                invalidate_user_summary(getattr(obj, "user_id", None))
+                return obj
+        raise VersionConflict(f"{cls.__name__} #{pk}: gave up after {attempts} conflicting writes")
+
+
+@contextmanager
+def _conflict_as_validation_error():
+    """For user-facing entry points: a lost CAS race (already rolled back) reads as a retryable error."""
+    try:
+        yield
+    except VersionConflict:
+        raise ValidationError("Your account was being updated at the same moment — please try again.")
+
+
 #wallet balance and bonus
 
-class Wallet(models.Model):
+@dataclass(frozen=True)
+class LedgerEntry:
+    """
+    One line of a batched wallet posting (see Wallet.post_batch).
+      - amount_cents is signed: positive = credit, negative = debit.
+      - external_ref (optional) makes the line idempotent per wallet.
+    """
+    wallet_id: int
+    amount_cents: int
+    bucket: str = "CASH"
+    kind: str = "ADJUST"
+    memo: str = ""
+    external_ref: str = ""
+    withdrawal_id: Optional[int] = None   # WalletTxn.withdrawal link
+    deposit_id: Optional[int] = None      # WalletTxn.deposit link
+
+
+class Wallet(_VersionedModel):
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="wallet"
     )
@@ -394,6 +490,9 @@ class Wallet(models.Model):
     # Mark when the signup trial bonus was granted (None = not yet)
     trial_bonus_at = models.DateTimeField(blank=True, null=True)
 
+    # Ledger rows created before this were moved to WalletTxnArchive (None = nothing archived)
+    archived_upto = models.DateTimeField(blank=True, null=True)
+
     # --- Helpers ---
     def balance(self) -> float:
         """Total balance in EUR as float (cash + bonus)."""
@@ -417,7 +516,51 @@ class Wallet(models.Model):
     # -----------------------
     # Idempotent new helpers
     # -----------------------
-    def credit_once(self, amount_cents, *, bucket="CASH", kind="ADJUST", memo="", external_ref=None, created_by=None) -> bool:
+    def _post_once(self, signed_cents: int, *, bucket, kind, memo, external_ref, created_by, withdrawal=None, deposit=None,
+                   field=None) -> bool:
+        """
+        Insert-first posting: the ledger row goes in first, inside a savepoint.
+          - A uniq_wallet_external_ref violation means the event was already applied (return False).
+          - Otherwise move `field` (default: the bucket's column) with one F() UPDATE (return True).
+        """
+        field = field or ("balance_cents" if bucket == "CASH" else "bonus_cents")
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    WalletTxn.objects.create(
+                        wallet=self,
+                        amount_cents=signed_cents,
+                        kind=kind,
+                        bucket=bucket,
+                        memo=memo,
+                        external_ref=external_ref or None,
+                        created_by=created_by,
+                        withdrawal=withdrawal,
+                        deposit=deposit,
+                    )
+                    # The unique index only covers the live table; wallets with archived
+                    # rows pay one extra probe so an old key can't be applied twice.
+                    if external_ref and self.archived_upto and WalletTxnArchive.objects.filter(
+                        wallet=self, external_ref=external_ref
+                    ).exists():
+                        raise IntegrityError("external_ref already applied (archived)")
+            except IntegrityError:
+                # Only swallow the idempotency conflict; anything else is a real error
+                if external_ref and self._ref_applied(external_ref):
+                    return False
+                raise
+
+            Wallet.objects.filter(pk=self.pk).update(**{field: F(field) + signed_cents, "version": F("version") + 1})
+            return True
+
+    def _ref_applied(self, external_ref: str) -> bool:
+        return (
+            WalletTxn.objects.filter(wallet=self, external_ref=external_ref).exists()
+            or WalletTxnArchive.objects.filter(wallet=self, external_ref=external_ref).exists()
+        )
+
+    def credit_once(self, amount_cents, *, bucket="CASH", kind="ADJUST", memo="", external_ref=None, created_by=None,
+                    withdrawal=None, deposit=None) -> bool:
         """
         Idempotent credit:
           - If external_ref is provided and already exists for this wallet, do nothing (return False).
@@ -428,27 +571,19 @@ class Wallet(models.Model):
         if bucket not in ("CASH", "BONUS"):
             raise ValueError("bucket must be 'CASH' or 'BONUS'")
 
-        with transaction.atomic():
-            if external_ref and WalletTxn.objects.filter(wallet=self, external_ref=external_ref).exists():
-                return False
-
-            if bucket == "CASH":
-                Wallet.objects.filter(pk=self.pk).update(balance_cents=F("balance_cents") + amount_cents)
-            else:
-                Wallet.objects.filter(pk=self.pk).update(bonus_cents=F("bonus_cents") + amount_cents)
-
-            WalletTxn.objects.create(
-                wallet=self,
-                amount_cents=amount_cents,
-                kind=kind,
-                bucket=bucket,
-                memo=memo,
-                external_ref=external_ref or "",
-                created_by=created_by,
-            )
-            return True
+        return self._post_once(
+            amount_cents,
+            bucket=bucket,
+            kind=kind,
+            memo=memo,
+            external_ref=external_ref,
+            created_by=created_by,
+            withdrawal=withdrawal,
+            deposit=deposit,
+        )
 
-    def debit_once(self, amount_cents, *, bucket="CASH", kind="ADJUST", memo="", external_ref=None, created_by=None) -> bool:
+    def debit_once(self, amount_cents, *, bucket="CASH", kind="ADJUST", memo="", external_ref=None, created_by=None,
+                   withdrawal=None, deposit=None) -> bool:
         """
         Idempotent debit (stored as negative in ledger):
           - If external_ref exists for this wallet, do nothing (return False).
@@ -459,25 +594,184 @@ class Wallet(models.Model):
         if bucket not in ("CASH", "BONUS"):
             raise ValueError("bucket must be 'CASH' or 'BONUS'")
 
+        return self._post_once(
+            -amount_cents,
+            bucket=bucket,
+            kind=kind,
+            memo=memo,
+            external_ref=external_ref,
+            created_by=created_by,
+            withdrawal=withdrawal,
+            deposit=deposit,
+        )
+
+    # -----------------------
+    # Batched posting (many wallets, one transaction)
+    # -----------------------
+    @classmethod
+    def post_batch(cls, entries, *, created_by=None) -> list[LedgerEntry]:
+        """
+        Apply many ledger entries (possibly across many wallets) in ONE transaction:
+          - Wallet rows are locked in pk order (no deadlocks against other batches).
+          - Entries whose (wallet, external_ref) is already in the ledger are skipped,
+            as are duplicates inside the batch itself.
+          - One set-based UPDATE per bucket (CASE on pk) + one bulk_create of WalletTxn.
+        Returns the entries that were actually applied.
+        """
+        entries = list(entries)
+        for e in entries:
+            if not e.amount_cents:
+                raise ValueError("post_batch() requires non-zero amount_cents")
+            if e.bucket not in ("CASH", "BONUS"):
+                raise ValueError("bucket must be 'CASH' or 'BONUS'")
+        if not entries:
+            return []
+
         with transaction.atomic():
-            if external_ref and WalletTxn.objects.filter(wallet=self, external_ref=external_ref).exists():
-                return False
+            wallet_ids = sorted({e.wallet_id for e in entries})
+            owners = dict(cls.objects.select_for_update().filter(pk__in=wallet_ids).order_by("pk").values_list("pk", "user_id"))
+
+            refs = {e.external_ref for e in entries if e.external_ref}
+            seen = set()
+            if refs:
+                for model in (WalletTxn, WalletTxnArchive):
+                    seen.update(
+                        model.objects
+                        .filter(wallet_id__in=wallet_ids, external_ref__in=refs)
+                        .values_list("wallet_id", "external_ref")
+                    )
+
+            applied = []
+            for e in entries:
+                if e.external_ref:
+                    key = (e.wallet_id, e.external_ref)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                applied.append(e)
+            if not applied:
+                return []
+
+            # ---- per-bucket deltas ----
+            deltas = {"CASH": {}, "BONUS": {}}
+            for e in applied:
+                bucket = deltas[e.bucket]
+                bucket[e.wallet_id] = bucket.get(e.wallet_id, 0) + int(e.amount_cents)
+
+            for bucket, field in (("CASH", "balance_cents"), ("BONUS", "bonus_cents")):
+                per_wallet = {wid: d for wid, d in deltas[bucket].items() if d}
+                if not per_wallet:
+                    continue
+                delta = Case(
+                    *[When(pk=wid, then=Value(d)) for wid, d in per_wallet.items()],
+                    default=Value(0),
+                    output_field=models.BigIntegerField(),
+                )
+                cls.objects.filter(pk__in=list(per_wallet)).update(**{field: F(field) + delta, "version": F("version") + 1})
+
+            rows = [
+                WalletTxn(
+                    wallet_id=e.wallet_id,
+                    amount_cents=e.amount_cents,
+                    kind=e.kind,
+                    bucket=e.bucket,
+                    memo=e.memo,
+                    external_ref=e.external_ref or None,
+                    created_by=created_by,
+                    withdrawal_id=e.withdrawal_id,
+                    deposit_id=e.deposit_id,
+                )
+                for e in applied
+            ]
+            for t in rows:
+                t.pack_memo()   # bulk_create skips save()
+            txns = WalletTxn.objects.bulk_create(rows)
+            # bulk_create skips post_save: drop cached summaries and write the outbox rows here
+            from .outbox import emit_many, wallet_txn_payload
+            from .user_summary import invalidate_user_summary
+            invalidate_user_summary(*{owners.get(e.wallet_id) for e in applied})
+            from .activity import bump_many, txn_deltas
+            bump_many((owners.get(t.wallet_id), txn_deltas(t.kind, t.amount_cents)) for t in txns)
+            emit_many(
+                ("wallet_txn.created", wallet_txn_payload(t, user_id=owners.get(t.wallet_id)))
+                for t in txns
+            )
+            return applied
 
-            if bucket == "CASH":
-                Wallet.objects.filter(pk=self.pk).update(balance_cents=F("balance_cents") - amount_cents)
-            else:
-                Wallet.objects.filter(pk=self.pk).update(bonus_cents=F("bonus_cents") - amount_cents)
+    # -----------------------------
+    # Holds: reserve → capture | release
+    # -----------------------------
+    # balance_cents is what's available, pending_cents what's held; the CASH ledger
+    # equals balance + pending until a hold is captured (that's when the row is written).
+    def reserve(self, amount_cents: int, *, withdrawal=None) -> "WalletHold":
+        """
+        Move `amount_cents` from available cash into a hold.
+        One conditional UPDATE (balance_cents >= amount) + one hold row; raises InsufficientFunds.
+        """
+        amount_cents = int(amount_cents)
+        if amount_cents <= 0:
+            raise ValueError("reserve() requires positive amount_cents")
+        with transaction.atomic():
+            moved = Wallet.objects.filter(pk=self.pk, balance_cents__gte=amount_cents).update(
+                balance_cents=F("balance_cents") - amount_cents,
+                pending_cents=F("pending_cents") + amount_cents,
+                version=F("version") + 1,
+            )
+            if not moved:
+                raise InsufficientFunds(f"Wallet #{self.pk}: cannot hold {amount_cents} cents")
+            hold = WalletHold.objects.create(wallet=self, amount_cents=amount_cents, withdrawal=withdrawal)
+        self._holds_changed()
+        return hold
 
-            WalletTxn.objects.create(
-                wallet=self,
-                amount_cents=-amount_cents,
+    def capture(self, hold: "WalletHold", *, kind="WITHDRAW", memo="", external_ref="", created_by=None) -> bool:
+        """
+        Settle a hold: write the debit ledger row and drop it from pending (balance was already reduced).
+        The row goes through _post_once, so `external_ref` is idempotent like any other post.
+        Returns False if the hold was no longer HELD, or if `external_ref` was already posted
+        (debited from available cash some other way): the hold is then released instead.
+        """
+        amount = int(hold.amount_cents)
+        with transaction.atomic():
+            if not hold._settle(WalletHold.Status.CAPTURED):
+                return False
+            posted = self._post_once(
+                -amount,
+                bucket="CASH",
                 kind=kind,
-                bucket=bucket,
                 memo=memo,
-                external_ref=external_ref or "",
+                external_ref=external_ref,
                 created_by=created_by,
+                withdrawal=hold.withdrawal,
+                field="pending_cents",
             )
-            return True
+            if not posted:
+                WalletHold.objects.filter(pk=hold.pk).update(status=WalletHold.Status.RELEASED)
+                hold.status = WalletHold.Status.RELEASED
+                Wallet.objects.filter(pk=self.pk).update(
+                    balance_cents=F("balance_cents") + amount,
+                    pending_cents=F("pending_cents") - amount,
+                    version=F("version") + 1,
+                )
+        self._holds_changed()
+        return posted
+
+    def release(self, hold: "WalletHold") -> bool:
+        """Give a hold back to available cash. Returns False if it was no longer HELD."""
+        with transaction.atomic():
+            if not hold._settle(WalletHold.Status.RELEASED):
+                return False
+            Wallet.objects.filter(pk=self.pk).update(
+                balance_cents=F("balance_cents") + int(hold.amount_cents),
+                pending_cents=F("pending_cents") - int(hold.amount_cents),
+                version=F("version") + 1,
+            )
+        self._holds_changed()
+        return True
+
+    def _holds_changed(self):
+        # queryset.update() skips post_save
+        from .user_summary import invalidate_user_summary
+        invalidate_user_summary(self.user_id)
 
     # -----------------------------
     # Your original, unchanged APIs
@@ -493,9 +787,9 @@ class Wallet(models.Model):
 
         with transaction.atomic():
             if bucket == "CASH":
-                Wallet.objects.filter(pk=self.pk).update(balance_cents=F("balance_cents") + amount_cents)
+                Wallet.objects.filter(pk=self.pk).update(balance_cents=F("balance_cents") + amount_cents, version=F("version") + 1)
             else:
-                Wallet.objects.filter(pk=self.pk).update(bonus_cents=F("bonus_cents") + amount_cents)
+                Wallet.objects.filter(pk=self.pk).update(bonus_cents=F("bonus_cents") + amount_cents, version=F("version") + 1)
 
             WalletTxn.objects.create(
                 wallet=self,
@@ -503,7 +797,7 @@ class Wallet(models.Model):
                 kind=kind,
                 bucket=bucket,
                 memo=memo,
-                external_ref="",   # legacy
+                external_ref=None,   # legacy
                 created_by=created_by,
             )
 
@@ -518,9 +812,9 @@ class Wallet(models.Model):
 
         with transaction.atomic():
             if bucket == "CASH":
-                Wallet.objects.filter(pk=self.pk).update(balance_cents=F("balance_cents") - amount_cents)
+                Wallet.objects.filter(pk=self.pk).update(balance_cents=F("balance_cents") - amount_cents, version=F("version") + 1)
             else:
-                Wallet.objects.filter(pk=self.pk).update(bonus_cents=F("bonus_cents") - amount_cents)
+                Wallet.objects.filter(pk=self.pk).update(bonus_cents=F("bonus_cents") - amount_cents, version=F("version") + 1)
 
             WalletTxn.objects.create(
                 wallet=self,
@@ -528,15 +822,50 @@ class Wallet(models.Model):
                 kind=kind,
                 bucket=bucket,
                 memo=memo,
-                external_ref="",   # legacy
+                external_ref=None,   # legacy
                 created_by=created_by,
             )
 
 
-class WalletTxn(models.Model):
+class _LedgerMemo(models.Model):
+    """
+    Memo storage shared by the live and archived ledger (see main.ledger_codes):
+      - templated memos: memo_code + memo_args, `memo` left blank
+      - anything else: free text in `memo`
+    Read memo_text, not memo.
+    """
+    memo = models.CharField(max_length=255, blank=True)
+    memo_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    memo_args = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def memo_text(self) -> str:
+        if self.memo_code is None:
+            return self.memo
+        return render_memo(self.memo_code, self.memo_args)
+
+    def pack_memo(self):
+        """Move a memo that matches a template into memo_code/memo_args (bulk_create callers use this)."""
+        if self.memo and self.memo_code is None:
+            packed = encode_memo(self.memo)
+            if packed:
+                self.memo_code, self.memo_args = packed
+                self.memo = ""
+
+    def save(self, *args, **kwargs):
+        if kwargs.get("update_fields") is None:
+            self.pack_memo()
+        super().save(*args, **kwargs)
+
+
+class WalletTxn(_LedgerMemo):
     """
     Ledger row for wallet movements.
     Positive amount_cents = credit, negative = debit.
+    kind/bucket are small-int columns that read and filter as their names.
     """
     KIND_CHOICES = [
         ("BONUS", "Bonus"),
@@ -551,18 +880,26 @@ class WalletTxn(models.Model):
 
     wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name="txns")
     amount_cents = models.BigIntegerField(default=0)  # positive for credits, negative for debits
-    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
-    bucket = models.CharField(max_length=10, choices=BUCKET_CHOICES, default="CASH")
-    memo = models.CharField(max_length=255, blank=True)
+    kind = CodedChoiceField(codes=KIND_CODES, choices=KIND_CHOICES)
+    bucket = CodedChoiceField(codes=BUCKET_CODES, choices=BUCKET_CHOICES, default="CASH")
 
-    # NEW: idempotency key (blank allowed for legacy). Use per wallet + business event.
-    external_ref = models.CharField(max_length=64, blank=True, default="", db_index=True)
+    # Idempotency key per wallet + business event; NULL (not "") when there is none,
+    # so the unique constraint below can be unconditional (MySQL has no partial indexes).
+    external_ref = models.CharField(max_length=64, null=True, blank=True, default=None, db_index=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
     )
 
+    # The request this row settles (set on approve/confirm; legacy rows via `link_wallet_txns`)
+    withdrawal = models.ForeignKey(
+        "WithdrawalRequest", null=True, blank=True, on_delete=models.SET_NULL, related_name="ledger_rows"
+    )
+    deposit = models.ForeignKey(
+        "DepositRequest", null=True, blank=True, on_delete=models.SET_NULL, related_name="ledger_rows"
+    )
+
     class Meta:
         ordering = ("-created_at",)
         indexes = [
@@ -570,12 +907,8 @@ class WalletTxn(models.Model):
             models.Index(fields=["wallet", "external_ref"]),
         ]
         constraints = [
-            # Enforce uniqueness for non-blank external_ref per wallet (allows many blank legacy rows)
-            models.UniqueConstraint(
-                fields=["wallet", "external_ref"],
-                name="uniq_wallet_external_ref",
-                condition=~models.Q(external_ref="")
-            )
+            # One row per (wallet, external_ref); rows without a key are NULL and never collide
+            models.UniqueConstraint(fields=["wallet", "external_ref"], name="uniq_wallet_external_ref"),
         ]
 
     @property
@@ -588,6 +921,435 @@ class WalletTxn(models.Model):
         return f"{self.wallet.user} {self.kind}/{self.bucket} {sign}€{abs(self.amount_cents)/100:.2f}"
 
 
+class WalletTxnArchive(_LedgerMemo):
+    """
+    Cold copy of WalletTxn rows moved out of the live table by `archive_wallet_txns`.
+    Keeps the original id; `month` (first day of created_at's month) leads an index so
+    each month's rows sit together and can be dropped/exported as a unit.
+    """
+    id = models.BigIntegerField(primary_key=True)  # original WalletTxn id
+    month = models.DateField()
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name="archived_txns")
+    amount_cents = models.BigIntegerField(default=0)
+    kind = CodedChoiceField(codes=KIND_CODES, choices=WalletTxn.KIND_CHOICES)
+    bucket = CodedChoiceField(codes=BUCKET_CODES, choices=WalletTxn.BUCKET_CHOICES, default="CASH")
+    external_ref = models.CharField(max_length=64, null=True, blank=True, default=None)
+    created_at = models.DateTimeField()
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
+    )
+    withdrawal = models.ForeignKey(
+        "WithdrawalRequest", null=True, blank=True, on_delete=models.SET_NULL, related_name="archived_ledger_rows"
+    )
+    deposit = models.ForeignKey(
+        "DepositRequest", null=True, blank=True, on_delete=models.SET_NULL, related_name="archived_ledger_rows"
+    )
+
+    class Meta:
+        ordering = ("-created_at",)
+        indexes = [
+            models.Index(fields=["wallet", "-created_at"]),
+            models.Index(fields=["month", "wallet"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["wallet", "external_ref"], name="uniq_archive_wallet_external_ref"),
+        ]
+
+    amount_eur = WalletTxn.amount_eur
+
+    def __str__(self):
+        sign = "+" if self.amount_cents >= 0 else "-"
+        return f"{self.wallet.user} {self.kind}/{self.bucket} {sign}€{abs(self.amount_cents)/100:.2f} (archived)"
+
+
+class LedgerHistory:
+    """
+    Newest-first, read-only view over a wallet's live + archived ledger rows.
+      - count()/len() and slicing, so it drops into Paginator and templates.
+      - A slice fetches at most `stop` rows from each table and merges them.
+    """
+    def __init__(self, wallet, **filters):
+        self.wallet = wallet
+        self.filters = filters
+        order = ("-created_at", "-id")
+        self.live = WalletTxn.objects.filter(wallet=wallet, **filters).order_by(*order)
+        if getattr(wallet, "archived_upto", None):
+            self.archived = WalletTxnArchive.objects.filter(wallet=wallet, **filters).order_by(*order)
+        else:
+            self.archived = WalletTxnArchive.objects.none()
+        self._count = None
+
+    def filter(self, **filters) -> "LedgerHistory":
+        return LedgerHistory(self.wallet, **{**self.filters, **filters})
+
+    def count(self) -> int:
+        if self._count is None:
+            self._count = self.live.count() + self.archived.count()
+        return self._count
+
+    __len__ = count
+
+    def __bool__(self):
+        return self.live.exists() or self.archived.exists()
+
+    @staticmethod
+    def _merge(*sources):
+        return heapq.merge(*sources, key=lambda t: (t.created_at, t.id), reverse=True)
+
+    def __iter__(self):
+        return iter(self._merge(self.live.iterator(), self.archived.iterator()))
+
+    def __getitem__(self, k):
+        if isinstance(k, int):
+            rows = self[k:k + 1]
+            if not rows:
+                raise IndexError(k)
+            return rows[0]
+        start = k.start or 0
+        stop = k.stop if k.stop is not None else self.count()
+        return list(islice(self._merge(self.live[:stop], self.archived[:stop]), start, stop))
+
+
+# =======================
+# Wallet holds
+# =======================
+class WalletHold(models.Model):
+    """
+    Cash set aside for a pending withdrawal (see Wallet.reserve / capture / release).
+    """
+    class Status(models.TextChoices):
+        HELD     = "HELD", "Held"
+        CAPTURED = "CAPTURED", "Captured"
+        RELEASED = "RELEASED", "Released"
+
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name="holds")
+    withdrawal = models.ForeignKey(
+        "WithdrawalRequest", null=True, blank=True, on_delete=models.SET_NULL, related_name="holds"
+    )
+    amount_cents = models.BigIntegerField()
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.HELD)
+    created_at = models.DateTimeField(auto_now_add=True)
+    settled_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["wallet", "status"]),
+        ]
+        constraints = [
+            # unconditional: MySQL has no partial indexes, and repeated NULLs never collide
+            models.UniqueConstraint(fields=["withdrawal"], name="uniq_hold_per_withdrawal"),
+        ]
+
+    def __str__(self):
+        return f"Hold #{self.pk} {self.amount_cents}c [{self.status}]"
+
+    def _settle(self, status) -> bool:
+        """HELD → status, as a conditional UPDATE (the only writer that wins)."""
+        now = timezone.now()
+        won = WalletHold.objects.filter(pk=self.pk, status=self.Status.HELD).update(status=status, settled_at=now)
+        if won:
+            self.status, self.settled_at = status, now
+        return bool(won)
+
+
+# =======================
+# Ledger checkpoints
+# =======================
+class WalletCheckpoint(models.Model):
+    """
+    Per-bucket ledger sums for one wallet, covering every WalletTxn with id <= last_txn_id.
+    Balance/drift checks start from the newest checkpoint and only sum rows after it.
+    """
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name="checkpoints")
+    last_txn_id = models.BigIntegerField()          # watermark (inclusive)
+    as_of = models.DateTimeField()                  # created_at of the watermark row
+    cash_cents = models.BigIntegerField(default=0)
+    bonus_cents = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ("-last_txn_id",)
+        indexes = [
+            models.Index(fields=["wallet", "-last_txn_id"]),
+            models.Index(fields=["wallet", "-as_of"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["wallet", "last_txn_id"], name="uniq_wallet_checkpoint_watermark"),
+        ]
+
+    def __str__(self):
+        return f"Checkpoint({self.wallet_id} @ txn {self.last_txn_id})"
+
+
+# Only checkpoint rows older than this, so a txn that got its id early but
+# committed late can never land below an existing watermark.
+CHECKPOINT_SAFETY_LAG = timedelta(minutes=5)
+
+
+def latest_checkpoint_txn_id():
+    """Subquery: watermark of the newest checkpoint for OuterRef("wallet_id")."""
+    return Subquery(
+        WalletCheckpoint.objects
+        .filter(wallet_id=OuterRef("wallet_id"))
+        .order_by("-last_txn_id")
+        .values("last_txn_id")[:1]
+    )
+
+
+def _ledger_sums(qs) -> dict:
+    sums = {"CASH": 0, "BONUS": 0}
+    for bucket, total in qs.values("bucket").annotate(total=models.Sum("amount_cents")).values_list("bucket", "total"):
+        sums[bucket] = sums.get(bucket, 0) + int(total or 0)
+    return sums
+
+
+def ledger_balance(wallet, *, as_of=None) -> dict:
+    """
+    Ledger sum per bucket ({"CASH": .., "BONUS": ..}) for `wallet`, optionally as of a moment.
+      - Starts from the newest checkpoint at/before `as_of`.
+      - Sums only the WalletTxn rows after its watermark.
+    """
+    cps = WalletCheckpoint.objects.filter(wallet=wallet)
+    txns = WalletTxn.objects.filter(wallet=wallet)
+    if as_of is not None:
+        cps = cps.filter(as_of__lte=as_of)
+        txns = txns.filter(created_at__lte=as_of)
+
+    cp = cps.order_by("-last_txn_id").first()
+    if cp:
+        txns = txns.filter(id__gt=cp.last_txn_id)
+
+    tail = _ledger_sums(txns)
+    if getattr(wallet, "archived_upto", None):
+        # archived rows are normally covered by a checkpoint; older as_of lookups may still need them
+        old = WalletTxnArchive.objects.filter(wallet=wallet)
+        if as_of is not None:
+            old = old.filter(created_at__lte=as_of)
+        if cp:
+            old = old.filter(id__gt=cp.last_txn_id)
+        for bucket, total in _ledger_sums(old).items():
+            tail[bucket] = tail.get(bucket, 0) + total
+    return {
+        "CASH": (cp.cash_cents if cp else 0) + tail["CASH"],
+        "BONUS": (cp.bonus_cents if cp else 0) + tail["BONUS"],
+    }
+
+
+def ledger_drift(wallet) -> dict:
+    """
+    Stored column minus ledger sum, per bucket. All zeros = wallet reconciles.
+    Held cash (pending_cents) is still in the CASH ledger until the hold is captured.
+    """
+    sums = ledger_balance(wallet)
+    return {
+        "CASH": int(wallet.balance_cents or 0) + int(wallet.pending_cents or 0) - sums["CASH"],
+        "BONUS": int(wallet.bonus_cents or 0) - sums["BONUS"],
+    }
+
+
+def checkpoint_wallets(wallet_ids, *, upto_txn_id=None) -> int:
+    """
+    Write a fresh checkpoint for each wallet in `wallet_ids` that has ledger rows past
+    its last watermark (up to `upto_txn_id`, default = newest row older than the safety lag).
+    Two aggregate queries per call, one bulk_create. Returns number of checkpoints written.
+    """
+    wallet_ids = list(wallet_ids)
+    if not wallet_ids:
+        return 0
+
+    if upto_txn_id is None:
+        upto_txn_id = (
+            WalletTxn.objects
+            .filter(created_at__lte=timezone.now() - CHECKPOINT_SAFETY_LAG)
+            .aggregate(m=models.Max("id"))["m"]
+        )
+        if not upto_txn_id:
+            return 0
+
+    last_cp_id = latest_checkpoint_txn_id()
+    fresh = (
+        WalletTxn.objects
+        .filter(wallet_id__in=wallet_ids, id__lte=upto_txn_id)
+        .annotate(watermark=Coalesce(last_cp_id, Value(0), output_field=models.BigIntegerField()))
+        .filter(id__gt=F("watermark"))
+        .values("wallet_id", "bucket")
+        .annotate(total=models.Sum("amount_cents"), top=models.Max("id"))
+    )
+
+    delta = {}
+    for row in fresh:
+        d = delta.setdefault(row["wallet_id"], {"CASH": 0, "BONUS": 0, "top": 0})
+        d[row["bucket"]] = d.get(row["bucket"], 0) + int(row["total"] or 0)
+        d["top"] = max(d["top"], row["top"])
+    if not delta:
+        return 0
+
+    prev = {
+        cp.wallet_id: cp
+        for cp in WalletCheckpoint.objects
+        .filter(wallet_id__in=list(delta))
+        .filter(last_txn_id=last_cp_id)
+    }
+    as_of = dict(WalletTxn.objects.filter(id__in=[d["top"] for d in delta.values()]).values_list("id", "created_at"))
+
+    rows = []
+    for wid, d in delta.items():
+        cp = prev.get(wid)
+        rows.append(WalletCheckpoint(
+            wallet_id=wid,
+            last_txn_id=d["top"],
+            as_of=as_of[d["top"]],
+            cash_cents=(cp.cash_cents if cp else 0) + d["CASH"],
+            bonus_cents=(cp.bonus_cents if cp else 0) + d["BONUS"],
+        ))
+    WalletCheckpoint.objects.bulk_create(rows, ignore_conflicts=True)
+    return len(rows)
+
+
+# =======================
+# Statement rollups
+# =======================
+class WalletMonthRollup(models.Model):
+    """
+    Per-bucket totals of one closed calendar month (local time) of a wallet's ledger,
+    live + archived rows. Written once by main.statements and never updated:
+    statements take opening balances and month totals from here instead of the ledger.
+    """
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name="month_rollups")
+    month = models.DateField()                      # first day of the month
+    cash_opening_cents = models.BigIntegerField(default=0)
+    cash_in_cents = models.BigIntegerField(default=0)
+    cash_out_cents = models.BigIntegerField(default=0)     # <= 0
+    bonus_opening_cents = models.BigIntegerField(default=0)
+    bonus_in_cents = models.BigIntegerField(default=0)
+    bonus_out_cents = models.BigIntegerField(default=0)    # <= 0
+    txn_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ("wallet", "month")
+        constraints = [
+            models.UniqueConstraint(fields=["wallet", "month"], name="uniq_wallet_month_rollup"),
+        ]
+
+    def __str__(self):
+        return f"Rollup({self.wallet_id} {self.month:%Y-%m})"
+
+    @property
+    def cash_closing_cents(self) -> int:
+        return self.cash_opening_cents + self.cash_in_cents + self.cash_out_cents
+
+    @property
+    def bonus_closing_cents(self) -> int:
+        return self.bonus_opening_cents + self.bonus_in_cents + self.bonus_out_cents
+
+
+# =======================
+# Bulk wallet adjustments
+# =======================
+class WalletAdjustmentImport(models.Model):
+    """
+    One uploaded CSV of manual credits/debits (back office, see main.wallet_import).
+      - VALIDATED: every line parsed; rows wait in WalletAdjustmentRow
+      - REJECTED: at least one bad line; nothing will be applied
+      - APPLYING / DONE: rows are being / have been posted in chunks
+    """
+    class Status(models.TextChoices):
+        VALIDATED = "VALIDATED", "Validated"
+        REJECTED  = "REJECTED", "Rejected"
+        APPLYING  = "APPLYING", "Applying"
+        DONE      = "DONE", "Done"
+
+    filename = models.CharField(max_length=255, blank=True)
+    uploaded_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
+    )
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.VALIDATED)
+    total_rows = models.PositiveIntegerField(default=0)
+    credit_cents = models.BigIntegerField(default=0)
+    debit_cents = models.BigIntegerField(default=0)      # <= 0
+    errors = models.JSONField(default=list, blank=True)   # ["line 7: unknown user '+44…'", …] (capped)
+    error_count = models.PositiveIntegerField(default=0)
+    applied_rows = models.PositiveIntegerField(default=0)
+    skipped_rows = models.PositiveIntegerField(default=0)  # external_ref already in the ledger
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("-created_at",)
+
+    def __str__(self):
+        return f"Import #{self.pk} {self.filename} [{self.status}]"
+
+    @property
+    def done_rows(self) -> int:
+        return self.applied_rows + self.skipped_rows
+
+    @property
+    def percent(self) -> int:
+        return int(100 * self.done_rows / self.total_rows) if self.total_rows else 100
+
+
+class WalletAdjustmentRow(models.Model):
+    """One validated CSV line, waiting to be posted with Wallet.post_batch."""
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "Pending"
+        APPLIED = "APPLIED", "Applied"
+        SKIPPED = "SKIPPED", "Skipped"
+
+    batch = models.ForeignKey(WalletAdjustmentImport, on_delete=models.CASCADE, related_name="rows")
+    line_no = models.PositiveIntegerField()
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name="+")
+    amount_cents = models.BigIntegerField()               # signed
+    bucket = models.CharField(max_length=10, default="CASH")
+    memo = models.CharField(max_length=255, blank=True)
+    external_ref = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+
+    class Meta:
+        ordering = ("batch", "line_no")
+        indexes = [
+            models.Index(fields=["batch", "status", "id"]),
+        ]
+
+    def __str__(self):
+        return f"Import #{self.batch_id} line {self.line_no} [{self.status}]"
+
+
+# =======================
+# Transactional outbox
+# =======================
+class OutboxEvent(models.Model):
+    """
+    Side-effect event written in the same transaction as the change it describes
+    (see main.outbox.emit). `drain_outbox` delivers pending rows to the registered
+    consumers in batches and retries failures with backoff.
+    """
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "Pending"
+        DONE    = "DONE", "Done"
+        DEAD    = "DEAD", "Dead"   # gave up after OUTBOX_MAX_ATTEMPTS
+
+    topic = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=timezone.now)   # next delivery attempt
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("id",)
+        indexes = [
+            models.Index(fields=["status", "available_at"]),
+            models.Index(fields=["topic", "-created_at"]),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.topic} [{self.status}]"
+
+
 # Saved payout addresses (for withdrawals)
 class PayoutAddress(models.Model):
     user = models.ForeignKey(
@@ -785,7 +1547,59 @@ class Announcement(models.Model):
 #Task settings
 
 # ---- Singleton base so we always have exactly one row (pk=1) ----
+class CacheVersion(models.Model):
+    """
+    Shared version counters for process-local caches (the default cache is per-process LocMem).
+    Writers bump a key in the same transaction as the change; readers compare one PK lookup
+    against the version their in-memory copy was built from.
+    """
+    key = models.CharField(max_length=64, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key}@{self.version}"
+
+    @classmethod
+    def current(cls, key: str) -> int:
+        return cls.objects.filter(pk=key).values_list("version", flat=True).first() or 0
+
+    @classmethod
+    def bump(cls, key: str) -> None:
+        if not cls.objects.filter(pk=key).update(version=F("version") + 1, updated_at=timezone.now()):
+            cls.objects.get_or_create(pk=key)
+            cls.objects.filter(pk=key).update(version=F("version") + 1, updated_at=timezone.now())
+
+    @classmethod
+    def bump_many(cls, keys) -> None:
+        """bump() for many keys: one INSERT IGNORE + one UPDATE, rows touched in key order."""
+        keys = sorted(set(keys))
+        if not keys:
+            return
+        cls.objects.bulk_create([cls(pk=k) for k in keys], ignore_conflicts=True)
+        cls.objects.filter(pk__in=keys).update(version=F("version") + 1, updated_at=timezone.now())
+
+
+# ---- singleton read-through cache ----
+# {model class: (CacheVersion, instance, monotonic time of the last version check)}
+_SINGLETONS: dict = {}
+_SINGLETON_EPOCH = [0.0]   # moved on every request_started (see signals.py)
+
+
+def expire_singleton_checks(**kwargs) -> None:
+    """Make the next load() of every singleton re-check its version (once per request)."""
+    _SINGLETON_EPOCH[0] = time.monotonic()
+
+
 class _SingletonModel(models.Model):
+    """
+    Single-row settings table (pk=1) with a process-wide read-through cache.
+      - load() keeps the row in memory and re-checks CacheVersion "singleton:<model>" at most
+        once per request (and every SINGLETON_RECHECK_SECONDS outside requests)
+      - save()/delete() bump that version in the same transaction, so every worker reloads
+        on its next request
+      - callers get a copy, so editing + saving a loaded instance never leaks into the cache
+    """
     class Meta:
         abstract = True
 
@@ -798,11 +1612,38 @@ class _SingletonModel(models.Model):
         # enforce single row at pk=1
         self.pk = 1
         super().save(*args, **kwargs)
+        self._expire_cache()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self._expire_cache()
+        return result
+
+    @classmethod
+    def _cache_key(cls) -> str:
+        return f"singleton:{cls._meta.label_lower}"
+
+    @classmethod
+    def _expire_cache(cls) -> None:
+        _SINGLETONS.pop(cls, None)
+        CacheVersion.bump(cls._cache_key())
 
     @classmethod
     def load(cls):
+        now = time.monotonic()
+        cached = _SINGLETONS.get(cls)
+        if cached is not None:
+            version, obj, checked_at = cached
+            ttl = getattr(settings, "SINGLETON_RECHECK_SECONDS", 5)
+            if checked_at > _SINGLETON_EPOCH[0] and now - checked_at < ttl:
+                return copy.copy(obj)
+            if CacheVersion.current(cls._cache_key()) == version:
+                _SINGLETONS[cls] = (version, obj, now)
+                return copy.copy(obj)
+        version = CacheVersion.current(cls._cache_key())
         obj, _ = cls.objects.get_or_create(pk=1)
-        return obj
+        _SINGLETONS[cls] = (version, obj, now)
+        return copy.copy(obj)
 
 
 class tasksettngs(_SingletonModel):
@@ -864,30 +1705,26 @@ class tasksettngs(_SingletonModel):
 def _wallet_credit_idem(wallet, amount_cents: int, *, memo: str, bucket="CASH", kind="ADJUST", external_ref: str = ""):
     if amount_cents <= 0:
         return False
-    if hasattr(wallet, "credit_once"):
-        return wallet.credit_once(
-            amount_cents,
-            bucket=bucket,
-            kind=kind,
-            memo=memo,
-            external_ref=external_ref or "",
-        )
-    wallet.credit(amount_cents, bucket=bucket, kind=kind, memo=memo)
-    return True
+    # insert-first: a duplicate external_ref comes back as False, no pre-check query
+    return wallet.credit_once(
+        amount_cents,
+        bucket=bucket,
+        kind=kind,
+        memo=memo,
+        external_ref=external_ref or "",
+    )
 
 def _wallet_debit_idem(wallet, amount_cents: int, *, memo: str, bucket="CASH", kind="ADJUST", external_ref: str = ""):
     if amount_cents <= 0:
         return False
-    if hasattr(wallet, "debit_once"):
-        return wallet.debit_once(
-            amount_cents,
-            bucket=bucket,
-            kind=kind,
-            memo=memo,
-            external_ref=external_ref or "",
-        )
-    wallet.debit(amount_cents, bucket=bucket, kind=kind, memo=memo)
-    return True
+    # insert-first: a duplicate external_ref comes back as False, no pre-check query
+    return wallet.debit_once(
+        amount_cents,
+        bucket=bucket,
+        kind=kind,
+        memo=memo,
+        external_ref=external_ref or "",
+    )
 
 
 
@@ -981,108 +1818,126 @@ class UserTask(models.Model):
                 raise ValidationError("Insufficient funds — please deposit the task price and try again.")
 
             # Auto-approve inline (idempotent + locked). We do NOT debit price.
-            self._auto_approve_admin_inline()
+            with _conflict_as_validation_error():
+                self._auto_approve_admin_inline()
             return
 
         # Regular / trial → immediate path
-        self._auto_approve_regular()
+        with _conflict_as_validation_error():
+            self._auto_approve_regular()
 
     def _auto_approve_regular(self):
         """
         Finalize a regular/trial task:
-          - Add commission to dividends
-          - Credit wallet with THIS commission now (idempotent)
-          - Mark this commission as 'paid' so admin approvals won't re-pay it
-          - Dashboard: normal
-          - Task -> APPROVED, then advance
+          - Task -> APPROVED with a conditional UPDATE (a second submit finds nothing to claim)
+          - Credit wallet with THIS commission now (idempotent; one ledger insert)
+          - Progress: commission added + marked paid, dashboard normal, advance —
+            one UPDATE (UserTaskProgress.complete_regular)
         """
         from .models import ensure_task_progress  # local import to avoid circulars
+        from .activity import record_task_status
+        from .outbox import emit_task_status
         prog = ensure_task_progress(self.user)
         commission_cents = to_cents(self.commission_used)
-        wallet = self.user.wallet
 
         with transaction.atomic():
-            prog.add_commission(commission_cents)
+            now = timezone.now()
+            old_status = self.status
+            claimed = (type(self).objects
+                       .filter(pk=self.pk, status=self.Status.IN_PROGRESS)
+                       .update(status=self.Status.APPROVED, proof_text=self.proof_text, proof_link=self.proof_link,
+                               submitted_at=now, decided_at=now, updated_at=now))
+            if not claimed:
+                raise ValidationError("Task cannot be submitted in its current state.")
+            self.status = self.Status.APPROVED
+            self.submitted_at = now
+            self.decided_at = now
+            emit_task_status(self, old_status)   # .update() skips post_save
+            record_task_status(self, old_status)
 
             if commission_cents > 0:
                 _wallet_credit_idem(
-                    wallet,
+                    self.user.wallet,
                     int(commission_cents),
                     memo=f"REGULAR_TASK_PAYOUT #{self.pk}",
                     external_ref=f"REGULAR_TASK_PAYOUT#{self.pk}",
                 )
-                # mark paid (clamped)
-                prev_paid = int(getattr(prog, "dividends_paid_cents", 0) or 0)
-                new_paid  = prev_paid + int(commission_cents)
-                max_pay   = int(prog.dividends_cents or 0)
-                prog.dividends_paid_cents = max(0, min(new_paid, max_pay))
-                prog.save(update_fields=["dividends_paid_cents", "updated_at"])
 
-            prog.set_state_normal()
-
-            now = timezone.now()
-            self.status = self.Status.APPROVED
-            self.submitted_at = now
-            self.decided_at = now
-            self.save(update_fields=["proof_text", "proof_link", "status", "submitted_at", "decided_at", "updated_at"])
-
-            prog.advance()
+            prog.user = self.user
+            prog.complete_regular(commission_cents)
 
     def _auto_approve_admin_inline(self):
         """
         Auto-approve ADMIN after strict solvency:
-          - Lock to prevent double-run; exit if already APPROVED.
+          - Claim the task with a conditional UPDATE (exactly one caller wins); exit if already APPROVED.
           - DO NOT debit price (wallet remains whole).
           - Credit wallet: unpaid_old_dividends + THIS admin commission (idempotent).
           - Add THIS admin commission to dividends; mark all dividends PAID.
-          - Dashboard: set settled; approve task; advance.
+          - Dashboard: set settled, add required cash to admin_paid_cents; advance.
+        Progress counters change in one compare-and-swap on UserTaskProgress.version.
         """
         from .models import ensure_task_progress  # local import to avoid circulars
+        from .activity import record_task_status
+        from .outbox import emit_task_status
         price_cents = to_cents(self.price_used)
         admin_commission_cents = to_cents(self.commission_used)
         wallet = self.user.wallet
         prog = ensure_task_progress(self.user)
 
         with transaction.atomic():
-            # Lock & re-check status to avoid duplicate approvals
-            locked = (type(self).objects
-                      .select_for_update()
-                      .only("id", "status")
-                      .get(pk=self.pk))
-            if locked.status == self.Status.APPROVED:
+            # Claim: flip to APPROVED only if nobody else did (replaces the row lock)
+            now = timezone.now()
+            old_status = self.status
+            claimed = (type(self).objects
+                       .filter(pk=self.pk)
+                       .exclude(status=self.Status.APPROVED)
+                       .update(status=self.Status.APPROVED, submitted_at=now, decided_at=now, updated_at=now))
+            if not claimed:
                 return
-
-            # 1) Unpaid old dividends BEFORE adding this admin commission (clamped)
-            div_cents  = int(prog.dividends_cents or 0)
-            paid_cents = int(getattr(prog, "dividends_paid_cents", 0) or 0)
-            paid_cents = max(0, min(paid_cents, div_cents))
-            unpaid_old = div_cents - paid_cents
+            # our claim holds the row now; the in-memory copy may predate a required-cash override
+            required_cents = max(0, int(
+                type(self).objects.filter(pk=self.pk).values_list("required_cash_cents", flat=True).get() or 0
+            ))
+            self.status = self.Status.APPROVED
+            self.submitted_at = now
+            self.decided_at = now
+            emit_task_status(self, old_status)   # .update() skips post_save
+            record_task_status(self, old_status)
+
+            # 1) + 3) + 4) from one consistent read of the progress row
+            payout = {}
+
+            def settle(p):
+                # Unpaid old dividends BEFORE adding this admin commission (clamped)
+                div_cents  = int(p.dividends_cents or 0)
+                paid_cents = max(0, min(int(p.dividends_paid_cents or 0), div_cents))
+                payout["cents"] = (div_cents - paid_cents) + int(admin_commission_cents)
+                # Dividends += this commission, ALL paid; dashboard settled (asset = price)
+                new_div = div_cents + int(admin_commission_cents)
+                changes = {
+                    "dividends_cents": new_div,
+                    "dividends_paid_cents": new_div,
+                    "asset_cents": int(price_cents),
+                    "processing_cents": 0,
+                }
+                # Dashboard aggregate (left NULL until backfilled; the backfill will count this task)
+                if p.admin_approved_count is not None:
+                    changes["admin_approved_count"] = p.admin_approved_count + 1
+                    changes["admin_paid_cents"] = int(p.admin_paid_cents or 0) + required_cents
+                return changes
+
+            prog = UserTaskProgress.cas_update(prog.pk, settle)
 
             # 2) Credit payout = unpaid_old + admin_commission (NEVER price)
-            payout_cents = int(unpaid_old) + int(admin_commission_cents)
-            if payout_cents > 0:
+            if payout["cents"] > 0:
                 _wallet_credit_idem(
                     wallet,
-                    payout_cents,
+                    payout["cents"],
                     memo=f"ADMIN_TASK_PAYOUT #{self.pk}",
                     external_ref=f"ADMIN_TASK_PAYOUT#{self.pk}",
                 )
 
-            # 3) Dividends → add this admin commission & mark ALL dividends paid
-            prog.add_commission(admin_commission_cents)
-            prog.dividends_paid_cents = int(prog.dividends_cents or 0)
-            prog.save(update_fields=["dividends_paid_cents", "updated_at"])
-
-            # 4) Dashboard cache (legacy; final display uses display_totals rules)
-            prog.set_state_admin_approved(price_cents=price_cents)
-
-            # 5) Approve + advance
-            now = timezone.now()
-            self.status = self.Status.APPROVED
-            self.submitted_at = now
-            self.decided_at = now
-            self.save(update_fields=["status", "submitted_at", "decided_at", "updated_at"])
-
+            # 5) Advance
             prog.advance()
 
     # PATCH: compute REQUIRED using CASH ONLY so you don’t need to deposit twice
@@ -1128,7 +1983,8 @@ class UserTask(models.Model):
             raise ValidationError("Task already approved.")
         if self.status != self.Status.SUBMITTED:
             raise ValidationError("Only submitted admin tasks can be approved manually.")
-        self._auto_approve_admin_inline()
+        with _conflict_as_validation_error():
+            self._auto_approve_admin_inline()
 
     def approve_regular(self, *, approved_by=None):
         """Regular/trial tasks auto-complete on submit; no manual approval needed."""
@@ -1185,12 +2041,37 @@ class ForcedTaskDirective(models.Model):
             models.Index(fields=["applies_on_cycle", "target_order"]),
             models.Index(fields=["expires_at"]),
             models.Index(fields=["created_at"]),
+            models.Index(fields=["batch_id", "status"]),
         ]
         ordering = ["target_order", "created_at"]
 
     def __str__(self):
         return f"Force u={self.user} cyc={self.applies_on_cycle} → {self.target_order} [{self.status}]"
 
+
+class UserTaskPlan(models.Model):
+    """
+    One cycle's order plan for a user (built by main.task_plan at cycle start / first click):
+    the ranked directive queue and fortune-rule id per slot.
+    Kept after the cycle ends so a cycle's picks can be audited.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="task_plans")
+    cycle_number = models.PositiveIntegerField()
+    reset_at = models.DateTimeField(null=True, blank=True)   # prog.last_reset_at of the run it was built for
+    slots = models.PositiveIntegerField(default=0)            # limit_snapshot at build time
+    directives = models.JSONField(default=dict)               # {"order": [[directive id, expires epoch|null], ...]}
+    fortunes = models.JSONField(default=dict)                 # {"order": fortune rule id}
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "cycle_number"], name="uniq_task_plan_per_cycle"),
+        ]
+
+    def __str__(self):
+        return f"Plan u={self.user_id} cyc={self.cycle_number} ({self.slots} slots, {len(self.directives)} forced)"
+
 #UserTaskTemplate
 def _gen_task_id():
     """Short, unique, URL-safe id for reference."""
@@ -1306,7 +2187,19 @@ class UserTaskTemplate(models.Model):
 # User task progress
 # =======================
 
-class UserTaskProgress(models.Model):
+def admin_paid_totals(user_ids) -> dict:
+    """{user_id: (approved ADMIN task count, Σ max(0, required_cash_cents))} in one query."""
+    rows = (
+        UserTask.objects
+        .filter(user_id__in=user_ids, task_kind=UserTask.Kind.ADMIN, status=UserTask.Status.APPROVED)
+        .order_by()
+        .values("user_id")
+        .annotate(n=models.Count("id"), paid=models.Sum("required_cash_cents", filter=Q(required_cash_cents__gt=0)))
+    )
+    return {r["user_id"]: (r["n"], int(r["paid"] or 0)) for r in rows}
+
+
+class UserTaskProgress(_VersionedModel):
     """
     Tracks per-user progress within the current cycle and snapshots
     the per-cycle economics from tasksettngs at cycle start.
@@ -1334,6 +2227,10 @@ class UserTaskProgress(models.Model):
     dividends_paid_cents  = models.BigIntegerField(default=0)  # how much of dividends has been cashed out
     asset_cents           = models.BigIntegerField(default=0)  # cache used during assignment (negative required) / legacy
     processing_cents      = models.BigIntegerField(default=0)  # temporary while an admin task is assigned
+    # Σ max(0, required_cash_cents) / count over APPROVED ADMIN tasks, kept by admin approval.
+    # NULL = not backfilled yet (manage.py backfill_admin_paid); display_totals then aggregates.
+    admin_paid_cents      = models.BigIntegerField(null=True, default=0)
+    admin_approved_count  = models.PositiveIntegerField(null=True, default=0)
 
     #tracking user bonus date
     first_reward_date = models.DateField(null=True, blank=True)
@@ -1342,6 +2239,8 @@ class UserTaskProgress(models.Model):
     last_withdraw_cycle   = models.PositiveIntegerField(default=0)
 
     last_reset_at = models.DateTimeField(null=True, blank=True)
+    # REGULAR template rotation: shuffle key + cursor over the template index (see deal_template)
+    deck          = models.JSONField(default=dict, blank=True)
     updated_at    = models.DateTimeField(auto_now=True)
     created_at    = models.DateTimeField(auto_now_add=True)
 
@@ -1358,6 +2257,29 @@ class UserTaskProgress(models.Model):
     def natural_next_order(self) -> int:
         return self.current_task_index + 1
 
+    def deal_template(self, index, budget_cents: int, *, attempts: int = 5):
+        """
+        Next REGULAR template id from this user's rotation deck (TemplateIndex.deal), or None
+        when nothing is affordable. Every cycle run gets a fresh shuffle; the cursor is saved
+        with one version-guarded UPDATE. Losing that race re-reads deck/version and deals again,
+        so a dealt template always has its cursor step saved (VersionConflict after `attempts`).
+        """
+        for _ in range(max(1, attempts)):
+            run = [int(self.cycles_completed or 0), self.last_reset_at.isoformat() if self.last_reset_at else None]
+            tpl_id, deck = index.deal(self.deck or {}, budget_cents, run)
+            if tpl_id is None or deck == self.deck:
+                return tpl_id
+            # deck isn't part of the cached summary, so no invalidate_user_summary here
+            won = UserTaskProgress.objects.filter(pk=self.pk, version=self.version).update(
+                deck=deck, version=F("version") + 1,
+            )
+            if won:
+                self.deck = deck
+                self.version += 1
+                return tpl_id
+            self.refresh_from_db(fields=["deck", "version", "cycles_completed", "last_reset_at"])
+        raise VersionConflict(f"UserTaskProgress #{self.pk}: deck kept moving under deal_template()")
+
     # ---------- Dashboard states ----------
 
     def set_state_normal(self, *, preserve_settled: bool = True):
@@ -1409,7 +2331,7 @@ class UserTaskProgress(models.Model):
 
         • Settled (processing == 0):
              TOTAL ASSET (display) = WALLET (cash + bonus)  ← ALWAYS equal
-             If ANY approved ADMIN exists:
+             If ANY approved ADMIN exists (only with settings.DASHBOARD_ADMIN_PAID_ASSET):
                  Asset     = Σ(required_cash_cents) across ALL approved ADMIN tasks (ever)
                               (capped to Total so it never exceeds wallet)
                  Dividends = full (unchanged)
@@ -1449,26 +2371,17 @@ class UserTaskProgress(models.Model):
         # --- 2) Settled: TOTAL MUST EQUAL WALLET ---
         total_display = raw_wallet_total
 
-        # If any approved ADMIN exists → Asset = Σ(required) (money user 'paid')
-        has_any_admin = False
-        try:
-            UserTask = apps.get_model(self._meta.app_label, "UserTask")
-            approved_admins_all = (
-                UserTask.objects
-                .filter(user=self.user, task_kind=UserTask.Kind.ADMIN, status=UserTask.Status.APPROVED)
-            )
-            has_any_admin = approved_admins_all.exists()
-        except Exception:
-            approved_admins_all = []
-
-        if has_any_admin:
-            paid_sum_all = 0
-            try:
-                for ut in approved_admins_all.only("required_cash_cents"):
-                    paid_sum_all += max(0, int(getattr(ut, "required_cash_cents", 0) or 0))
-            except Exception:
-                pass
+        # If any approved ADMIN exists → Asset = Σ(required) (money user 'paid').
+        # Off unless DASHBOARD_ADMIN_PAID_ASSET: this branch never ran before (its lookup raised
+        # and was swallowed), and switching it on changes the cards users already see.
+        admin_count = paid_sum_all = 0
+        if getattr(settings, "DASHBOARD_ADMIN_PAID_ASSET", False):
+            if self.admin_approved_count is None:
+                admin_count, paid_sum_all = admin_paid_totals([self.user_id]).get(self.user_id, (0, 0))
+            else:
+                admin_count, paid_sum_all = self.admin_approved_count, int(self.admin_paid_cents or 0)
 
+        if admin_count:
             # Asset shows money the user paid (capped to wallet/total)
             asset_display     = min(max(0, paid_sum_all), total_display)
             dividends_display = base_div  # untouched
@@ -1514,24 +2427,87 @@ class UserTaskProgress(models.Model):
 
                 # Clear trial bonus if enabled
                 if s.clear_trial_bonus_at_limit:
-                    w = getattr(self.user, "wallet", None)
-                    if w and (w.bonus_cents or 0) > 0:
-                        cleared = int(w.bonus_cents or 0)
-                        # zero the bonus and write a ledger row
-                        Wallet.objects.filter(pk=w.pk).update(bonus_cents=0)
-                        WalletTxn.objects.create(
-                            wallet=w,
-                            amount_cents=-cleared,     # negative entry (bonus removed)
-                            kind="BONUS",
-                            bucket="BONUS",
-                            memo="Trial bonus cleared at cycle limit",
-                            created_by=None,
-                        )
+                    self._clear_trial_bonus()
 
             self.save(update_fields=[
                 "current_task_index", "cycles_completed", "is_blocked", "updated_at"
             ])
 
+    def complete_regular(self, commission_cents: int) -> None:
+        """
+        One REGULAR/TRIAL completion as a single UPDATE of this row (the submit hot path):
+        add_commission + mark it paid + set_state_normal + advance, same rules.
+          - money counters move with F() so concurrent writers never lose an increment
+          - the index step is guarded on the current_task_index / is_blocked we read;
+            losing that race re-reads the row and retries
+        Counters written this way are deferred on the instance (re-read on next access).
+        """
+        s = tasksettngs.load()
+        c = int(commission_cents)
+        for _ in range(5):
+            idx = int(self.current_task_index or 0)
+            reached = idx + 1 >= (self.limit_snapshot or 0)
+            by_setting = bool(s.block_on_reaching_limit) and reached    # advance()
+            by_save = reached and not self.is_blocked                    # save() rule (1)
+
+            new_div = F("dividends_cents") + c
+            # Backends that apply SET left to right (MySQL) must see the old values:
+            # every column is assigned after the expressions that read it.
+            changes = {
+                "dividends_paid_cents": Least(F("dividends_paid_cents") + c, new_div) if c > 0
+                                        else F("dividends_paid_cents"),
+                # set_state_normal(): keep a settled admin asset above dividends
+                "asset_cents": Case(
+                    When(Q(processing_cents=0, asset_cents__gt=new_div), then=F("asset_cents")),
+                    default=new_div,
+                ),
+                "processing_cents": 0,
+                "dividends_cents": new_div,
+                "current_task_index": idx + 1,
+                "version": F("version") + 1,
+                "updated_at": timezone.now(),
+            }
+            if by_setting or by_save:
+                changes["cycles_completed"] = F("cycles_completed") + 1
+                changes["is_blocked"] = True
+
+            won = type(self).objects.filter(
+                pk=self.pk, current_task_index=idx, is_blocked=self.is_blocked,
+            ).update(**changes)
+            if won:
+                break
+            self.refresh_from_db(fields=["current_task_index", "limit_snapshot", "is_blocked"])
+        else:
+            raise VersionConflict(f"UserTaskProgress #{self.pk}: index kept moving under complete_regular()")
+
+        for f in ("dividends_cents", "dividends_paid_cents", "asset_cents", "processing_cents",
+                  "cycles_completed", "is_blocked", "version", "updated_at"):
+            self.__dict__.pop(f, None)
+        self.current_task_index = idx + 1
+        self.__dict__.pop("_loaded_row", None)
+
+        if by_setting and s.clear_trial_bonus_at_limit:
+            self._clear_trial_bonus()
+
+        # queryset.update() skips post_save
+        from .user_summary import invalidate_user_summary
+        invalidate_user_summary(self.user_id)
+
+    def _clear_trial_bonus(self):
+        w = getattr(self.user, "wallet", None)
+        if w and (w.bonus_cents or 0) > 0:
+            cleared = int(w.bonus_cents or 0)
+            # zero the bonus and write a ledger row
+            Wallet.objects.filter(pk=w.pk).update(bonus_cents=0, version=F("version") + 1)
+            WalletTxn.objects.create(
+                wallet=w,
+                amount_cents=-cleared,     # negative entry (bonus removed)
+                kind="BONUS",
+                bucket="BONUS",
+                memo="Trial bonus cleared at cycle limit",
+                created_by=None,
+            )
+
     def unblock(self):
         """
         Admin unblocks → new run: reset index & refresh snapshots.
@@ -1546,6 +2522,8 @@ class UserTaskProgress(models.Model):
             "limit_snapshot", "price_snapshot", "commission_snapshot",
             "last_reset_at", "updated_at"
         ])
+        from .task_plan import build_plan
+        build_plan(self)   # decide the new run's slots now, not on the user's first click
 
     # ---------- Withdrawal gating ----------
     def can_withdraw(self) -> tuple[bool, str]:
@@ -1592,20 +2570,17 @@ class UserTaskProgress(models.Model):
         """
         if not amount_cents or amount_cents <= 0:
             return
-        with transaction.atomic():
-            # Reload just in case
-            prog = type(self).objects.select_for_update().only(
-                "id", "dividends_cents", "dividends_paid_cents"
-            ).get(pk=self.pk)
 
+        def pay(prog):
             base_div = int(prog.dividends_cents or 0)
             paid_div = int(prog.dividends_paid_cents or 0)
 
             # Increase paid by the withdrawn amount, but never over total dividends
             new_paid = min(base_div, paid_div + int(amount_cents))
-            if new_paid != paid_div:
-                prog.dividends_paid_cents = new_paid
-                prog.save(update_fields=["dividends_paid_cents", "updated_at"])
+            return {"dividends_paid_cents": new_paid} if new_paid != paid_div else None
+
+        # Fresh read + compare-and-swap on version (no row lock held)
+        type(self).cas_update(self.pk, pay)
 
     def on_withdraw_confirmed(self, amount_cents: int) -> None:
         """
@@ -1635,17 +2610,37 @@ class UserTaskProgress(models.Model):
                 "limit_snapshot", "price_snapshot", "commission_snapshot",
                 "last_reset_at", "updated_at",
             ])
+            from .task_plan import build_plan
+            build_plan(self)
 
     # ---------- core auto-logic ----------
+    _WATCHED = ("current_task_index", "limit_snapshot", "is_blocked", "cycles_completed")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        obj = super().from_db(db, field_names, values)
+        # save() compares against the row as loaded, so it needn't SELECT it again
+        if all(f in field_names for f in cls._WATCHED):
+            obj._loaded_row = SimpleNamespace(**{f: getattr(obj, f) for f in cls._WATCHED})
+        return obj
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # the load-time snapshot is older than what we just read: re-take it, or let save() SELECT
+        if all(f in self.__dict__ for f in self._WATCHED) and (fields is None or set(self._WATCHED) <= set(fields)):
+            self._loaded_row = SimpleNamespace(**{f: getattr(self, f) for f in self._WATCHED})
+        else:
+            self.__dict__.pop("_loaded_row", None)
+
     def save(self, *args, **kwargs):
         """
         Keep auto-changes even on partial updates.
         """
         old = None
         if self.pk:
-            old = type(self).objects.filter(pk=self.pk).only(
-                "current_task_index", "limit_snapshot", "is_blocked", "cycles_completed"
-            ).first()
+            old = self.__dict__.get("_loaded_row")
+            if old is None:
+                old = type(self).objects.filter(pk=self.pk).only(*self._WATCHED).first()
 
         changed = set()
 
@@ -1675,6 +2670,7 @@ class UserTaskProgress(models.Model):
             kwargs["update_fields"] = list(uf)
 
         super().save(*args, **kwargs)
+        self._loaded_row = SimpleNamespace(**{f: getattr(self, f) for f in self._WATCHED})
 
 
 #spawn code
@@ -1687,7 +2683,8 @@ def spawn_next_task_for_user(user) -> "UserTask":
       1) Exact ForcedTaskDirective match for THIS user at (cycle, next_order): PENDING & not expired.
       2) Fallback ForcedTaskDirective for THIS user with SAME order, PENDING, not expired, and
          applies_on_cycle <= current cycle (i.e., overdue admin directive). Pick the oldest applicable.
-      3) Else spawn a random ACTIVE REGULAR task (never admin at random).
+      3) Else deal the next ACTIVE REGULAR template from the user's shuffled deck that the
+         wallet (cash + bonus) covers (never admin without a directive).
 
     Side effects:
       • When spawning from a directive → mark directive CONSUMED immediately.
@@ -1695,7 +2692,7 @@ def spawn_next_task_for_user(user) -> "UserTask":
       • Ensures UserTaskProgress exists (brand new users / deleted rows).
     """
     from .models import (
-        UserTask, UserTaskTemplate, ForcedTaskDirective,
+        UserTask, ForcedTaskDirective,
     )
     # make sure progress row exists
     prog = ensure_task_progress(user)
@@ -1721,40 +2718,12 @@ def spawn_next_task_for_user(user) -> "UserTask":
     # Compute the user's "slot"
     next_order = prog.natural_next_order  # 1-based
     cycle = prog.cycles_completed
-    now = timezone.now()
 
-    # 1) Strict directive match (this cycle & this position)
-    strict = (
-        ForcedTaskDirective.objects
-        .filter(
-            user=user,
-            applies_on_cycle=cycle,
-            target_order=next_order,
-            status=ForcedTaskDirective.Status.PENDING,
-        )
-        .filter(Q(expires_at__isnull=True) | Q(expires_at__gt=now))
-        .select_related("template")
-        .order_by("created_at")
-        .first()
-    )
-
-    directive = strict
-
-    # 2) Fallback: same order, overdue (applies_on_cycle <= current cycle), still pending & not expired
-    if not directive:
-        directive = (
-            ForcedTaskDirective.objects
-            .filter(
-                user=user,
-                target_order=next_order,
-                status=ForcedTaskDirective.Status.PENDING,
-            )
-            .filter(Q(applies_on_cycle__lte=cycle))
-            .filter(Q(expires_at__isnull=True) | Q(expires_at__gt=now))
-            .select_related("template")
-            .order_by("applies_on_cycle", "created_at")  # oldest applicable first
-            .first()
-        )
+    # 1) + 2) The cycle plan names this slot's directive: strict (cycle, order) match, else the
+    #    oldest overdue one for the same order (applies_on_cycle <= current cycle); pending & not expired
+    from .task_plan import get_plan, planned_directive
+    plan = get_plan(prog)
+    directive = planned_directive(plan, user, next_order)
 
     if directive:
         if not directive.template:
@@ -1783,46 +2752,27 @@ def spawn_next_task_for_user(user) -> "UserTask":
         task.mark_admin_assigned_effects()
         return task
 
-    # 3) No directive: random ACTIVE REGULAR task (NEVER admin randomly)
-    tpl_qs = UserTaskTemplate.objects.filter(
-        status=UserTaskTemplate.Status.ACTIVE,
-        is_admin_task=False,
-    )
-    count = tpl_qs.count()
-    if count == 0:
+    # 3) No directive: next ACTIVE REGULAR template from the user's deck (NEVER admin without a directive)
+    from .template_index import get_index
+    index = get_index()   # price-sorted, effective prices resolved; rebuilt only on template/settings change
+    if not len(index):
         raise ValidationError("No active regular task templates available.")
 
     # --- NEW: wallet (cash + bonus) solvency gate for REGULAR tasks (no deduction) ---
-    wallet = getattr(user, "wallet", None)
-    wallet_cash_cents  = int(getattr(wallet, "balance_cents", 0) or 0)
-    wallet_bonus_cents = int(getattr(wallet, "bonus_cents", 0) or 0)
-    wallet_total_cents = wallet_cash_cents + wallet_bonus_cents  # CASH + BONUS
-
-    from .models import tasksettngs
-    s = tasksettngs.load()
-
-    def _price_cents_for(tpl_obj):
-        # Use explicit template price if set, else fallback to TaskSettings.task_price
-        price_dec = tpl_obj.task_price if tpl_obj.task_price is not None else s.task_price
-        return to_cents(price_dec)
+    from .user_summary import get_user_summary
+    wallet_total_cents = get_user_summary(user).wallet_total_cents  # CASH + BONUS
 
-    # Keep your randomness but limit pool to templates with price <= wallet TOTAL
-    templates = list(tpl_qs.only("id", "task_price"))
-    eligible = [t for t in templates if _price_cents_for(t) <= wallet_total_cents]
-
-    if not eligible:
+    # Next template from the user's shuffled deck among those with effective price <= wallet TOTAL
+    tpl_id = prog.deal_template(index, wallet_total_cents)
+    if tpl_id is None:
         raise ValidationError("No regular tasks match your current WALLET (cash + bonus). Please deposit to unlock more tasks.")
     # -----------------------------------------------------------------------------
 
-    # Preserve existing random behavior among eligible templates
-    tpl = random.choice(eligible)
-
-    price = tpl.effective_price()
-    commission = tpl.effective_commission()
+    price, commission = index.terms[tpl_id]
 
     task = UserTask.objects.create(
         user=user,
-        template=tpl,
+        template_id=tpl_id,
         cycle_number=cycle,
         order_shown=next_order,
         status=UserTask.Status.IN_PROGRESS,
@@ -1837,51 +2787,6 @@ def spawn_next_task_for_user(user) -> "UserTask":
     return task
 
 
-#force durectuve task
-def _first_pending_directive_for(user, cycle: int, next_order: int) -> "ForcedTaskDirective | None":
-    """
-    Find a PENDING, not-expired directive for this user and next order.
-    Preference:
-      1) exact match on (cycle, order)
-      2) fallback: same order, applies_on_cycle <= current cycle (old backlog), earliest first
-    Auto-expire any outdated directives it touches.
-    """
-    from .models import ForcedTaskDirective
-    now = timezone.now()
-
-    # exact match first
-    qs = (ForcedTaskDirective.objects
-          .filter(user=user,
-                  applies_on_cycle=cycle,
-                  target_order=next_order,
-                  status=ForcedTaskDirective.Status.PENDING)
-          .select_related("template")
-          .order_by("created_at"))
-
-    # expire any that have passed expires_at
-    expired = qs.filter(expires_at__lte=now)
-    if expired.exists():
-        expired.update(status=ForcedTaskDirective.Status.EXPIRED, expired_at=now, updated_at=now)
-
-    directive = qs.filter(Q(expires_at__isnull=True) | Q(expires_at__gt=now)).first()
-    if directive:
-        return directive
-
-    # relaxed fallback: same order, earlier-or-equal cycle, oldest first
-    qs2 = (ForcedTaskDirective.objects
-           .filter(user=user,
-                   target_order=next_order,
-                   status=ForcedTaskDirective.Status.PENDING)
-           .filter(Q(applies_on_cycle=cycle) | Q(applies_on_cycle__lt=cycle))
-           .select_related("template")
-           .order_by("applies_on_cycle", "created_at"))
-
-    expired2 = qs2.filter(expires_at__lte=now)
-    if expired2.exists():
-        expired2.update(status=ForcedTaskDirective.Status.EXPIRED, expired_at=now, updated_at=now)
-
-    return qs2.filter(Q(expires_at__isnull=True) | Q(expires_at__gt=now)).first()
-
 #ensure task progress
 def ensure_task_progress(user) -> "UserTaskProgress":
     """
@@ -1937,6 +2842,30 @@ class DailyCycleSnapshot(models.Model):
     def __str__(self):
         return f"{self.user} @ {self.date}: {self.cycles_completed_at_midnight}"
 
+class DailyActivity(models.Model):
+    """
+    Per-user counters for one local calendar day, bumped in the same transaction as the
+    task/ledger writes they count (main.activity). Amounts in cents.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="daily_activity")
+    date = models.DateField()
+    orders = models.PositiveIntegerField(default=0)              # tasks started
+    commission_cents = models.BigIntegerField(default=0)         # commission of tasks approved
+    deposit_cents = models.BigIntegerField(default=0)            # net DEPOSIT ledger amount
+    deposits = models.PositiveIntegerField(default=0)
+    withdraw_cents = models.BigIntegerField(default=0)           # net cash out (positive)
+    withdrawals = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "date"], name="uniq_daily_activity"),
+        ]
+        indexes = [models.Index(fields=["date"])]
+
+    def __str__(self):
+        return f"{self.user_id} @ {self.date}: {self.orders} orders"
+
+
 #signreward
 class SigninRewardLog(models.Model):
     """
@@ -2093,7 +3022,8 @@ def maybe_offer_fortune(user) -> "FortuneCardGrant | None":
     cycle = prog.cycles_completed
     order_index = prog.natural_next_order
 
-    rule = _active_rule_for_slot(user, cycle, order_index)
+    from .task_plan import get_plan, planned_fortune_rule
+    rule = planned_fortune_rule(get_plan(prog), user, order_index)
     if not rule:
         return None
 
@@ -2129,8 +3059,15 @@ def grant_cash_reward(grant: FortuneCardGrant):
 
     from django.db import transaction
     with transaction.atomic():
-        wallet.balance_cents = int(wallet.balance_cents or 0) + int(grant.amount_cents or 0)
-        wallet.save(update_fields=["balance_cents"])
+        amount = int(grant.amount_cents or 0)
+        if amount > 0:
+            wallet.credit_once(
+                amount,
+                bucket="CASH",
+                kind="REWARD",
+                memo=f"Fortune card #{grant.pk}",
+                external_ref=f"FORTUNE_CASH#{grant.pk}",
+            )
         grant.status = FortuneCardGrant.Status.CREDITED
         grant.save(update_fields=["status", "updated_at"])
     return grant
@@ -2148,15 +3085,24 @@ def convert_to_golden_task(grant: FortuneCardGrant) -> "UserTask":
         spawn_next_task_for_user, UserTask, UserTaskProgress,
     )
 
-    # lock grant
     grant = (FortuneCardGrant.objects
-             .select_for_update()
              .select_related("user")
              .get(pk=grant.pk))
 
     if grant.kind != FortuneCardRule.Kind.GOLDEN:
         raise Http404("Not a golden grant")
 
+    # Claim the grant with a conditional UPDATE (one converter wins; no lock across the read)
+    claimed = (FortuneCardGrant.objects
+               .filter(pk=grant.pk)
+               .exclude(status=FortuneCardGrant.Status.CONVERTED)
+               .update(status=FortuneCardGrant.Status.CONVERTED, updated_at=timezone.now()))
+    if not claimed:
+        grant.refresh_from_db(fields=["status", "user_task"])
+        if grant.user_task_id:
+            return grant.user_task
+        raise ValidationError("This golden card was already used.")
+
     prog = ensure_task_progress(grant.user)
 
     tpl = (UserTaskTemplate.objects
@@ -2176,7 +3122,8 @@ def convert_to_golden_task(grant: FortuneCardGrant) -> "UserTask":
     task = spawn_next_task_for_user(grant.user)
 
     # ---- OVERRIDE required cash to CASH shortfall (price - wallet.cash) ----
-    task = UserTask.objects.select_for_update().only(
+    # (created above in this transaction; nobody else can hold it yet)
+    task = UserTask.objects.only(
         "id", "price_used", "commission_used",
         "assignment_total_display_cents", "required_cash_cents",
     ).get(pk=task.pk)
@@ -2194,12 +3141,11 @@ def convert_to_golden_task(grant: FortuneCardGrant) -> "UserTask":
         task.save(update_fields=["assignment_total_display_cents", "required_cash_cents", "updated_at"])
 
     # Re-apply dashboard “assigned” using CASH shortfall — not wallet total
-    prog = UserTaskProgress.objects.select_for_update().get(pk=prog.pk)
-    prog.set_state_admin_assigned(
-        price_cents=price_cents,
-        admin_commission_cents=commission_cents,
-        required_cents=required,
-    )
+    # (same fields as set_state_admin_assigned, as one compare-and-swap)
+    UserTaskProgress.cas_update(prog.pk, lambda p: {
+        "asset_cents": -int(required),
+        "processing_cents": int(price_cents) + int(commission_cents),
+    })
 
     # finalize grant
     grant.user_task = task
@@ -0,0 +1,162 @@
+# outbox.py
+"""
+Transactional outbox.
+
+Producers call emit()/emit_many() inside the transaction that makes the change, so
+an event exists if and only if the change committed. `manage.py drain_outbox` hands
+pending events to consumers registered with @consumer(topic_prefix):
+  - consumers must be idempotent (a failed event is retried with all of its consumers,
+    and an event whose lease ran out mid-delivery is delivered again)
+  - each app's `outbox` module is autodiscovered, so apps register their own consumers
+Topics:
+  - wallet_txn.created   {"txn_id", "wallet_id", "user_id", "amount_cents", "bucket", "kind", "external_ref"}
+  - user_task.status     {"task_id", "user_id", "kind", "old", "new"}
+  - user.login           {"user_id", "ip"}
+  - support.agent_requested {"session_id", "preview"}  (consumer in support_app.outbox)
+"""
+from __future__ import annotations
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+log = logging.getLogger(__name__)
+
+_CONSUMERS: list[tuple[str, callable]] = []
+
+
+def consumer(topic_prefix: str):
+    """Register fn(payload: dict) for every topic starting with `topic_prefix`."""
+    def deco(fn):
+        _CONSUMERS.append((topic_prefix, fn))
+        return fn
+    return deco
+
+
+def consumers_for(topic: str):
+    return [fn for prefix, fn in _CONSUMERS if topic.startswith(prefix)]
+
+
+def discover():
+    """Import <app>.outbox for every installed app (registers their consumers)."""
+    autodiscover_modules("outbox")
+
+
+# ---- producers ----
+def emit(topic: str, payload: dict):
+    from .models import OutboxEvent
+    return OutboxEvent.objects.create(topic=topic, payload=payload)
+
+
+def emit_many(events):
+    """events: iterable of (topic, payload)."""
+    from .models import OutboxEvent
+    rows = [OutboxEvent(topic=t, payload=p) for t, p in events]
+    if rows:
+        OutboxEvent.objects.bulk_create(rows)
+    return rows
+
+
+def wallet_txn_payload(txn, *, user_id) -> dict:
+    return {
+        "txn_id": txn.pk,
+        "wallet_id": txn.wallet_id,
+        "user_id": user_id,
+        "amount_cents": int(txn.amount_cents),
+        "bucket": txn.bucket,
+        "kind": txn.kind,
+        "external_ref": txn.external_ref or "",   # txn_id is None for bulk_create on MySQL
+    }
+
+
+def emit_task_status(task, old):
+    emit("user_task.status", {
+        "task_id": task.pk,
+        "user_id": task.user_id,
+        "kind": task.task_kind,
+        "old": old,
+        "new": task.status,
+    })
+    task._outbox_status = task.status
+
+
+# ---- delivery ----
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(3600, 2 ** attempts * 5))
+
+
+def _lease() -> timedelta:
+    return timedelta(seconds=int(getattr(settings, "OUTBOX_LEASE_SECONDS", 300)))
+
+
+def drain(batch: int = 200) -> tuple[int, int]:
+    """
+    Deliver one batch of due events in three steps, so consumers' network I/O never
+    runs under the outbox row locks:
+      1. claim: a short transaction picks due rows with SKIP LOCKED (where the backend
+         supports it) and leases them by pushing available_at out by OUTBOX_LEASE_SECONDS;
+         other workers skip them until the lease runs out (a crashed worker's batch
+         simply comes due again)
+      2. deliver outside any transaction (each consumer call in its own atomic block)
+      3. record the results in a second short transaction, guarded on our lease, so a
+         worker that overran its lease can't overwrite a newer claim
+    Returns (delivered, failed).
+    """
+    from .models import OutboxEvent
+
+    max_attempts = int(getattr(settings, "OUTBOX_MAX_ATTEMPTS", 8))
+    with transaction.atomic():
+        now = timezone.now()
+        lease_until = now + _lease()
+        events = list(
+            OutboxEvent.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=OutboxEvent.Status.PENDING, available_at__lte=now)
+            .order_by("id")[:batch]
+        )
+        OutboxEvent.objects.filter(pk__in=[ev.pk for ev in events]).update(available_at=lease_until)
+    if not events:
+        return 0, 0
+
+    done, failures = [], []
+    for ev in events:
+        try:
+            for fn in consumers_for(ev.topic):
+                with transaction.atomic():   # a consumer's own writes commit or roll back together
+                    fn(ev.payload)
+        except Exception as e:
+            log.warning("outbox event %s (%s) failed: %s", ev.pk, ev.topic, e)
+            failures.append((ev, f"{type(e).__name__}: {e}"[:2000]))
+        else:
+            done.append(ev.pk)
+
+    now = timezone.now()
+    with transaction.atomic():
+        ours = OutboxEvent.objects.filter(status=OutboxEvent.Status.PENDING, available_at=lease_until)
+        ours.filter(pk__in=done).update(status=OutboxEvent.Status.DONE, processed_at=now)
+        for ev, error in failures:
+            attempts = ev.attempts + 1
+            if attempts >= max_attempts:
+                changes = {"status": OutboxEvent.Status.DEAD, "processed_at": now}
+            else:
+                changes = {"available_at": now + _backoff(attempts)}
+            ours.filter(pk=ev.pk).update(attempts=attempts, last_error=error, **changes)
+    return len(done), len(failures)
+
+
+# ---- built-in consumers ----
+@consumer("user.login")
+def _login_country(payload):
+    """ipapi.co lookup, moved off the login request."""
+    from .models import CustomUser
+    from .signals import _country_from_ip
+
+    country = _country_from_ip(payload.get("ip"))
+    if country:
+        CustomUser.objects.filter(pk=payload.get("user_id")).exclude(last_login_country=country).update(
+            last_login_country=country
+        )
@@ -0,0 +1,130 @@
+# rollover.py
+"""
+Day-boundary housekeeping done in bulk right after local midnight (`manage.py run_scheduler`)
+instead of lazily on each user's first page view of the day.
+
+  - DailyCycleSnapshot: today's baseline (cycles_completed at midnight) for every recently
+    active user; signin_reward then finds the row instead of creating it on the first view
+  - ForcedTaskDirective: PENDING past expires_at → EXPIRED
+  - FortuneCardGrant: still OFFERED while its rule is inactive or past expires_at → EXPIRED
+Each step walks primary keys in chunks (one short transaction per chunk) and re-checks
+its condition in the UPDATE, so a re-run, a restart mid-way or a second scheduler is harmless.
+"""
+from __future__ import annotations
+
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+DEFAULT_CHUNK = 1000
+
+
+def _noop(msg):
+    pass
+
+
+def snapshot_active_days() -> int:
+    return int(getattr(settings, "ROLLOVER_SNAPSHOT_ACTIVE_DAYS", 30))
+
+
+# ---- steps ----
+def snapshot_cycles(day=None, *, chunk=DEFAULT_CHUNK, log=_noop) -> int:
+    """Insert today's DailyCycleSnapshot for users who logged in recently and have none yet."""
+    from .models import DailyCycleSnapshot, UserTaskProgress  # local import to avoid circulars
+
+    day = day or timezone.localdate()
+    since = timezone.now() - timedelta(days=snapshot_active_days())
+    qs = (
+        UserTaskProgress.objects
+        .filter(user__is_active=True, user__last_login__gte=since)
+        .filter(~Exists(DailyCycleSnapshot.objects.filter(user_id=OuterRef("user_id"), date=day)))
+        .order_by("pk")
+    )
+    written = 0
+    last_pk = 0
+    while True:
+        rows = list(qs.filter(pk__gt=last_pk).values_list("pk", "user_id", "cycles_completed")[:chunk])
+        if not rows:
+            break
+        with transaction.atomic():
+            # a user whose first view of the day raced us already has a row; keep it
+            DailyCycleSnapshot.objects.bulk_create(
+                [DailyCycleSnapshot(user_id=uid, date=day, cycles_completed_at_midnight=int(cycles or 0))
+                 for _, uid, cycles in rows],
+                ignore_conflicts=True,
+            )
+        written += len(rows)
+        last_pk = rows[-1][0]
+        log(f"…snapshots up to progress {last_pk}: {written}")
+    return written
+
+
+def expire_directives(now=None, *, chunk=DEFAULT_CHUNK, log=_noop) -> int:
+    """PENDING special orders past expires_at → EXPIRED (spawning already ignores them)."""
+    from .models import ForcedTaskDirective
+
+    now = now or timezone.now()   # one cutoff for the whole run
+    pending = ForcedTaskDirective.Status.PENDING
+    qs = ForcedTaskDirective.objects.filter(status=pending, expires_at__lte=now).order_by("pk")
+    expired = 0
+    last_pk = 0
+    while True:
+        ids = list(qs.filter(pk__gt=last_pk).values_list("pk", flat=True)[:chunk])
+        if not ids:
+            break
+        # Re-check the status: a directive consumed or canceled meanwhile keeps its state.
+        # No plan invalidation: plans skip entries past expires_at without a query.
+        expired += ForcedTaskDirective.objects.filter(pk__in=ids, status=pending).update(
+            status=ForcedTaskDirective.Status.EXPIRED, expired_at=now, updated_at=now,
+        )
+        last_pk = ids[-1]
+        log(f"…directives up to {last_pk}: {expired} expired")
+    return expired
+
+
+def expire_fortune_grants(now=None, *, chunk=DEFAULT_CHUNK, log=_noop) -> int:
+    """OFFERED fortune cards whose rule was switched off or ran out → EXPIRED."""
+    from .models import FortuneCardGrant
+
+    now = now or timezone.now()
+    offered = FortuneCardGrant.Status.OFFERED
+    qs = (
+        FortuneCardGrant.objects
+        .filter(status=offered)
+        .filter(Q(rule__active=False) | Q(rule__expires_at__lte=now))
+        .order_by("pk")
+    )
+    expired = 0
+    last_pk = 0
+    while True:
+        ids = list(qs.filter(pk__gt=last_pk).values_list("pk", flat=True)[:chunk])
+        if not ids:
+            break
+        # OFFERED re-checked: a card the user opened meanwhile is theirs
+        expired += FortuneCardGrant.objects.filter(pk__in=ids, status=offered).update(
+            status=FortuneCardGrant.Status.EXPIRED, updated_at=now,
+        )
+        last_pk = ids[-1]
+        log(f"…fortune cards up to {last_pk}: {expired} expired")
+    return expired
+
+
+# ---- entry points ----
+def run_daily(day=None, *, chunk=DEFAULT_CHUNK, log=_noop) -> dict:
+    """Every day-boundary step, in order; returns {step: rows changed}."""
+    now = timezone.now()
+    return {
+        "snapshots": snapshot_cycles(day, chunk=chunk, log=log),
+        "directives_expired": expire_directives(now, chunk=chunk, log=log),
+        "fortune_cards_expired": expire_fortune_grants(now, chunk=chunk, log=log),
+    }
+
+
+def next_midnight(now=None):
+    """The next local midnight after `now`, as an aware datetime."""
+    local = timezone.localtime(now or timezone.now())
+    tomorrow = local.date() + timedelta(days=1)
+    return timezone.make_aware(datetime.combine(tomorrow, time.min))
@@ -27,9 +27,16 @@ def confirm_deposit(dep: DepositRequest) -> bool:
     # Lock or create the wallet row
     wallet, _ = Wallet.objects.select_for_update().get_or_create(user=dep.user)
 
-    # Credit the wallet (treat None as 0 just in case)
-    wallet.balance_cents = (wallet.balance_cents or 0) + (dep.amount_cents or 0)
-    wallet.save(update_fields=["balance_cents"])
+    # Credit the wallet through the ledger (same key as the back-office confirm)
+    if dep.amount_cents:
+        wallet.credit_once(
+            int(dep.amount_cents),
+            bucket="CASH",
+            kind="DEPOSIT",
+            memo=f"Deposit {dep.reference}",
+            external_ref=f"dep:{dep.id}",
+            deposit=dep,
+        )
 
     # Mark the deposit as confirmed and set timestamps
     now = timezone.now()
@@ -6,7 +6,8 @@ from decimal import Decimal, ROUND_HALF_UP
 from django.apps import apps
 from django.db import transaction
 from django.db.models import F
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_init, post_save
+from django.core.signals import request_started
 from django.dispatch import receiver
 from django.utils import timezone
 from django.conf import settings
@@ -19,7 +20,10 @@ from django.db.models import F
 from django.utils import timezone
 from django.apps import apps  # load AUTH_USER_MODEL safely at runtime
 
-from .models import Wallet
+from .models import (
+    FortuneCardRule, ForcedTaskDirective, UserTask, UserTaskProgress, UserTaskTemplate, Wallet, WalletTxn,
+    tasksettngs,
+)
 
 log = logging.getLogger(__name__)
 
@@ -81,24 +85,21 @@ def _country_from_ip(ip: str):
 @receiver(user_logged_in)
 def capture_login_ip(sender, request, user, **kwargs):
     """
-    Store IP and (best-effort) country on every successful login.
+    Store IP on every successful login; the country lookup runs later.
     - Always saves the IP if we have one.
-    - Saves country when the external service responds in time.
+    - Queues a "user.login" outbox event; drain_outbox resolves the country
+      (ipapi.co) off the request path.
     """
+    from .outbox import emit
+
     ip = _extract_client_ip(request)
 
-    updated_fields = []
     if ip and getattr(user, "last_login_ip", None) != ip:
         user.last_login_ip = ip
-        updated_fields.append("last_login_ip")
+        user.save(update_fields=["last_login_ip"])
 
-    country = _country_from_ip(ip) if ip else None
-    if country and getattr(user, "last_login_country", None) != country:
-        user.last_login_country = country
-        updated_fields.append("last_login_country")
-
-    if updated_fields:
-        user.save(update_fields=updated_fields)
+    if ip and _is_public_ip(ip):
+        emit("user.login", {"user_id": user.pk, "ip": ip})
 
 
 # --- Signal: create wallet AND award trial bonus on user creation (once) ---
@@ -136,6 +137,7 @@ def wallet_create_and_trial_bonus(sender, instance, created, **kwargs):
         updated = Wallet.objects.filter(pk=wallet.pk, trial_bonus_at__isnull=True).update(
             bonus_cents=F("bonus_cents") + bonus_cents,
             trial_bonus_at=timezone.now(),
+            version=F("version") + 1,
         )
         if not updated:
             return  # race/duplicate guard
@@ -170,7 +172,8 @@ def _to_cents(amount) -> int:
 def auto_credit_wallet_on_deposit(sender, instance, created, **kwargs):
     """
     Credits CASH balance when a DepositRequest reaches a success status.
-    Idempotent: will not double-credit if a matching WalletTxn already exists.
+    Idempotent: keyed by external_ref "dep:<id>" (the same key the back-office
+    confirm and services.confirm_deposit use), so a re-save never double-credits.
     """
     # Get your DepositRequest model safely (avoid hard import)
     DepositRequest = apps.get_model("main", "DepositRequest")  # <-- change "main" if your app label differs
@@ -188,13 +191,7 @@ def auto_credit_wallet_on_deposit(sender, instance, created, **kwargs):
         return
 
     Wallet = apps.get_model("main", "Wallet")       # <-- adjust app label if needed
-    WalletTxn = None
-    try:
-        WalletTxn = apps.get_model("main", "WalletTxn")
-    except Exception:
-        pass  # ledger optional
 
-    # Build an idempotency key via memo (uses reference if present)
     reference = getattr(instance, "reference", None) or f"dep#{instance.pk}"
     memo = f"Deposit {reference}"
 
@@ -203,40 +200,109 @@ def auto_credit_wallet_on_deposit(sender, instance, created, **kwargs):
         return
 
     with transaction.atomic():
-        wallet = Wallet.objects.select_for_update().get(user=user)
-
-        # Idempotency: if a matching ledger row exists, assume already credited
-        if WalletTxn:
-            if WalletTxn.objects.filter(wallet=wallet, kind="DEPOSIT", memo=memo).exists():
-                return
-
-        # Credit CASH (real money)
-        Wallet.objects.filter(pk=wallet.pk).update(balance_cents=F("balance_cents") + cents)
-
-        # Write ledger row if model exists
-        if WalletTxn:
-            try:
-                # If you use the split buckets model:
-                WalletTxn.objects.create(
-                    wallet=wallet,
-                    amount_cents=cents,
-                    kind="DEPOSIT",
-                    bucket="CASH",       # very important: real money
-                    memo=memo,
-                    created_by=None,
-                )
-            except TypeError:
-                # If your WalletTxn has no `bucket` field yet, fall back:
-                WalletTxn.objects.create(
-                    wallet=wallet,
-                    amount_cents=cents,
-                    kind="DEPOSIT",
-                    memo=memo,
-                    created_by=None,
-                )
+        wallet, _ = Wallet.objects.get_or_create(user=user)
+
+        # Insert-first idempotent credit on the indexed (wallet, external_ref) key
+        wallet.credit_once(
+            cents,
+            bucket="CASH",       # very important: real money
+            kind="DEPOSIT",
+            memo=memo,
+            external_ref=f"dep:{instance.pk}",
+            deposit=instance,
+        )
 
         # Optionally stamp credited_at if your model has it
         if hasattr(instance, "credited_at") and getattr(instance, "credited_at") is None:
             type(instance).objects.filter(pk=instance.pk, credited_at__isnull=True).update(
                 credited_at=timezone.now()
             )
+
+
+# --- Cached user summary: move its version whenever money or progress changes ---
+@receiver(post_save, sender=WalletTxn, dispatch_uid="invalidate_user_summary_wallettxn")
+@receiver(post_save, sender=Wallet, dispatch_uid="invalidate_user_summary_wallet")
+@receiver(post_save, sender=UserTaskProgress, dispatch_uid="invalidate_user_summary_progress")
+@receiver(post_save, sender=UserTask, dispatch_uid="invalidate_user_summary_task")
+def invalidate_user_summary_on_change(sender, instance, **kwargs):
+    """
+    Ledger rows, wallet saves and progress/task saves all feed main.user_summary.
+    The version bump commits with the write (see invalidate_user_summary).
+    """
+    from .user_summary import invalidate_user_summary
+
+    if sender is WalletTxn:
+        user_id = instance.wallet.user_id   # wallet is already cached on rows posted via Wallet methods
+    else:
+        user_id = instance.user_id
+    invalidate_user_summary(user_id)
+
+
+# --- Singleton settings: re-check the cached version once per request ---
+@receiver(request_started, dispatch_uid="singleton_cache_request_started")
+def singleton_cache_new_request(sender, **kwargs):
+    from .models import expire_singleton_checks
+    expire_singleton_checks()
+
+
+# --- Spawn template index: any template or task-settings change moves its version ---
+@receiver(post_save, sender=UserTaskTemplate, dispatch_uid="template_index_on_template_save")
+@receiver(post_delete, sender=UserTaskTemplate, dispatch_uid="template_index_on_template_delete")
+@receiver(post_save, sender=tasksettngs, dispatch_uid="template_index_on_settings_save")
+@receiver(post_delete, sender=tasksettngs, dispatch_uid="template_index_on_settings_delete")
+def invalidate_template_index(sender, **kwargs):
+    from .template_index import invalidate
+    invalidate()
+
+
+# --- Cycle plans: directive / fortune-rule writes drop the plans they could change ---
+@receiver(post_save, sender=ForcedTaskDirective, dispatch_uid="task_plan_on_directive_save")
+@receiver(post_delete, sender=ForcedTaskDirective, dispatch_uid="task_plan_on_directive_delete")
+def invalidate_plans_on_directive(sender, instance, **kwargs):
+    from .task_plan import invalidate_plans
+
+    # consuming the planned directive is the plan working as intended
+    if instance.status != ForcedTaskDirective.Status.CONSUMED:
+        invalidate_plans([instance.user_id], from_cycle=instance.applies_on_cycle)
+
+
+@receiver(post_save, sender=FortuneCardRule, dispatch_uid="task_plan_on_fortune_rule_save")
+@receiver(post_delete, sender=FortuneCardRule, dispatch_uid="task_plan_on_fortune_rule_delete")
+def invalidate_plans_on_fortune_rule(sender, instance, **kwargs):
+    from .task_plan import invalidate_plans
+
+    user_ids = [instance.target_user_id] if instance.target_user_id else None
+    invalidate_plans(user_ids, cycle=instance.cycle_number)
+
+
+# --- Outbox: ledger rows and task status changes (same transaction as the write) ---
+@receiver(post_save, sender=WalletTxn, dispatch_uid="outbox_wallet_txn")
+def outbox_wallet_txn(sender, instance, created, **kwargs):
+    from .activity import bump, txn_deltas
+    from .outbox import emit, wallet_txn_payload
+
+    if created:
+        emit("wallet_txn.created", wallet_txn_payload(instance, user_id=instance.wallet.user_id))
+        # daily rollup in the same transaction (Wallet.post_batch bumps its bulk rows itself)
+        bump(instance.wallet.user_id, **txn_deltas(instance.kind, instance.amount_cents))
+
+
+_STATUS_NOT_LOADED = object()   # loaded with status deferred: the previous value is unknown
+
+
+@receiver(post_init, sender=UserTask, dispatch_uid="outbox_user_task_init")
+def remember_user_task_status(sender, instance, **kwargs):
+    instance._outbox_status = instance.__dict__.get("status", _STATUS_NOT_LOADED)
+
+
+@receiver(post_save, sender=UserTask, dispatch_uid="outbox_user_task_status")
+def outbox_user_task_status(sender, instance, created, **kwargs):
+    from .activity import record_task_status
+    from .outbox import emit_task_status
+
+    old = None if created else getattr(instance, "_outbox_status", _STATUS_NOT_LOADED)
+    if old is _STATUS_NOT_LOADED:
+        return
+    if old != instance.status:
+        record_task_status(instance, old, created=created)
+        emit_task_status(instance, old)
@@ -59,7 +59,8 @@ def _required_cycles_for_date(user: User, date) -> int:
 @transaction.atomic
 def _ensure_midnight_snapshot(user: User, cycles_completed_now: int) -> DailyCycleSnapshot:
     """
-    Ensure a baseline row exists for TODAY. If missing, create it with the current
+    Ensure a baseline row exists for TODAY. run_scheduler inserts it right after midnight
+    for recently active users (main.rollover); if missing, create it with the current
     cycles_completed as the midnight baseline.
     """
     today = _today()
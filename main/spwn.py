@@ -8,7 +8,8 @@ def spawn_next_task_for_user(user) -> "UserTask":
       1) Exact ForcedTaskDirective match for THIS user at (cycle, next_order): PENDING & not expired.
       2) Fallback ForcedTaskDirective for THIS user with SAME order, PENDING, not expired, and
          applies_on_cycle <= current cycle (i.e., overdue admin directive). Pick the oldest applicable.
-      3) Else spawn a random ACTIVE REGULAR task (never admin at random).
+      3) Else deal the next ACTIVE REGULAR template from the user's shuffled deck that the
+         wallet (cash + bonus) covers (never admin without a directive).
 
     Side effects:
       • When spawning from a directive → mark directive CONSUMED immediately.
@@ -16,7 +17,7 @@ def spawn_next_task_for_user(user) -> "UserTask":
       • Ensures UserTaskProgress exists (brand new users / deleted rows).
     """
     from .models import (
-        UserTask, UserTaskTemplate, ForcedTaskDirective,
+        UserTask, ForcedTaskDirective,
     )
     # make sure progress row exists
     prog = ensure_task_progress(user)
@@ -42,40 +43,12 @@ def spawn_next_task_for_user(user) -> "UserTask":
     # Compute the user's "slot"
     next_order = prog.natural_next_order  # 1-based
     cycle = prog.cycles_completed
-    now = timezone.now()
 
-    # 1) Strict directive match (this cycle & this position)
-    strict = (
-        ForcedTaskDirective.objects
-        .filter(
-            user=user,
-            applies_on_cycle=cycle,
-            target_order=next_order,
-            status=ForcedTaskDirective.Status.PENDING,
-        )
-        .filter(Q(expires_at__isnull=True) | Q(expires_at__gt=now))
-        .select_related("template")
-        .order_by("created_at")
-        .first()
-    )
-
-    directive = strict
-
-    # 2) Fallback: same order, overdue (applies_on_cycle <= current cycle), still pending & not expired
-    if not directive:
-        directive = (
-            ForcedTaskDirective.objects
-            .filter(
-                user=user,
-                target_order=next_order,
-                status=ForcedTaskDirective.Status.PENDING,
-            )
-            .filter(Q(applies_on_cycle__lte=cycle))
-            .filter(Q(expires_at__isnull=True) | Q(expires_at__gt=now))
-            .select_related("template")
-            .order_by("applies_on_cycle", "created_at")  # oldest applicable first
-            .first()
-        )
+    # 1) + 2) The cycle plan names this slot's directive: strict (cycle, order) match, else the
+    #    oldest overdue one for the same order (applies_on_cycle <= current cycle); pending & not expired
+    from .task_plan import get_plan, planned_directive
+    plan = get_plan(prog)
+    directive = planned_directive(plan, user, next_order)
 
     if directive:
         if not directive.template:
@@ -104,46 +77,27 @@ def spawn_next_task_for_user(user) -> "UserTask":
         task.mark_admin_assigned_effects()
         return task
 
-    # 3) No directive: random ACTIVE REGULAR task (NEVER admin randomly)
-    tpl_qs = UserTaskTemplate.objects.filter(
-        status=UserTaskTemplate.Status.ACTIVE,
-        is_admin_task=False,
-    )
-    count = tpl_qs.count()
-    if count == 0:
+    # 3) No directive: next ACTIVE REGULAR template from the user's deck (NEVER admin without a directive)
+    from .template_index import get_index
+    index = get_index()   # price-sorted, effective prices resolved; rebuilt only on template/settings change
+    if not len(index):
         raise ValidationError("No active regular task templates available.")
 
     # --- NEW: wallet (cash + bonus) solvency gate for REGULAR tasks (no deduction) ---
-    wallet = getattr(user, "wallet", None)
-    wallet_cash_cents  = int(getattr(wallet, "balance_cents", 0) or 0)
-    wallet_bonus_cents = int(getattr(wallet, "bonus_cents", 0) or 0)
-    wallet_total_cents = wallet_cash_cents + wallet_bonus_cents  # CASH + BONUS
-
-    from .models import tasksettngs
-    s = tasksettngs.load()
+    from .user_summary import get_user_summary
+    wallet_total_cents = get_user_summary(user).wallet_total_cents  # CASH + BONUS
 
-    def _price_cents_for(tpl_obj):
-        # Use explicit template price if set, else fallback to TaskSettings.task_price
-        price_dec = tpl_obj.task_price if tpl_obj.task_price is not None else s.task_price
-        return to_cents(price_dec)
-
-    # Keep your randomness but limit pool to templates with price <= wallet TOTAL
-    templates = list(tpl_qs.only("id", "task_price"))
-    eligible = [t for t in templates if _price_cents_for(t) <= wallet_total_cents]
-
-    if not eligible:
+    # Next template from the user's shuffled deck among those with effective price <= wallet TOTAL
+    tpl_id = prog.deal_template(index, wallet_total_cents)
+    if tpl_id is None:
         raise ValidationError("No regular tasks match your current WALLET (cash + bonus). Please deposit to unlock more tasks.")
     # -----------------------------------------------------------------------------
 
-    # Preserve existing random behavior among eligible templates
-    tpl = random.choice(eligible)
-
-    price = tpl.effective_price()
-    commission = tpl.effective_commission()
+    price, commission = index.terms[tpl_id]
 
     task = UserTask.objects.create(
         user=user,
-        template=tpl,
+        template_id=tpl_id,
         cycle_number=cycle,
         order_shown=next_order,
         status=UserTask.Status.IN_PROGRESS,
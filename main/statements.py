@@ -0,0 +1,262 @@
+# statements.py
+"""
+Per-user account statements, streamed one month at a time.
+
+  - line items come from the live + archived ledger with .iterator(), merged by (created_at, id),
+    so a statement never holds more than one DB chunk in memory
+  - every closed month (local time, plus a safety lag for late commits) gets an immutable
+    WalletMonthRollup; opening balances and closed-month totals come from there, so a
+    download only reads the ledger rows of the months it prints
+  - formats: csv (one line per txn + OPENING/CLOSING lines per month) and jsonl
+"""
+from __future__ import annotations
+
+import csv
+import heapq
+import json
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Count, Min, Q, Sum
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import Wallet, WalletMonthRollup, WalletTxn, WalletTxnArchive
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson",
+}
+CSV_COLUMNS = ("date", "txn_id", "kind", "bucket", "amount", "memo", "reference", "cash_balance", "bonus_balance")
+
+# Same idea as CHECKPOINT_SAFETY_LAG: a row stamped 23:59:59 may commit after midnight
+ROLLUP_SAFETY_LAG = timedelta(minutes=5)
+
+LEDGER_FIELDS = ("id", "created_at", "kind", "bucket", "amount_cents", "memo", "memo_code", "memo_args", "external_ref")
+
+
+# ---- months ----
+def next_month(m: date) -> date:
+    return (m.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def parse_month(raw: str | None, default: date) -> date:
+    """'YYYY-MM' -> first day of that month; `default` when missing/garbled."""
+    try:
+        return datetime.strptime((raw or "").strip(), "%Y-%m").date()
+    except ValueError:
+        return default
+
+
+def open_month() -> date:
+    """First month that is not closed yet (normally the current one)."""
+    return timezone.localdate(timezone.now() - ROLLUP_SAFETY_LAG).replace(day=1)
+
+
+def max_months() -> int:
+    return int(getattr(settings, "STATEMENT_MAX_MONTHS", 24))
+
+
+def _bounds(month: date):
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(month, datetime.min.time()), tz)
+    end = timezone.make_aware(datetime.combine(next_month(month), datetime.min.time()), tz)
+    return start, end
+
+
+def _month_rows(model, wallet, month):
+    start, end = _bounds(month)
+    return model.objects.filter(wallet=wallet, created_at__gte=start, created_at__lt=end)
+
+
+# ---- rollups ----
+def _month_totals(wallet, month) -> dict:
+    totals = dict.fromkeys(
+        ("cash_in_cents", "cash_out_cents", "bonus_in_cents", "bonus_out_cents", "txn_count"), 0
+    )
+    for model in (WalletTxn, WalletTxnArchive):
+        for row in (
+            _month_rows(model, wallet, month)
+            .values("bucket")
+            .annotate(
+                credit=Sum("amount_cents", filter=Q(amount_cents__gt=0)),
+                debit=Sum("amount_cents", filter=Q(amount_cents__lt=0)),
+                n=Count("id"),
+            )
+        ):
+            prefix = "cash" if row["bucket"] == "CASH" else "bonus"
+            totals[f"{prefix}_in_cents"] += int(row["credit"] or 0)
+            totals[f"{prefix}_out_cents"] += int(row["debit"] or 0)
+            totals["txn_count"] += row["n"]
+    return totals
+
+
+def ensure_rollups(wallet, upto: date) -> dict:
+    """
+    Write the missing rollups for closed months before `upto` (capped at open_month()).
+    Months are built oldest-first from the newest existing rollup, so each ledger month is
+    aggregated once per wallet. Returns {month: WalletMonthRollup} for the new + existing ones.
+    """
+    upto = min(upto, open_month())
+    have = {r.month: r for r in WalletMonthRollup.objects.filter(wallet=wallet, month__lt=upto)}
+
+    if have:
+        last = have[max(have)]
+        month, cash, bonus = next_month(last.month), last.cash_closing_cents, last.bonus_closing_cents
+    else:
+        first = min(
+            (t for t in (
+                WalletTxn.objects.filter(wallet=wallet).aggregate(m=Min("created_at"))["m"],
+                WalletTxnArchive.objects.filter(wallet=wallet).aggregate(m=Min("created_at"))["m"],
+            ) if t),
+            default=None,
+        )
+        if first is None:
+            return have
+        month, cash, bonus = timezone.localdate(first).replace(day=1), 0, 0
+
+    new = []
+    while month < upto:
+        r = WalletMonthRollup(
+            wallet=wallet, month=month, cash_opening_cents=cash, bonus_opening_cents=bonus,
+            **_month_totals(wallet, month),
+        )
+        new.append(r)
+        cash, bonus = r.cash_closing_cents, r.bonus_closing_cents
+        month = next_month(month)
+    if new:
+        # Two downloads racing on the same wallet write identical rows; the second is dropped
+        WalletMonthRollup.objects.bulk_create(new, ignore_conflicts=True)
+        have.update((r.month, r) for r in new)
+    return have
+
+
+def _opening(rollups: dict, month: date) -> tuple[int, int]:
+    """(cash, bonus) at the start of `month`; rollups must cover every closed month before it."""
+    if month in rollups:
+        r = rollups[month]
+        return r.cash_opening_cents, r.bonus_opening_cents
+    earlier = [m for m in rollups if m < month]
+    if not earlier:
+        return 0, 0
+    r = rollups[max(earlier)]
+    return r.cash_closing_cents, r.bonus_closing_cents
+
+
+# ---- rendering ----
+def _eur(cents: int) -> str:
+    return f"{cents / 100:.2f}"
+
+
+class _Echo:
+    """csv.writer target that hands each line back instead of buffering it."""
+    def write(self, value):
+        return value
+
+
+def _ledger_iter(wallet, month):
+    sources = [
+        _month_rows(model, wallet, month).order_by("created_at", "id").only(*LEDGER_FIELDS).iterator(chunk_size=2000)
+        for model in (WalletTxnArchive, WalletTxn)
+    ]
+    return heapq.merge(*sources, key=lambda t: (t.created_at, t.id))
+
+
+def _events(wallet, start: date, end: date):
+    """
+    ("open"|"txn"|"close", month, payload) for months start..end inclusive, oldest first.
+    Payload balances are running per-bucket ledger sums.
+    """
+    rollups = ensure_rollups(wallet, next_month(end))
+    cash, bonus = _opening(rollups, start)
+    month = start
+    while month <= end:
+        yield "open", month, {"cash": cash, "bonus": bonus}
+        for t in _ledger_iter(wallet, month):
+            if t.bucket == "CASH":
+                cash += int(t.amount_cents)
+            else:
+                bonus += int(t.amount_cents)
+            yield "txn", month, {"txn": t, "cash": cash, "bonus": bonus}
+        r = rollups.get(month)
+        if r is not None:
+            # closed month: totals are the stored rollup, not a re-count
+            cash, bonus = r.cash_closing_cents, r.bonus_closing_cents
+        yield "close", month, {"cash": cash, "bonus": bonus, "rollup": r}
+        month = next_month(month)
+
+
+def iter_statement(wallet, start: date, end: date, fmt: str = "csv"):
+    """Yield statement chunks (str) for months start..end; fmt in FORMATS."""
+    if fmt == "jsonl":
+        yield from _iter_jsonl(wallet, start, end)
+    else:
+        yield from _iter_csv(wallet, start, end)
+
+
+def _iter_csv(wallet, start, end):
+    out = csv.writer(_Echo())
+    yield out.writerow(CSV_COLUMNS)
+    for event, month, p in _events(wallet, start, end):
+        if event == "txn":
+            t = p["txn"]
+            yield out.writerow((
+                timezone.localtime(t.created_at).isoformat(timespec="seconds"), t.id, t.kind, t.bucket,
+                _eur(int(t.amount_cents)), t.memo_text, t.external_ref or "", _eur(p["cash"]), _eur(p["bonus"]),
+            ))
+        else:
+            label = "OPENING" if event == "open" else "CLOSING"
+            yield out.writerow((f"{month:%Y-%m}", "", label, "", "", "", "", _eur(p["cash"]), _eur(p["bonus"])))
+
+
+def _iter_jsonl(wallet, start, end):
+    for event, month, p in _events(wallet, start, end):
+        if event == "txn":
+            t = p["txn"]
+            line = {
+                "type": "txn",
+                "id": t.id,
+                "created_at": timezone.localtime(t.created_at).isoformat(),
+                "kind": t.kind,
+                "bucket": t.bucket,
+                "amount_cents": int(t.amount_cents),
+                "memo": t.memo_text,
+                "reference": t.external_ref or "",
+                "cash_balance_cents": p["cash"],
+                "bonus_balance_cents": p["bonus"],
+            }
+        elif event == "open":
+            line = {"type": "month_open", "month": f"{month:%Y-%m}",
+                    "cash_cents": p["cash"], "bonus_cents": p["bonus"]}
+        else:
+            r = p["rollup"]
+            line = {"type": "month_close", "month": f"{month:%Y-%m}", "closed": r is not None,
+                    "cash_cents": p["cash"], "bonus_cents": p["bonus"]}
+            if r is not None:
+                line.update(
+                    cash_in_cents=r.cash_in_cents, cash_out_cents=r.cash_out_cents,
+                    bonus_in_cents=r.bonus_in_cents, bonus_out_cents=r.bonus_out_cents,
+                    txn_count=r.txn_count,
+                )
+        yield json.dumps(line, separators=(",", ":")) + "\n"
+
+
+def statement_range(get) -> tuple[date, date]:
+    """?from=YYYY-MM&to=YYYY-MM -> (start, end) months, clamped to STATEMENT_MAX_MONTHS ending at `to`."""
+    current = timezone.localdate().replace(day=1)
+    end = min(parse_month(get.get("to"), current), current)
+    start = min(parse_month(get.get("from"), end), end)
+    floor = end
+    for _ in range(max(1, max_months()) - 1):
+        floor = (floor - timedelta(days=1)).replace(day=1)
+    return max(start, floor), end
+
+
+def statement_response(user, get) -> StreamingHttpResponse:
+    """Streaming download for `user`; `get` is request.GET (from / to / format)."""
+    fmt = get.get("format") if get.get("format") in FORMATS else "csv"
+    start, end = statement_range(get)
+    wallet, _ = Wallet.objects.get_or_create(user=user)
+    resp = StreamingHttpResponse(iter_statement(wallet, start, end, fmt), content_type=FORMATS[fmt])
+    resp["Content-Disposition"] = f'attachment; filename="statement-{user.pk}-{start:%Y%m}-{end:%Y%m}.{fmt}"'
+    return resp
@@ -0,0 +1,154 @@
+# task_plan.py
+"""
+Per-cycle order plans: what each slot of a user's cycle serves, decided once per cycle.
+
+  - directives: {order: [[ForcedTaskDirective id, expires_at epoch or null], ...]} — the slot's
+    whole queue of PENDING directives, ranked strict match for the cycle first, then oldest overdue
+    (the rule spawn_next_task_for_user used to search for on every click)
+  - fortunes:   {order: FortuneCardRule id} — the user's own rule, else the global one
+REGULAR slots aren't planned: they deal from the user's template deck (UserTaskProgress.deal_template),
+so the wallet-dependent affordability rule is applied at click time.
+Plans are kept per (user, cycle) and tagged with prog.last_reset_at, so a re-run of the same
+cycle number (unblock / start_new_cycle) gets a fresh plan. Directive and fortune-rule writes
+drop the affected current-cycle plans (signals.py; bulk writes call invalidate_plans themselves);
+plans of finished cycles are never dropped.
+A directive slot costs one query however long its queue: entries past their expires_at are
+skipped in Python, and one pk__in fetch drops those canceled/expired since the plan was built.
+Expired directives are flipped to EXPIRED in bulk by `manage.py run_scheduler`, not on click.
+"""
+from __future__ import annotations
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+
+def _directive_rank(d, cycle):
+    # strict match for this cycle first, then the oldest overdue one
+    return (d.applies_on_cycle != cycle, d.applies_on_cycle, d.created_at, d.pk)
+
+
+def build_plan(prog):
+    """Compute and store the plan for prog's current cycle (replacing an older one)."""
+    from .models import FortuneCardRule, ForcedTaskDirective, UserTaskPlan  # local import to avoid circulars
+
+    cycle = int(prog.cycles_completed or 0)
+    slots = int(prog.limit_snapshot or 0)
+    now = timezone.now()
+
+    queues = {}
+    for d in (
+        ForcedTaskDirective.objects
+        .filter(user_id=prog.user_id, status=ForcedTaskDirective.Status.PENDING,
+                applies_on_cycle__lte=cycle, target_order__lte=slots)
+        .filter(Q(expires_at__isnull=True) | Q(expires_at__gt=now))
+        .only("id", "applies_on_cycle", "target_order", "created_at", "expires_at")
+    ):
+        queues.setdefault(d.target_order, []).append(d)
+    directives = {
+        str(order): [
+            [d.pk, d.expires_at.timestamp() if d.expires_at else None]
+            for d in sorted(queue, key=lambda d: _directive_rank(d, cycle))
+        ]
+        for order, queue in queues.items()
+    }
+
+    fortunes = {}
+    for rule_id, order, target in (
+        FortuneCardRule.objects
+        .filter(active=True, cycle_number=cycle, order_index__lte=slots)
+        .filter(Q(target_user_id=prog.user_id) | Q(target_user__isnull=True))
+        .filter(Q(expires_at__isnull=True) | Q(expires_at__gt=now))
+        .order_by("created_at")
+        .values_list("id", "order_index", "target_user_id")
+    ):
+        # newest wins; a user-specific rule beats any global one
+        key = str(order)
+        if target is not None or key not in fortunes or fortunes[key][1] is None:
+            fortunes[key] = (rule_id, target)
+    fortunes = {k: rule_id for k, (rule_id, _) in fortunes.items()}
+
+    values = {
+        "reset_at": prog.last_reset_at,
+        "slots": slots,
+        "directives": directives,
+        "fortunes": fortunes,
+    }
+    try:
+        with transaction.atomic():
+            plan, _ = UserTaskPlan.objects.update_or_create(
+                user_id=prog.user_id, cycle_number=cycle, defaults=values,
+            )
+    except IntegrityError:
+        # a concurrent click built it first
+        plan = UserTaskPlan.objects.get(user_id=prog.user_id, cycle_number=cycle)
+    return plan
+
+
+def get_plan(prog):
+    """The plan for prog's current cycle run: one indexed lookup, built on first use."""
+    from .models import UserTaskPlan
+
+    plan = UserTaskPlan.objects.filter(user_id=prog.user_id, cycle_number=prog.cycles_completed).first()
+    if plan is None or plan.reset_at != prog.last_reset_at or plan.slots != prog.limit_snapshot:
+        plan = build_plan(prog)
+    return plan
+
+
+def invalidate_plans(user_ids=None, *, from_cycle=0, cycle=None):
+    """
+    Drop plans so the next click rebuilds them (all users when user_ids is None).
+    Only a user's current cycle is ever dropped: finished cycles' plans stay for audit,
+    and later cycles have no plan until they start.
+    """
+    from .models import UserTaskPlan
+
+    qs = (
+        UserTaskPlan.objects
+        .filter(cycle_number__gte=F("user__task_progress__cycles_completed"))
+        .filter(cycle_number__gte=from_cycle)
+    )
+    if cycle is not None:
+        qs = qs.filter(cycle_number=cycle)
+    if user_ids is not None:
+        qs = qs.filter(user_id__in=list(user_ids))
+    qs.delete()
+
+
+# ---- slot lookups ----
+def planned_directive(plan, user, next_order: int):
+    """The first queued directive for this slot that is still PENDING and unexpired; None for a regular slot."""
+    from .models import ForcedTaskDirective
+
+    now = timezone.now()
+    cutoff = now.timestamp()
+    queue = [pk for pk, expires in plan.directives.get(str(next_order), ()) if expires is None or expires > cutoff]
+    if not queue:
+        return None
+    live = {
+        d.pk: d for d in
+        ForcedTaskDirective.objects
+        .filter(pk__in=queue, user=user, target_order=next_order, applies_on_cycle__lte=plan.cycle_number,
+                status=ForcedTaskDirective.Status.PENDING)
+        .filter(Q(expires_at__isnull=True) | Q(expires_at__gt=now))
+        .select_related("template")
+    }
+    return next((live[pk] for pk in queue if pk in live), None)
+
+
+def planned_fortune_rule(plan, user, order_index: int):
+    """The fortune rule planned for this slot if still active; None when the slot has none."""
+    from .models import FortuneCardRule, _active_rule_for_slot
+
+    rule_id = plan.fortunes.get(str(order_index))
+    if rule_id is None:
+        return None
+    now = timezone.now()
+    rule = (
+        FortuneCardRule.objects
+        .filter(pk=rule_id, active=True, cycle_number=plan.cycle_number, order_index=order_index)
+        .filter(Q(target_user=user) | Q(target_user__isnull=True))
+        .filter(Q(expires_at__isnull=True) | Q(expires_at__gt=now))
+        .first()
+    )
+    return rule or _active_rule_for_slot(user, plan.cycle_number, order_index)
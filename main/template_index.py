@@ -0,0 +1,116 @@
+# template_index.py
+"""
+Process-local, price-sorted index of the templates a REGULAR spawn may pick.
+
+  - one entry per ACTIVE non-admin UserTaskTemplate, sorted by effective price (cents),
+    with its effective price/commission already resolved against tasksettngs
+  - keyed by CacheVersion "task_templates": template and tasksettngs writes bump it
+    (signals + the bulk admin actions), so every process rebuilds on its next spawn
+  - deal(): the next affordable template from a user's rotation deck (a keyed shuffle of
+    the index positions plus a cursor, stored on UserTaskProgress.deck), so a spawn costs
+    one version lookup however large the catalog is and never needs the user's task history
+"""
+from __future__ import annotations
+
+import random
+from bisect import bisect_right
+from dataclasses import dataclass
+from decimal import Decimal
+
+VERSION_KEY = "task_templates"
+DECK_ROUNDS = 4
+
+
+def _shuffled(i: int, n: int, key: int) -> int:
+    """
+    Position i of a keyed permutation of range(n) in O(1): a small Feistel network over the
+    smallest even-bit domain >= n, cycle-walking until the value falls inside range(n).
+    """
+    half = max(1, ((n - 1).bit_length() + 1) // 2)
+    mask = (1 << half) - 1
+    x = i
+    while True:
+        left, right = x >> half, x & mask
+        for r in range(DECK_ROUNDS):
+            f = ((right ^ (key >> (16 * r))) * 0x45D9F3B) & 0xFFFFFFFF
+            left, right = right, left ^ ((f ^ (f >> 16)) & mask)
+        x = (left << half) | right
+        if x < n:
+            return x
+
+
+@dataclass(frozen=True)
+class TemplateIndex:
+    version: int
+    prices: tuple          # ascending effective price in cents
+    ids: tuple             # template id for each price
+    terms: dict            # id -> (price Decimal, commission Decimal)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def deal(self, deck: dict, budget_cents: int, run, *, rng=None):
+        """
+        Next template id with price <= budget_cents from a rotation deck → (id or None, deck).
+          - deck = {"v": index version, "run": run, "k": shuffle key, "i": cursor}; dealt afresh
+            when the catalog changed or `run` (the cycle run) differs, so every template comes
+            up once before any repeats within a run
+          - positions past the affordable prefix are skipped, not consumed out of order
+        """
+        n = len(self.ids)
+        affordable = bisect_right(self.prices, budget_cents)
+        if not affordable:
+            return None, deck
+        if not deck or deck.get("v") != self.version or deck.get("run") != run:
+            deck = {"v": self.version, "run": run, "k": (rng or random).getrandbits(64), "i": 0}
+        start = deck["i"]
+        for step in range(n):
+            pos = _shuffled((start + step) % n, n, deck["k"])
+            if pos < affordable:
+                return self.ids[pos], {**deck, "i": (start + step + 1) % n}
+        return None, deck   # not reached: the permutation visits every position
+
+
+_index: TemplateIndex | None = None
+
+
+def build_index(version: int) -> TemplateIndex:
+    from .models import UserTaskTemplate, tasksettngs  # local import to avoid circulars
+    from .task_currency import to_cents
+
+    s = tasksettngs.load()
+    entries = []
+    terms = {}
+    for tpl_id, price, commission in UserTaskTemplate.objects.filter(
+        status=UserTaskTemplate.Status.ACTIVE,
+        is_admin_task=False,
+    ).order_by().values_list("id", "task_price", "task_commission"):
+        price = price if price is not None else s.task_price
+        commission = commission if commission is not None else s.task_commission
+        entries.append((to_cents(price), tpl_id))
+        terms[tpl_id] = (Decimal(price), Decimal(commission))
+    entries.sort()
+    return TemplateIndex(
+        version=version,
+        prices=tuple(p for p, _ in entries),
+        ids=tuple(i for _, i in entries),
+        terms=terms,
+    )
+
+
+def get_index() -> TemplateIndex:
+    """The current index; rebuilt only when the shared version moved."""
+    global _index
+    from .models import CacheVersion
+
+    version = CacheVersion.current(VERSION_KEY)
+    idx = _index
+    if idx is None or idx.version != version:
+        idx = _index = build_index(version)
+    return idx
+
+
+def invalidate() -> None:
+    """Bump the shared version (call inside the writing transaction)."""
+    from .models import CacheVersion
+    CacheVersion.bump(VERSION_KEY)
@@ -1,3 +1,760 @@
-from django.test import TestCase
+import io
+from datetime import datetime, timedelta
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import F
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from . import activity, outbox, statements, user_summary
+from .admin import mark_withdrawals_completed
+from .ledger_codes import BUCKET_CODES, KIND_CODES, MEMO_TEMPLATES, encode_memo, render_memo
+from .management.commands.reconcile_wallets import reconcile_range
+from .models import (
+    InsufficientFunds, LedgerEntry, OutboxEvent, PayoutAddress, UserTask, UserTaskPlan, UserTaskProgress,
+    UserTaskTemplate, VersionConflict, Wallet, WalletAdjustmentImport, WalletAdjustmentRow, WalletCheckpoint,
+    WalletHold, WalletMonthRollup, WalletTxn, WalletTxnArchive, WithdrawalRequest, WithdrawalStatus,
+    ensure_task_progress, tasksettngs,
+)
+from .task_plan import invalidate_plans
+from .template_index import TemplateIndex
+from .user_summary import get_user_summary
+from .wallet_history import history_page
+from .wallet_import import apply_chunk, validate_upload
+
+
+def make_user(phone="+10000000001", **extra):
+    return get_user_model().objects.create_user(phone=phone, password="pw", **extra)
+
+
+def make_withdrawal(user, amount_cents, *, fee_cents=0, status=WithdrawalStatus.PENDING):
+    address, _ = PayoutAddress.objects.get_or_create(user=user, address_type="TRC20", defaults={"address": "T" * 34})
+    return WithdrawalRequest.objects.create(
+        user=user, amount_cents=amount_cents, fee_cents=fee_cents, address=address, status=status,
+    )
+
+
+def make_task(user, *, kind=UserTask.Kind.REGULAR, price="10.00", commission="1.50", order=1):
+    template = UserTaskTemplate.objects.create(
+        hotel_name=f"Hotel {order}", slug=f"hotel-{user.pk}-{order}", country="FR", city="Paris",
+        status=UserTaskTemplate.Status.ACTIVE, is_admin_task=kind == UserTask.Kind.ADMIN,
+    )
+    return UserTask.objects.create(
+        user=user, template=template, order_shown=order, task_kind=kind,
+        price_used=Decimal(price), commission_used=Decimal(commission),
+    )
+
+
+def admin_request(user):
+    request = RequestFactory().post("/")
+    request.user = user
+    request._messages = CookieStorage(request)
+    return request
+
+
+class WalletReplayTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.wallet = Wallet.objects.get(user=self.user)
+        self.cash0 = self.wallet.balance_cents
+
+    def cash(self):
+        return Wallet.objects.get(pk=self.wallet.pk).balance_cents
+
+    def test_credit_once_replay_posts_once(self):
+        self.assertTrue(self.wallet.credit_once(500, kind="DEPOSIT", external_ref="dep:1"))
+        self.assertFalse(self.wallet.credit_once(500, kind="DEPOSIT", external_ref="dep:1"))
+        self.assertEqual(WalletTxn.objects.filter(wallet=self.wallet, external_ref="dep:1").count(), 1)
+        self.assertEqual(self.cash(), self.cash0 + 500)
+
+    def test_debit_once_replay_posts_once(self):
+        self.wallet.credit_once(1000, external_ref="seed")
+        self.assertTrue(self.wallet.debit_once(300, kind="WITHDRAW", external_ref="wd:1"))
+        self.assertFalse(self.wallet.debit_once(300, kind="WITHDRAW", external_ref="wd:1"))
+        self.assertEqual(WalletTxn.objects.filter(wallet=self.wallet, external_ref="wd:1").count(), 1)
+        self.assertEqual(self.cash(), self.cash0 + 700)
+
+    def test_unkeyed_rows_do_not_collide(self):
+        self.wallet.credit(100)
+        self.wallet.credit(100)
+        self.assertEqual(WalletTxn.objects.filter(wallet=self.wallet, external_ref__isnull=True, bucket="CASH").count(), 2)
+        self.assertEqual(self.cash(), self.cash0 + 200)
+
+    def test_post_batch_replay_posts_once(self):
+        entries = [LedgerEntry(wallet_id=self.wallet.pk, amount_cents=250, external_ref="TRIAL_BONUS")]
+        self.assertEqual(len(Wallet.post_batch(entries)), 1)
+        self.assertEqual(Wallet.post_batch(entries), [])
+        self.assertEqual(WalletTxn.objects.filter(wallet=self.wallet, external_ref="TRIAL_BONUS").count(), 1)
+        self.assertEqual(self.cash(), self.cash0 + 250)
+
+
+class LedgerCodesTests(TestCase):
+    def setUp(self):
+        self.wallet = Wallet.objects.get(user=make_user())
+        WalletTxn.objects.filter(wallet=self.wallet).delete()   # signup bonus
+
+    def test_every_memo_template_round_trips(self):
+        for code, template in MEMO_TEMPLATES.items():
+            text = template.format(*["42", "007"][: template.count("{")])
+            self.assertEqual(encode_memo(text)[0], code, text)
+            self.assertEqual(render_memo(*encode_memo(text)), text)
+        self.assertEqual(encode_memo("Withdrawal #007"), (2, ["007"]))   # leading zeros stay text
+        self.assertIsNone(encode_memo("Deposit "))
+        self.assertIsNone(encode_memo("refund, see ticket 81"))
+
+    def test_rows_store_codes_and_read_names(self):
+        t = WalletTxn.objects.create(wallet=self.wallet, amount_cents=-300, kind="WITHDRAW", memo="Withdrawal #12")
+        raw = WalletTxn.objects.filter(pk=t.pk).values_list(F("kind") + 0, F("bucket") + 0, "memo", "memo_code").get()
+        self.assertEqual(raw, (KIND_CODES["WITHDRAW"], BUCKET_CODES["CASH"], "", 2))
+        t = WalletTxn.objects.get(pk=t.pk)
+        self.assertEqual((t.kind, t.bucket, t.memo_text), ("WITHDRAW", "CASH", "Withdrawal #12"))
+
+    def test_name_filters_on_live_and_archive_rows(self):
+        now = timezone.now()
+        WalletTxn.objects.create(wallet=self.wallet, amount_cents=100, kind="DEPOSIT", memo="free text")
+        WalletTxn.objects.create(wallet=self.wallet, amount_cents=5, kind="BONUS", bucket="BONUS")
+        WalletTxnArchive.objects.create(id=10**9, month=now.date().replace(day=1), wallet=self.wallet,
+                                        amount_cents=-50, kind="PAYOUT", created_at=now)
+        live = WalletTxn.objects.filter(wallet=self.wallet)
+        self.assertEqual(sorted(live.filter(kind__in=["DEPOSIT", "WITHDRAW"]).values_list("kind", "memo")),
+                         [("DEPOSIT", "free text")])
+        self.assertEqual(list(live.exclude(bucket="CASH").values_list("kind", flat=True)), ["BONUS"])
+        self.assertEqual(list(WalletTxnArchive.objects.filter(kind__in=["PAYOUT"]).values_list("kind", "bucket")),
+                         [("PAYOUT", "CASH")])
+
+    def test_unknown_names_are_not_written(self):
+        with self.assertRaises(ValueError):
+            WalletTxn.objects.create(wallet=self.wallet, amount_cents=1, kind="REFUND")
+        with self.assertRaises(ValidationError):
+            WalletTxn._meta.get_field("kind").to_python("REFUND")
+
+
+class MarkWithdrawalsCompletedTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.admin = make_user("+10000000002", is_staff=True)
+        self.wallet = Wallet.objects.get(user=self.user)
+        self.wallet.credit_once(10_000, kind="DEPOSIT", external_ref="dep:seed")
+
+    def test_only_pending_requests_are_confirmed_and_debited(self):
+        pending = make_withdrawal(self.user, 1_000, fee_cents=100)
+        self.wallet.reserve(1_100, withdrawal=pending)
+        failed = make_withdrawal(self.user, 2_000)
+        self.wallet.release(self.wallet.reserve(2_000, withdrawal=failed))
+        failed.status = WithdrawalStatus.FAILED
+        failed.save(update_fields=["status"])
+
+        mark_withdrawals_completed(None, admin_request(self.admin), WithdrawalRequest.objects.all())
+
+        pending.refresh_from_db()
+        failed.refresh_from_db()
+        self.assertEqual(pending.status, WithdrawalStatus.CONFIRMED)
+        self.assertEqual(failed.status, WithdrawalStatus.FAILED)
+        self.assertFalse(WalletTxn.objects.filter(external_ref=f"wd:{failed.pk}").exists())
+        self.assertEqual(WalletHold.objects.get(withdrawal=pending).status, WalletHold.Status.CAPTURED)
+        w = Wallet.objects.get(pk=self.wallet.pk)
+        self.assertEqual((w.balance_cents, w.pending_cents), (8_900, 0))
+
+
+class WalletHoldTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.wallet = Wallet.objects.get(user=self.user)
+        self.wallet.credit_once(5_000, kind="DEPOSIT", external_ref="dep:seed")
+
+    def buckets(self):
+        w = Wallet.objects.get(pk=self.wallet.pk)
+        return w.balance_cents, w.pending_cents
+
+    def test_reserve_then_capture(self):
+        wr = make_withdrawal(self.user, 1_000)
+        hold = self.wallet.reserve(1_000, withdrawal=wr)
+        self.assertEqual(self.buckets(), (4_000, 1_000))
+        self.assertTrue(self.wallet.capture(hold, external_ref=f"wd:{wr.pk}"))
+        self.assertFalse(self.wallet.capture(hold, external_ref=f"wd:{wr.pk}"))
+        self.assertEqual(self.buckets(), (4_000, 0))
+        row = WalletTxn.objects.get(external_ref=f"wd:{wr.pk}")
+        self.assertEqual((row.amount_cents, row.withdrawal_id), (-1_000, wr.pk))
+
+    def test_reserve_then_release(self):
+        hold = self.wallet.reserve(1_000)
+        self.assertTrue(self.wallet.release(hold))
+        self.assertFalse(self.wallet.release(hold))
+        self.assertFalse(self.wallet.capture(hold))
+        self.assertEqual(self.buckets(), (5_000, 0))
+        self.assertEqual(WalletHold.objects.get(pk=hold.pk).status, WalletHold.Status.RELEASED)
+
+    def test_reserve_beyond_available_cash(self):
+        with self.assertRaises(InsufficientFunds):
+            self.wallet.reserve(5_001)
+        self.assertEqual(self.buckets(), (5_000, 0))
+
+    def test_capture_of_an_already_debited_ref_releases_the_hold(self):
+        wr = make_withdrawal(self.user, 1_000)
+        self.wallet.debit_once(1_000, kind="WITHDRAW", external_ref=f"wd:{wr.pk}")
+        hold = self.wallet.reserve(1_000, withdrawal=wr)
+        self.assertFalse(self.wallet.capture(hold, external_ref=f"wd:{wr.pk}"))
+        self.assertEqual(self.buckets(), (4_000, 0))
+        self.assertEqual(WalletTxn.objects.filter(external_ref=f"wd:{wr.pk}").count(), 1)
+        self.assertEqual(WalletHold.objects.get(pk=hold.pk).status, WalletHold.Status.RELEASED)
+
+
+class AdoptLegacyWithdrawalsTests(TestCase):
+    migration = import_module("main.migrations.0046_adopt_legacy_withdrawal_holds")
+
+    def setUp(self):
+        self.user = make_user()
+        self.admin = make_user("+10000000002", is_staff=True)
+        self.wallet = Wallet.objects.get(user=self.user)
+        self.wallet.credit_once(5_000, kind="DEPOSIT", external_ref="dep:seed")
+
+    def legacy_withdrawal(self, amount_cents, fee_cents):
+        # what the pre-hold withdrawal view did: amount only, balance → pending
+        wr = make_withdrawal(self.user, amount_cents, fee_cents=fee_cents)
+        Wallet.objects.filter(pk=self.wallet.pk).update(
+            balance_cents=F("balance_cents") - amount_cents, pending_cents=F("pending_cents") + amount_cents,
+        )
+        return wr
+
+    def test_adopted_request_is_settled_out_of_pending(self):
+        wr = self.legacy_withdrawal(1_000, 100)
+        self.migration.adopt_legacy_withdrawals(apps, None)
+
+        hold = WalletHold.objects.get(withdrawal=wr)
+        self.assertEqual((hold.status, hold.amount_cents), (WalletHold.Status.HELD, 1_100))
+        mark_withdrawals_completed(None, admin_request(self.admin), WithdrawalRequest.objects.filter(pk=wr.pk))
+
+        w = Wallet.objects.get(pk=self.wallet.pk)
+        self.assertEqual((w.balance_cents, w.pending_cents), (3_900, 0))
+        self.assertEqual(WalletTxn.objects.get(external_ref=f"wd:{wr.pk}").amount_cents, -1_100)
+
+    def test_request_without_pending_cover_is_left_alone(self):
+        wr = make_withdrawal(self.user, 1_000)
+        self.migration.adopt_legacy_withdrawals(apps, None)
+        self.assertFalse(WalletHold.objects.filter(withdrawal=wr).exists())
+
+
+class DisplayTotalsTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        Wallet.objects.filter(user=self.user).update(balance_cents=10_000, bonus_cents=0)
+        prog = ensure_task_progress(self.user)
+        UserTaskProgress.objects.filter(pk=prog.pk).update(
+            dividends_cents=3_000, dividends_paid_cents=3_000, processing_cents=0,
+            admin_approved_count=1, admin_paid_cents=6_000,
+        )
+
+    def totals(self):
+        prog = UserTaskProgress.objects.select_related("user__wallet").get(user=self.user)
+        return prog.display_totals
+
+    def test_admin_paid_rule_is_off_by_default(self):
+        t = self.totals()
+        self.assertEqual((t["total_asset_cents"], t["asset_cents"], t["dividends_cents"]), (10_000, 7_000, 3_000))
+
+    @override_settings(DASHBOARD_ADMIN_PAID_ASSET=True)
+    def test_admin_paid_rule_when_enabled(self):
+        t = self.totals()
+        self.assertEqual((t["total_asset_cents"], t["asset_cents"], t["dividends_cents"]), (10_000, 6_000, 3_000))
+
+
+class UserSummaryCacheTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.wallet = Wallet.objects.get(user=self.user)
+
+    def test_reads_inside_a_transaction_see_its_own_writes(self):
+        cash0 = get_user_summary(self.user).cash_cents   # cached
+        with transaction.atomic():
+            self.wallet.credit_once(500, kind="DEPOSIT", external_ref="dep:1")
+            self.assertEqual(get_user_summary(self.user).cash_cents, cash0 + 500)
+        self.assertEqual(get_user_summary(self.user).cash_cents, cash0 + 500)
+
+    def test_rolled_back_writes_never_reach_the_cache(self):
+        cash0 = get_user_summary(self.user).cash_cents
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.wallet.credit_once(500, kind="DEPOSIT", external_ref="dep:1")
+            get_user_summary(self.user)
+            raise RuntimeError
+        self.assertEqual(get_user_summary(self.user).cash_cents, cash0)
+
+    def test_a_write_in_another_process_reaches_this_cache(self):
+        cash0 = get_user_summary(self.user).cash_cents   # cached in this process
+        # the writer's worker has its own LocMem cache
+        with mock.patch.object(user_summary, "cache", LocMemCache("other-worker", {})):
+            self.wallet.credit_once(500, kind="DEPOSIT", external_ref="dep:1")
+        self.assertEqual(get_user_summary(self.user).cash_cents, cash0 + 500)
+
+    def test_a_build_stored_after_the_commit_is_not_served(self):
+        cash0 = get_user_summary(self.user).cash_cents
+        cache.clear()
+        real_build = user_summary.build_user_summary
+
+        def slow_build(user):
+            summary = real_build(user)   # read before the write commits ...
+            self.wallet.credit_once(500, kind="DEPOSIT", external_ref="dep:1")
+            return summary               # ... and cached after it
+
+        with mock.patch.object(user_summary, "build_user_summary", slow_build):
+            self.assertEqual(get_user_summary(self.user).cash_cents, cash0)
+        self.assertEqual(get_user_summary(self.user).cash_cents, cash0 + 500)
+
+
+class WalletImportTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.wallet = Wallet.objects.get(user=self.user)
+
+    def upload(self, *lines):
+        body = "user,amount,external_ref\n" + "".join(f"{line}\n" for line in lines)
+        return validate_upload(io.BytesIO(body.encode()), filename="t.csv")
+
+    def test_ambiguous_or_non_finite_amounts_are_line_errors(self):
+        batch = self.upload(
+            f'{self.user.pk},"12,50",a', f"{self.user.pk},Infinity,b", f"{self.user.pk},NaN,c",
+            f"{self.user.pk},1e3,d", f"{self.user.pk},1.005,e",
+        )
+        self.assertEqual(batch.status, WalletAdjustmentImport.Status.REJECTED)
+        self.assertEqual(batch.error_count, 5)
+        self.assertFalse(batch.rows.exists())
+
+    def test_apply_and_reapply(self):
+        batch = self.upload(f"{self.user.pk},12.50,adj-1", f"{self.user.phone},-2,adj-2")
+        self.assertEqual(batch.status, WalletAdjustmentImport.Status.VALIDATED)
+        self.assertEqual((batch.credit_cents, batch.debit_cents), (1_250, -200))
+        cash0 = Wallet.objects.get(pk=self.wallet.pk).balance_cents
+
+        apply_chunk(batch)
+        again = self.upload(f"{self.user.pk},12.50,adj-1")
+        apply_chunk(again)
+
+        self.assertEqual(Wallet.objects.get(pk=self.wallet.pk).balance_cents, cash0 + 1_050)
+        self.assertEqual(WalletTxn.objects.filter(wallet=self.wallet, external_ref="adj-1").count(), 1)
+        self.assertEqual(again.rows.get().status, WalletAdjustmentRow.Status.SKIPPED)
+
+    def test_any_bad_line_rejects_the_upload(self):
+        batch = self.upload(
+            f"{self.user.pk},5.00,ok", f"{self.user.pk},five,amt", f"{self.user.phone},1.00,ok",
+            "+19999999999,1.00,who", "999999,1.00,who",
+        )
+        self.assertEqual(batch.status, WalletAdjustmentImport.Status.REJECTED)
+        self.assertEqual(batch.errors, [
+            "line 3: amount 'five' is not a non-zero EUR amount like 12.50 or -12.50",
+            "line 4: duplicate external_ref 'ok' for this user",
+            "line 5: unknown user '+19999999999'",
+            "line 6: unknown user '999999'",
+        ])
+        self.assertFalse(batch.rows.exists())
+
+    def test_users_without_a_wallet_get_one(self):
+        other = make_user("+10000000002")
+        Wallet.objects.filter(user=other).delete()
+        batch = self.upload(f"{other.pk},3.00,adj-1")
+        self.assertEqual(batch.status, WalletAdjustmentImport.Status.VALIDATED)
+        apply_chunk(batch)
+        self.assertEqual(Wallet.objects.get(user=other).balance_cents, 300)
+
+    @override_settings(WALLET_IMPORT_CHUNK=2)
+    def test_applies_in_chunks(self):
+        batch = self.upload(*(f"{self.user.pk},1.00,adj-{i}" for i in range(3)))
+        batch = apply_chunk(batch)
+        self.assertEqual((batch.status, batch.applied_rows), (WalletAdjustmentImport.Status.APPLYING, 2))
+        batch = apply_chunk(batch)
+        self.assertEqual((batch.status, batch.applied_rows), (WalletAdjustmentImport.Status.DONE, 3))
+        self.assertEqual(WalletTxn.objects.filter(wallet=self.wallet, kind="ADJUST").count(), 3)
+
+    def test_reapplying_posted_rows_skips_them(self):
+        batch = apply_chunk(self.upload(f"{self.user.pk},1.00,adj-1", f"{self.user.pk},2.00,adj-2"))
+        cash = Wallet.objects.get(pk=self.wallet.pk).balance_cents
+        # a crash after posting but before the rows were marked
+        batch.rows.update(status=WalletAdjustmentRow.Status.PENDING)
+        WalletAdjustmentImport.objects.filter(pk=batch.pk).update(status=WalletAdjustmentImport.Status.APPLYING)
+        batch.refresh_from_db()
+
+        batch = apply_chunk(batch)
+        self.assertEqual(batch.skipped_rows, 2)
+        self.assertEqual(set(batch.rows.values_list("status", flat=True)), {WalletAdjustmentRow.Status.SKIPPED})
+        self.assertEqual(Wallet.objects.get(pk=self.wallet.pk).balance_cents, cash)
+        self.assertEqual(WalletTxn.objects.filter(wallet=self.wallet, kind="ADJUST").count(), 2)
+
+
+class StatementTests(TestCase):
+    def setUp(self):
+        self.wallet = Wallet.objects.get(user=make_user())
+        WalletTxn.objects.filter(wallet=self.wallet).delete()   # signup bonus
+        self.m0 = statements.open_month()
+        self.m1 = (self.m0 - timedelta(days=1)).replace(day=1)
+        self.m2 = (self.m1 - timedelta(days=1)).replace(day=1)
+
+    def at(self, month, day=10, hour=12):
+        return timezone.make_aware(datetime(month.year, month.month, day, hour))
+
+    def live(self, when, amount, bucket="CASH"):
+        t = WalletTxn.objects.create(wallet=self.wallet, amount_cents=amount, kind="ADJUST", bucket=bucket)
+        WalletTxn.objects.filter(pk=t.pk).update(created_at=when)
+
+    def archived(self, pk, when, amount, bucket="CASH"):
+        WalletTxnArchive.objects.create(id=pk, month=when.date().replace(day=1), wallet=self.wallet,
+                                        amount_cents=amount, kind="ADJUST", bucket=bucket, created_at=when)
+
+    def closings(self):
+        return {m: (p["cash"], p["bonus"]) for e, m, p in statements._events(self.wallet, self.m2, self.m0)
+                if e == "close"}
+
+    def ledger_sum(self, before):
+        total = {"CASH": 0, "BONUS": 0}
+        for model in (WalletTxn, WalletTxnArchive):
+            for bucket, amount in model.objects.filter(wallet=self.wallet, created_at__lt=before).values_list(
+                    "bucket", "amount_cents"):
+                total[bucket] += amount
+        return total["CASH"], total["BONUS"]
+
+    def test_closing_balances_match_the_ledger(self):
+        self.archived(10**9, self.at(self.m2), 1_000)
+        self.archived(10**9 + 1, self.at(self.m2, 20), 300, bucket="BONUS")
+        self.live(self.at(self.m2, 25), -200)
+        self.archived(10**9 + 2, self.at(self.m1, 1, 0), 50)      # first instant of the month
+        self.live(self.at(self.m1), -100, bucket="BONUS")
+        self.live(self.at(self.m0, 1, 0), 700)
+
+        expected = {m: self.ledger_sum(self.at(statements.next_month(m), 1, 0)) for m in (self.m2, self.m1, self.m0)}
+        self.assertEqual(expected[self.m0], (1_550, 200))
+        self.assertEqual(self.closings(), expected)
+
+        rollups = WalletMonthRollup.objects.filter(wallet=self.wallet).order_by("month")
+        self.assertEqual([r.month for r in rollups], [self.m2, self.m1])   # the open month is never frozen
+        self.assertEqual([r.txn_count for r in rollups], [3, 2])
+        self.assertEqual(self.closings(), expected)                         # second pass reads the rollups
+        csv_lines = "".join(statements.iter_statement(self.wallet, self.m2, self.m0)).splitlines()
+        self.assertEqual(csv_lines[-1], f"{self.m0:%Y-%m},,CLOSING,,,,,15.50,2.00")
+
+
+class WalletHistoryTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.wallet = Wallet.objects.get(user=self.user)
+        WalletTxn.objects.filter(wallet=self.wallet).delete()   # signup bonus
+        self.wallet.archived_upto = timezone.now()
+        self.wallet.save(update_fields=["archived_upto"])
+        self.tie = timezone.now() - timedelta(days=1)
+
+    def txn(self, when, kind="ADJUST", **extra):
+        t = WalletTxn.objects.create(wallet=self.wallet, amount_cents=100, kind=kind, **extra)
+        WalletTxn.objects.filter(pk=t.pk).update(created_at=when)
+        return t
+
+    def request(self, when, status=WithdrawalStatus.PENDING):
+        wd = make_withdrawal(self.user, 100, status=status)
+        WithdrawalRequest.objects.filter(pk=wd.pk).update(created_at=when)
+        return wd
+
+    def walk(self, **kwargs):
+        seen, cursor = [], None
+        while True:
+            rows, cursor = history_page(self.user, self.wallet, cursor=cursor, limit=2, **kwargs)
+            seen += [(r["source"], r["obj_id"]) for r in rows]
+            if not cursor:
+                return seen
+
+    def test_pages_across_ties_skip_and_repeat_nothing(self):
+        live = [self.txn(self.tie) for _ in range(3)]
+        archived = [
+            WalletTxnArchive.objects.create(id=10**9 + i, month=self.tie.date().replace(day=1), wallet=self.wallet,
+                                            amount_cents=-5, kind="PAYOUT", created_at=self.tie)
+            for i in range(2)
+        ]
+        requests = [self.request(self.tie) for _ in range(3)]
+        newer = self.txn(self.tie + timedelta(microseconds=1))
+        older = self.request(self.tie - timedelta(microseconds=1))
+
+        txn_ids = sorted([t.pk for t in live] + [a.pk for a in archived], reverse=True)
+        self.assertEqual(self.walk(), [
+            ("txn", newer.pk),
+            *[("txn", pk) for pk in txn_ids],
+            *[("request", wd.pk) for wd in reversed(requests)],
+            ("request", older.pk),
+        ])
+
+    def test_confirmed_requests_with_a_ledger_row_are_not_repeated(self):
+        shown = self.request(self.tie, status=WithdrawalStatus.CONFIRMED)
+        linked = self.request(self.tie, status=WithdrawalStatus.CONFIRMED)
+        linked_archived = self.request(self.tie, status=WithdrawalStatus.CONFIRMED)
+        row = self.txn(self.tie, kind="WITHDRAW", withdrawal=linked)
+        WalletTxnArchive.objects.create(id=10**9, month=self.tie.date().replace(day=1), wallet=self.wallet,
+                                        amount_cents=-100, kind="WITHDRAW", created_at=self.tie,
+                                        withdrawal=linked_archived)
+        self.assertEqual(self.walk(tab="withdrawal"), [("txn", 10**9), ("txn", row.pk), ("request", shown.pk)])
+
+
+class ReconcileTests(TestCase):
+    def setUp(self):
+        self.wallet = Wallet.objects.get(user=make_user())
+
+    def reconcile(self, use_checkpoints=False):
+        return reconcile_range(self.wallet.pk, self.wallet.pk, use_checkpoints=use_checkpoints)
+
+    def assert_post_between_the_two_reads_is_not_drift(self, use_checkpoints):
+        real_filter = Wallet.objects.filter
+        posted = []
+
+        def filter_after_a_post(*args, **kwargs):
+            if not posted and "pk__range" in kwargs:   # ledger already summed, wallets not read yet
+                posted.append(self.wallet.credit_once(500, kind="DEPOSIT", external_ref="dep:1"))
+            return real_filter(*args, **kwargs)
+
+        with mock.patch.object(Wallet.objects, "filter", filter_after_a_post):
+            self.assertEqual(self.reconcile(use_checkpoints), (1, []))
+        self.assertEqual(posted, [True])
+
+    def test_a_post_between_the_two_reads_is_not_drift(self):
+        self.assert_post_between_the_two_reads_is_not_drift(use_checkpoints=False)
+
+    def test_a_post_between_the_two_reads_after_a_checkpoint(self):
+        self.wallet.credit_once(100, kind="DEPOSIT", external_ref="dep:0")
+        WalletTxn.objects.update(created_at=timezone.now() - timedelta(hours=1))   # past the safety lag
+        call_command("checkpoint_wallets", stdout=io.StringIO())
+        self.assertTrue(WalletCheckpoint.objects.filter(wallet=self.wallet).exists())
+        self.assert_post_between_the_two_reads_is_not_drift(use_checkpoints=True)
+
+    def test_real_drift_is_reported(self):
+        Wallet.objects.filter(pk=self.wallet.pk).update(balance_cents=F("balance_cents") + 7)
+        checked, drift = self.reconcile()
+        self.assertEqual((checked, [(d["bucket"], d["drift_cents"]) for d in drift]), (1, [("CASH", 7)]))
+
+
+class InvalidatePlansTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.other = make_user("+10000000002")
+        for user, current in ((self.user, 2), (self.other, 1)):
+            UserTaskProgress.objects.filter(pk=ensure_task_progress(user).pk).update(cycles_completed=current)
+            for cycle in range(current + 1):
+                UserTaskPlan.objects.create(user=user, cycle_number=cycle)
+
+    def cycles(self, user):
+        return sorted(UserTaskPlan.objects.filter(user=user).values_list("cycle_number", flat=True))
+
+    def test_only_the_current_cycle_is_dropped(self):
+        invalidate_plans([self.user.pk], from_cycle=0)
+        self.assertEqual(self.cycles(self.user), [0, 1])
+        self.assertEqual(self.cycles(self.other), [0, 1])
+
+    def test_global_invalidation_of_a_finished_cycle_keeps_its_plans(self):
+        invalidate_plans(None, cycle=1)
+        self.assertEqual(self.cycles(self.user), [0, 1, 2])
+        self.assertEqual(self.cycles(self.other), [0])
+
+
+class VersionConflictSurfacingTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.wallet = Wallet.objects.get(user=self.user)
+        self.wallet.credit_once(10_000, kind="DEPOSIT", external_ref="dep:seed")
+        ensure_task_progress(self.user)
+
+    def test_lost_admin_approval_race_is_a_validation_error(self):
+        task = make_task(self.user, kind=UserTask.Kind.ADMIN, price="50.00", commission="5.00")
+        with mock.patch.object(UserTaskProgress, "cas_update", side_effect=VersionConflict), \
+                self.assertRaises(ValidationError):
+            task.submit()
+        task.refresh_from_db()
+        self.assertEqual(task.status, UserTask.Status.IN_PROGRESS)
+        self.assertFalse(WalletTxn.objects.filter(external_ref=f"ADMIN_TASK_PAYOUT#{task.pk}").exists())
+
+    def test_lost_regular_submit_race_is_a_validation_error(self):
+        task = make_task(self.user)
+        with mock.patch.object(UserTaskProgress, "complete_regular", side_effect=VersionConflict), \
+                self.assertRaises(ValidationError):
+            task.submit()
+        task.refresh_from_db()
+        self.assertEqual(task.status, UserTask.Status.IN_PROGRESS)
+        self.assertFalse(WalletTxn.objects.filter(external_ref=f"REGULAR_TASK_PAYOUT#{task.pk}").exists())
+
+
+class OutboxDrainTests(TestCase):
+    def setUp(self):
+        OutboxEvent.objects.all().delete()
+        self.seen = []
+
+    def drain_with(self, fn):
+        with mock.patch.object(outbox, "_CONSUMERS", [("test.", fn)]):
+            return outbox.drain()
+
+    def test_events_are_leased_while_consumers_run(self):
+        ev = outbox.emit("test.ok", {"n": 1})
+
+        def deliver(payload):
+            self.seen.append(payload)
+            due = OutboxEvent.objects.filter(status=OutboxEvent.Status.PENDING, available_at__lte=timezone.now())
+            self.assertFalse(due.exists())   # claimed and leased: other workers skip it
+
+        self.assertEqual(self.drain_with(deliver), (1, 0))
+        self.assertEqual(self.seen, [{"n": 1}])
+        ev.refresh_from_db()
+        self.assertEqual(ev.status, OutboxEvent.Status.DONE)
+
+    def test_failures_back_off(self):
+        ev = outbox.emit("test.bad", {})
+
+        def boom(payload):
+            raise RuntimeError("down")
+
+        self.assertEqual(self.drain_with(boom), (0, 1))
+        ev.refresh_from_db()
+        self.assertEqual((ev.status, ev.attempts), (OutboxEvent.Status.PENDING, 1))
+        self.assertIn("RuntimeError: down", ev.last_error)
+        self.assertGreater(ev.available_at, timezone.now())
+
+    def test_result_is_not_recorded_over_a_newer_claim(self):
+        ev = outbox.emit("test.slow", {})
+
+        def reclaimed(payload):
+            # our lease ran out and another worker claimed the row meanwhile
+            OutboxEvent.objects.filter(pk=ev.pk).update(available_at=timezone.now() + timedelta(hours=1))
+
+        self.drain_with(reclaimed)
+        ev.refresh_from_db()
+        self.assertEqual(ev.status, OutboxEvent.Status.PENDING)
+
+
+class TaskStatusEventTests(TestCase):
+    def status_events(self):
+        return list(OutboxEvent.objects.filter(topic="user_task.status").order_by("pk")
+                    .values_list("payload__old", "payload__new"))
+
+    def test_saving_with_status_deferred_emits_nothing(self):
+        task = make_task(make_user())
+        UserTask.objects.only("id", "required_cash_cents").get(pk=task.pk).save()
+        self.assertEqual(self.status_events(), [(None, task.status)])
+
+    def test_a_status_change_is_emitted_once(self):
+        task = make_task(make_user())
+        task.status = UserTask.Status.SUBMITTED
+        task.save()
+        task.save()
+        self.assertEqual(self.status_events(), [
+            (None, UserTask.Status.IN_PROGRESS), (UserTask.Status.IN_PROGRESS, UserTask.Status.SUBMITTED),
+        ])
+
+
+class TaskActivityTests(TestCase):
+    def setUp(self):
+        self.task = make_task(make_user())
+
+    def today(self):
+        return activity.for_user(self.task.user)
+
+    def test_orders_count_created_tasks_only(self):
+        self.task.status = UserTask.Status.SUBMITTED
+        self.task.save()
+        activity.record_task_status(self.task, None)   # existing row, old status unknown
+        self.assertEqual(self.today().orders, 1)
+
+    def test_unknown_old_status_adds_no_commission(self):
+        UserTask.objects.filter(pk=self.task.pk).update(status=UserTask.Status.APPROVED)
+        self.task.status = UserTask.Status.APPROVED
+        activity.record_task_status(self.task, None)
+        self.assertEqual(self.today().commission_cents, 0)
+        activity.record_task_status(self.task, UserTask.Status.SUBMITTED)
+        self.assertEqual(self.today().commission_cents, 150)
+
+
+class DealTemplateTests(TestCase):
+    index = TemplateIndex(version=1, prices=(100, 200, 300), ids=(11, 12, 13), terms={})
+
+    def setUp(self):
+        self.user = make_user()
+        self.prog = ensure_task_progress(self.user)
+
+    def test_a_stale_copy_does_not_deal_the_same_template_again(self):
+        stale = UserTaskProgress.objects.get(pk=self.prog.pk)
+        first = self.prog.deal_template(self.index, 1_000)
+        second = stale.deal_template(self.index, 1_000)   # loses the version guard, re-reads, deals on
+        third = UserTaskProgress.objects.get(pk=self.prog.pk).deal_template(self.index, 1_000)
+        self.assertEqual(sorted([first, second, third]), [11, 12, 13])
+        self.assertEqual(UserTaskProgress.objects.get(pk=self.prog.pk).deck["i"], 0)   # three deals of three: the cursor wrapped
+
+    def test_nothing_affordable(self):
+        self.assertIsNone(self.prog.deal_template(self.index, 50))
+
+
+class ProgressSaveTests(TestCase):
+    def test_unblock_after_refresh_starts_a_new_cycle(self):
+        prog = ensure_task_progress(make_user())
+        prog = UserTaskProgress.objects.get(pk=prog.pk)
+        # another writer finishes the cycle after we loaded the row
+        UserTaskProgress.objects.filter(pk=prog.pk).update(
+            current_task_index=prog.limit_snapshot, is_blocked=True, cycles_completed=1,
+        )
+        prog.refresh_from_db()
+        prog.is_blocked = False
+        prog.save(update_fields=["is_blocked"])
+        row = UserTaskProgress.objects.filter(pk=prog.pk).values_list(
+            "current_task_index", "is_blocked", "cycles_completed").get()
+        self.assertEqual(row, (0, False, 1))
+
+
+class CompleteRegularTests(TestCase):
+    """complete_regular() must leave the row exactly as the old four saves did."""
+    FIELDS = ("dividends_cents", "dividends_paid_cents", "asset_cents", "processing_cents",
+              "current_task_index", "cycles_completed", "is_blocked")
+
+    def twins(self, **state):
+        rows = []
+        for phone in ("+10000000001", "+10000000002"):
+            prog = ensure_task_progress(make_user(phone))
+            UserTaskProgress.objects.filter(pk=prog.pk).update(**state)
+            rows.append(UserTaskProgress.objects.get(pk=prog.pk))
+        return rows
+
+    def four_saves(self, prog, c):
+        # the pre-complete_regular _auto_approve_regular sequence
+        prog.add_commission(c)
+        if c > 0:
+            prog.dividends_paid_cents = max(0, min((prog.dividends_paid_cents or 0) + c, prog.dividends_cents or 0))
+            prog.save(update_fields=["dividends_paid_cents", "updated_at"])
+        prog.set_state_normal()
+        prog.advance()
+
+    def assert_same(self, c, *, block=True, **state):
+        old, new = self.twins(**state)
+        knobs = tasksettngs(block_on_reaching_limit=block, clear_trial_bonus_at_limit=False)
+        with mock.patch.object(tasksettngs, "load", return_value=knobs):
+            self.four_saves(old, c)
+            new.complete_regular(c)
+        row = lambda p: UserTaskProgress.objects.filter(pk=p.pk).values_list(*self.FIELDS).get()
+        self.assertEqual(row(new), row(old))
+        return row(new)
+
+    def test_mid_cycle(self):
+        after = self.assert_same(150, limit_snapshot=5, current_task_index=1, dividends_cents=300, asset_cents=300)
+        self.assertEqual(after[:5], (450, 150, 450, 0, 2))
+
+    def test_last_task_blocks_once(self):
+        after = self.assert_same(150, limit_snapshot=5, current_task_index=4, cycles_completed=2)
+        self.assertEqual(after[-2:], (3, True))
+
+    def test_last_task_without_block_setting(self):
+        # save() still counts the cycle and blocks
+        self.assert_same(150, block=False, limit_snapshot=5, current_task_index=4, cycles_completed=2)
+
+    def test_settled_admin_asset_is_kept(self):
+        after = self.assert_same(150, limit_snapshot=5, dividends_cents=300, asset_cents=5_000)
+        self.assertEqual(after[2], 5_000)
+
+    def test_paid_is_clamped_to_dividends(self):
+        self.assert_same(150, limit_snapshot=5, dividends_cents=100, dividends_paid_cents=900)
+
+    def test_zero_commission(self):
+        self.assert_same(0, limit_snapshot=5, dividends_cents=100, dividends_paid_cents=40, processing_cents=700)
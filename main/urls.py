@@ -31,6 +31,8 @@ urlpatterns = [
     path("info/<slug:key>/", views.info_page, name="info_page"),
     path("announcements/", views.announcements_list, name="announcements"),
     path("user_dashboard/wallet_view", views.wallet_view, name="wallet"),
+    path("user_dashboard/wallet_view/history", views.wallet_history, name="wallet_history"),
+    path("user_dashboard/wallet_view/statement", views.wallet_statement, name="wallet_statement"),
     # Withdraw
     path("wallet/user_withdrawal", views.withdrawal, name="withdrawal"),
     path("withdraw/address/add/", views.add_address, name="withdraw_add_address"),
@@ -59,6 +61,10 @@ urlpatterns = [
     path("bo/withdrawals/<int:pk>/approve/", bo.bo_withdrawal_approve, name="bo_withdrawal_approve"),
     path("bo/withdrawals/<int:pk>/fail/", bo.bo_withdrawal_fail, name="bo_withdrawal_fail"),
 
+    path("bo/wallet-imports/", bo.bo_wallet_imports, name="bo_wallet_imports"),
+    path("bo/wallet-imports/<int:pk>/", bo.bo_wallet_import_detail, name="bo_wallet_import_detail"),
+    path("bo/wallet-imports/<int:pk>/apply/", bo.bo_wallet_import_apply, name="bo_wallet_import_apply"),
+
     path("bo/deposits/", bo.bo_deposits, name="bo_deposits"),
     path("bo/deposits/<int:pk>/review/", bo.bo_deposit_move_to_review, name="bo_deposit_move_to_review"),
     path("bo/deposits/<int:pk>/confirm/", bo.bo_deposit_confirm, name="bo_deposit_confirm"),
@@ -71,6 +77,7 @@ urlpatterns = [
     path("bo/users/<int:user_id>/unblock/", bo.bo_user_unblock, name="bo_user_unblock"),
     path("bo/users/<int:user_id>/clear-txpin/", bo.bo_user_clear_txpin, name="bo_user_clear_txpin"),
     path("bo/users/<int:user_id>/wallet/txns/", bo.bo_wallet_txns, name="bo_wallet_txns"),
+    path("bo/users/<int:user_id>/wallet/statement/", bo.bo_user_statement, name="bo_user_statement"),
     path("bo/users/<int:user_id>/payout-addresses/", bo.bo_payout_addresses, name="bo_payout_addresses"),
 
     path("bo/settings/", bo.bo_settings, name="bo_settings"),
@@ -79,6 +86,8 @@ urlpatterns = [
     path("bo/directives/", bo.bo_directives, name="bo_directives"),
     path("bo/directives/create/", bo.bo_directive_create, name="bo_directive_create"),
     path("bo/directives/<int:dir_id>/cancel/", bo.bo_directive_cancel, name="bo_directive_cancel"),
+    path("bo/directives/bulk/", bo.bo_directive_bulk_create, name="bo_directive_bulk_create"),
+    path("bo/directives/batch-cancel/", bo.bo_directive_batch_cancel, name="bo_directive_batch_cancel"),
     path("bo/tasks/", bo.bo_tasks, name="bo_tasks"),
     path("bo/tasks/<int:task_id>/approve-admin/", bo.bo_task_approve_admin, name="bo_task_approve_admin"),
     path("bo/tasks/<int:task_id>/reject/", bo.bo_task_reject, name="bo_task_reject"),
@@ -0,0 +1,114 @@
+# user_summary.py
+"""
+Per-user money summary shared by the dashboard, wallet, withdrawal and task spawn paths.
+
+One cached object per user, keyed on its CacheVersion "user_summary:<id>":
+  - wallet buckets: cash, bonus, pending
+  - the four dashboard cards from UserTaskProgress.display_totals
+The default cache is per-process LocMem, so a delete would only reach the writer's worker.
+Any ledger post, wallet save or progress/task change instead bumps the user's version in
+the same transaction; every worker's old entry stops matching once that commits, and an
+entry built from pre-commit rows can only land under the old version.
+Inside a transaction the cache is bypassed entirely: code that just moved money
+(e.g. the spawn solvency gate) must see it.
+"""
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+CACHE_PREFIX = "user_summary:v2:"
+VERSION_PREFIX = "user_summary:"
+
+
+@dataclass(frozen=True)
+class UserSummary:
+    cash_cents: int = 0
+    bonus_cents: int = 0
+    pending_cents: int = 0
+    # display_totals cards
+    total_asset_cents: int = 0
+    asset_cents: int = 0
+    dividends_cents: int = 0
+    processing_cents: int = 0
+
+    @property
+    def wallet_total_cents(self) -> int:
+        return self.cash_cents + self.bonus_cents
+
+    @property
+    def cash_eur(self) -> str:
+        return f"€{self.cash_cents / 100:,.2f}"
+
+    @property
+    def bonus_eur(self) -> str:
+        return f"€{self.bonus_cents / 100:,.2f}"
+
+    @property
+    def totals(self) -> dict:
+        """Same shape as UserTaskProgress.display_totals."""
+        return {
+            "total_asset_cents": self.total_asset_cents,
+            "asset_cents": self.asset_cents,
+            "dividends_cents": self.dividends_cents,
+            "processing_cents": self.processing_cents,
+        }
+
+
+def _version_key(user_id) -> str:
+    return f"{VERSION_PREFIX}{user_id}"
+
+
+def _key(user_id, version: int) -> str:
+    return f"{CACHE_PREFIX}{user_id}:{version}"
+
+
+def build_user_summary(user) -> UserSummary:
+    """Read wallet + progress fresh from the DB (no cache)."""
+    from .models import Wallet, ensure_task_progress  # local import to avoid circulars
+
+    wallet, _ = Wallet.objects.get_or_create(user=user)
+    user.wallet = wallet          # display_totals reads prog.user.wallet; hand it the fresh row
+    prog = ensure_task_progress(user)
+    prog.user = user
+    totals = prog.display_totals
+
+    return UserSummary(
+        cash_cents=int(wallet.balance_cents or 0),
+        bonus_cents=int(wallet.bonus_cents or 0),
+        pending_cents=int(wallet.pending_cents or 0),
+        total_asset_cents=int(totals.get("total_asset_cents", 0) or 0),
+        asset_cents=int(totals.get("asset_cents", 0) or 0),
+        dividends_cents=int(totals.get("dividends_cents", 0) or 0),
+        processing_cents=int(totals.get("processing_cents", 0) or 0),
+    )
+
+
+def get_user_summary(user) -> UserSummary:
+    """Cached summary; rebuilt on a miss. Inside a transaction: read fresh, never cached."""
+    # This transaction's own writes only move the version once they commit, and they may
+    # still roll back: neither read nor store the cache here.
+    if transaction.get_connection().in_atomic_block:
+        return build_user_summary(user)
+
+    from .models import CacheVersion
+    # version first: rows read after it are at least as new as the version they're stored under
+    key = _key(user.pk, CacheVersion.current(_version_key(user.pk)))
+    raw = cache.get(key)
+    if raw is not None:
+        try:
+            return UserSummary(**raw)
+        except TypeError:
+            pass  # shape changed between deploys → rebuild
+    summary = build_user_summary(user)
+    cache.set(key, asdict(summary), timeout=int(getattr(settings, "USER_SUMMARY_CACHE_SECONDS", 300)))
+    return summary
+
+
+def invalidate_user_summary(*user_ids) -> None:
+    """Bump the users' summary versions (call inside the writing transaction)."""
+    from .models import CacheVersion
+    CacheVersion.bump_many(_version_key(uid) for uid in user_ids if uid)
@@ -1,6 +1,5 @@
 # user_taskview.py
 from __future__ import annotations
-from datetime import date
 from decimal import Decimal
 
 from django.contrib import messages
@@ -19,6 +18,8 @@ from .signin_reward import compute_state, claim_today, _required_cycles_for_date
 from .models import maybe_offer_fortune, FortuneCardRule
 from .models import FortuneCardGrant, grant_cash_reward, convert_to_golden_task
 from .models import UserTaskProgress
+from .user_summary import get_user_summary
+from .activity import for_user as activity_for
 
 from .models import (
     ensure_task_progress,
@@ -98,15 +99,15 @@ def task_dashboard(request):
     # Ensure progress exists
     prog = ensure_task_progress(request.user)
 
-    # Base totals from model (already applies your admin/regular logic)
-    totals = dict(prog.display_totals)  # *_cents keys
-    processing_cents = int(totals.get("processing_cents", 0) or 0)
+    # Cards + wallet pieces from the cached summary (display_totals rules, invalidated on commit)
+    summary = get_user_summary(request.user)
+    totals = summary.totals  # *_cents keys
+    processing_cents = summary.processing_cents
 
     # Wallet pieces (used only when NOT processing)
-    wallet = getattr(request.user, "wallet", None)
-    wallet_cash  = int(getattr(wallet, "balance_cents", 0) or 0)
-    wallet_bonus = int(getattr(wallet, "bonus_cents", 0) or 0)
-    wallet_total_cents = wallet_cash + wallet_bonus
+    wallet_cash  = summary.cash_cents
+    wallet_bonus = summary.bonus_cents
+    wallet_total_cents = summary.wallet_total_cents
 
     # Only force Total Asset = Wallet when NOT processing.
     if processing_cents == 0:
@@ -118,11 +119,7 @@ def task_dashboard(request):
     dividends_cents = int(totals.get("dividends_cents", 0) or 0)
 
     # Counters / cycle snapshot
-    orders_today = (
-        UserTask.objects
-        .filter(user=request.user, created_at__date=date.today())
-        .count()
-    )
+    orders_today = activity_for(request.user).orders   # one (user, date) row, see main.activity
     limit        = int(prog.limit_snapshot or 0)
     next_visible = int(prog.current_task_index or 0) + 1
 
@@ -284,7 +281,7 @@ def task_detail(request, pk: int):
 
 
 
-from .models import FortuneCardGrant, FortuneCardRule, grant_cash_reward, convert_to_golden_task
+from .models import FortuneCardGrant, FortuneCardRule, VersionConflict, grant_cash_reward, convert_to_golden_task
 
 @login_required
 @require_POST
@@ -316,26 +313,30 @@ def fortune_receive(request, pk: int):
 @login_required
 @require_POST
 def fortune_open(request, pk: int):
-    with transaction.atomic():
-        grant = get_object_or_404(
-            FortuneCardGrant.objects.select_for_update(),
-            pk=pk, user=request.user
-        )
-        if grant.kind != FortuneCardRule.Kind.GOLDEN:
-            raise Http404("Not a golden grant")
-
-        picked = int(request.POST.get("box") or 0)
-        updates = []
-        if grant.status == FortuneCardGrant.Status.OFFERED:
-            grant.status = FortuneCardGrant.Status.CLICKED
-            updates.append("status")
-        if picked and picked != grant.picked_box:
-            grant.picked_box = picked
-            updates.append("picked_box")
-        if updates:
-            grant.save(update_fields=[*updates, "updated_at"])
-
-        task = convert_to_golden_task(grant)
+    try:
+        with transaction.atomic():
+            grant = get_object_or_404(
+                FortuneCardGrant.objects.select_for_update(),
+                pk=pk, user=request.user
+            )
+            if grant.kind != FortuneCardRule.Kind.GOLDEN:
+                raise Http404("Not a golden grant")
+
+            picked = int(request.POST.get("box") or 0)
+            updates = []
+            if grant.status == FortuneCardGrant.Status.OFFERED:
+                grant.status = FortuneCardGrant.Status.CLICKED
+                updates.append("status")
+            if picked and picked != grant.picked_box:
+                grant.picked_box = picked
+                updates.append("picked_box")
+            if updates:
+                grant.save(update_fields=[*updates, "updated_at"])
+
+            task = convert_to_golden_task(grant)
+    except VersionConflict:
+        # rolled back as a whole (no half-converted grant); the click can simply be repeated
+        return JsonResponse({"ok": False, "error": "Your account was being updated at the same moment — please try again."}, status=409)
 
     try:
         redirect_url = reverse("task_detail", kwargs={"pk": task.pk})
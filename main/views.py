@@ -70,7 +70,7 @@ from .forms import (
     SetTxPinForm, ChangeTxPinForm,
 )
 from .models import (
-    Wallet, PayoutAddress, WithdrawalRequest,
+    PayoutAddress, WithdrawalRequest,
     AddressType, Currency,
     DepositAddress, DepositRequest, Network,
     Hotel, Favorite, InfoPage, Announcement,
@@ -704,137 +704,62 @@ def toggle_favorite(request, slug):
 # -----------------------------
 # Wallet / Withdrawal
 # -----------------------------
-from .models import WithdrawalRequest, WithdrawalStatus, WalletTxn
+from .models import WithdrawalRequest
 
 WITHDRAW_KINDS = ["WITHDRAW", "PAYOUT", "CASH_OUT"]  # cover all your withdrawal kinds
 
 from datetime import timedelta
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render
-from .models import WalletTxn, WithdrawalRequest, WithdrawalStatus  # adjust if needed
+from django.template.loader import render_to_string
+from .models import WithdrawalRequest  # adjust if needed
+from .wallet_history import history_page
+from .user_summary import get_user_summary
+from .statements import statement_response
 
 @login_required
 @never_cache
 def wallet_view(request):
     w = request.user.wallet
+    summary = get_user_summary(request.user)
 
-    # --- Base txns (DB) - defensive newest-first ordering ---
-    txns_all = w.txns.order_by('-created_at', '-id')
-
+    # First page of the "All" tab only; other tabs (and further pages) load lazily
+    # from wallet_history, one keyset page per request.
+    rows, next_cursor = history_page(request.user, w, tab="all")
     ctx = {
-        "txns": txns_all,                                   # used by tabs
-        "txns_all": txns_all,
-        "txns_deposit": txns_all.filter(kind__iexact="DEPOSIT"),
-        # include both ADJUST & COMMISSION (template treats both as commission)
-        "txns_commission": txns_all.filter(kind__in=["ADJUST", "COMMISSION"]),
+        "summary": summary,
+        "history_rows": rows,
+        "history_next": next_cursor,
     }
+    return render(request, "meta_search/wallet.html", {**ctx, "active_page": "wallet"})
 
-    # --------- WITHDRAWALS: combine ledger + requests, no duplicates ---------
-    # 1) Ledger withdrawals (already negative cents)
-    ledger_qs = (
-        txns_all
-        .filter(kind__in=WITHDRAW_KINDS)
-        .values("created_at", "amount_cents", "bucket", "id", "external_ref")
-    )
 
-    ledger_rows = []
-    ledger_refs = set()  # for external_ref-based de-dup
-
-    for r in ledger_qs:
-        ledger_rows.append({
-            "id": r["id"],                                  # <-- for modal
-            "source": "ledger",
-            "created_at": r["created_at"],
-            "amount_cents": int(r["amount_cents"]),         # negative debits
-            "status": "confirmed",
-            "bucket": (r["bucket"] or "CASH"),
-            "seq": ("L", r["id"]),                          # tiebreaker for stable sort
-        })
-        if r["external_ref"]:
-            ledger_refs.add(r["external_ref"])
-
-    # 2) Requests: include pending/failed always; confirmed only if no matching ledger
-    req_rows = []
-    for r in WithdrawalRequest.objects.filter(user=request.user).values(
-        "id", "created_at", "amount_cents", "status"
-    ):
-        status = r["status"]
-        amount_cents_pos = int(r["amount_cents"])
-        amount_cents_as_debit = -amount_cents_pos
-        created_at = r["created_at"]
-
-        include = True
-        if status == WithdrawalStatus.CONFIRMED:
-            # A) external_ref match (preferred if you set external_ref=f"wd:{wr.id}" on the ledger)
-            if f"wd:{r['id']}" in ledger_refs:
-                include = False
-            else:
-                # B) amount+time window match (±10 min) to avoid dup if external_ref wasn't set
-                lo = created_at - timedelta(minutes=10)
-                hi = created_at + timedelta(minutes=10)
-                exists_close = WalletTxn.objects.filter(
-                    wallet=w,
-                    amount_cents=amount_cents_as_debit,
-                    created_at__range=(lo, hi),
-                    kind__in=WITHDRAW_KINDS,
-                ).exists()
-                if exists_close:
-                    include = False
-
-        if include:
-            req_rows.append({
-                "id": r["id"],                               # <-- for modal
-                "source": "request",
-                "created_at": created_at,
-                "amount_cents": amount_cents_as_debit,      # show as debit
-                "status": status,                            # pending/confirmed/failed
-                "bucket": "CASH",
-                "seq": ("R", r["id"]),                       # tiebreaker
-            })
-
-    # Combined withdrawals (newest-first; stable by seq)
-    withdrawals_combined = ledger_rows + req_rows
-    withdrawals_combined.sort(key=lambda x: (x["created_at"], x["seq"]), reverse=True)
-    ctx["withdrawals_combined"] = withdrawals_combined
-    # -----------------------------------------------------------------------
-
-    # === ONE merged stream for the "ALL" tab (newest-first across everything) ===
-    all_rows = []
-
-    # Normalize DB txns (they already include ledger withdrawals)
-    for t in txns_all:
-        kind_lc = (t.kind or "").lower()
-        all_rows.append({
-            "obj_id": t.id,                                  # <-- for modal
-            "source": "txn",
-            "kind_lc": kind_lc,
-            "bucket": (t.bucket or "cash").lower(),
-            "created_at": t.created_at,
-            "amount_cents": int(t.amount_cents),
-            "status": "confirmed",
-            "seq": ("T", t.id),                              # tiebreaker
-        })
-
-    # Add request withdrawals (only requests to avoid duplicating ledger)
-    for r in withdrawals_combined:
-        if r["source"] == "request":
-            all_rows.append({
-                "obj_id": r["id"],                           # WithdrawalRequest id
-                "source": "request",
-                "kind_lc": "withdraw",
-                "bucket": (r.get("bucket") or "cash").lower(),
-                "created_at": r["created_at"],
-                "amount_cents": int(r["amount_cents"]),
-                "status": r.get("status"),
-                "seq": r["seq"],                             # keep same tiebreaker
-            })
+@login_required
+@never_cache
+def wallet_history(request):
+    """
+    JSON: one page (50 rows) of merged wallet history for a tab.
+      GET ?tab=all|deposit|withdrawal|commission&cursor=<next from previous page>
+      -> {"html": "<li>…</li>", "next": "<cursor or empty>"}
+    """
+    rows, next_cursor = history_page(
+        request.user,
+        request.user.wallet,
+        tab=request.GET.get("tab") or "all",
+        cursor=request.GET.get("cursor"),
+    )
+    html = render_to_string("meta_search/includes/_wallet_tx_rows.html", {"rows": rows}, request=request)
+    return JsonResponse({"html": html, "next": next_cursor})
 
-    # Final newest-first sort (stable by seq)
-    all_rows.sort(key=lambda x: (x["created_at"], x["seq"]), reverse=True)
-    ctx["all_rows"] = all_rows
-    # =======================================================================
 
-    return render(request, "meta_search/wallet.html", {**ctx, "active_page": "wallet"})
+@login_required
+@never_cache
+def wallet_statement(request):
+    """
+    Streamed ledger statement download.
+      GET ?from=YYYY-MM&to=YYYY-MM&format=csv|jsonl   (defaults: this month, csv)
+    """
+    return statement_response(request.user, request.GET)
 
 
 def cents(d: Decimal) -> int:
@@ -996,12 +921,13 @@ from django.db import transaction
 # from .models import Wallet, WithdrawalRequest, PayoutAddress, Currency, cents
 # ADD THIS:
 from .models import ensure_task_progress  # STEP 2/3 need this
+from .models import InsufficientFunds
 
 @never_cache
 @require_http_methods(["GET", "POST"])
 @login_required
 def withdrawal(request):
-    wallet, _ = Wallet.objects.get_or_create(user=request.user)
+    summary = get_user_summary(request.user)
     addresses = request.user.payout_addresses.order_by("-created_at")
 
     selected_id = request.GET.get("address")
@@ -1088,34 +1014,30 @@ def withdrawal(request):
                 return redirect("withdrawal")
             # =====================================================================
 
-            # ----- Atomic wallet update + request creation -----
-            with transaction.atomic():
-                # lock wallet row to avoid race/double spend
-                w = Wallet.objects.select_for_update().get(user=request.user)
-                if amount_cents > w.balance_cents:
-                    messages.error(request, "Insufficient balance.")
-                    return redirect("withdrawal")
-
-                fee = WithdrawalForm.compute_fee(amt)
-
-                WithdrawalRequest.objects.create(
-                    user=request.user,
-                    amount_cents=amount_cents,
-                    currency=currency_value,
-                    address=address,
-                    fee_cents=cents(fee),
-                    status="pending",
-                )
-
-                w.pending_cents += amount_cents
-                w.balance_cents -= amount_cents
-                w.save()
+            fee = WithdrawalForm.compute_fee(amt)
 
-                # ===================== STEP 3: record the cycle =====================
-                # If you prefer to mark only on *confirmed* payout, move this line to
-                # whatever handler flips status to "confirmed".
-                prog.mark_withdraw_done()
-                # ====================================================================
+            # ----- Atomic request creation + hold on amount + fee -----
+            try:
+                with transaction.atomic():
+                    wr = WithdrawalRequest.objects.create(
+                        user=request.user,
+                        amount_cents=amount_cents,
+                        currency=currency_value,
+                        address=address,
+                        fee_cents=cents(fee),
+                        status="pending",
+                    )
+                    # one conditional UPDATE (balance >= total) + hold row; captured/released by the back office
+                    request.user.wallet.reserve(wr.amount_cents + wr.fee_cents, withdrawal=wr)
+
+                    # ===================== STEP 3: record the cycle =====================
+                    # If you prefer to mark only on *confirmed* payout, move this line to
+                    # whatever handler flips status to "confirmed".
+                    prog.mark_withdraw_done()
+                    # ====================================================================
+            except InsufficientFunds:
+                messages.error(request, "Insufficient balance.")
+                return redirect("withdrawal")
 
             messages.success(request, "Withdrawal submitted.")
             return redirect("withdrawal_success")
@@ -1138,7 +1060,7 @@ def withdrawal(request):
         "method_verified": any(a.is_verified for a in addresses),
         "addresses": addresses,
         "selected": selected,
-        "wallet": wallet,
+        "summary": summary,
         "currency_options": currency_options,
         "fiat_symbol": {"EUR": "€", "USD": "$", "GBP": "£"}.get(form["currency"].value() or DEFAULT_FIAT, "€"),
         "has_tx_pin": request.user.has_tx_pin(),
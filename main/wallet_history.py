@@ -0,0 +1,144 @@
+# wallet_history.py
+"""
+Keyset-paginated wallet history.
+
+One UNION ALL over:
+  - live ledger (WalletTxn)
+  - archived ledger (WalletTxnArchive, only if the wallet has archived rows)
+  - withdrawal requests that have no linked ledger row yet
+ordered newest-first by (created_at, source, id). A page is a single query;
+the cursor is the last row's key, so deep pages cost the same as the first.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import CharField, Exists, F, OuterRef, Q, Value
+
+from .models import WalletTxn, WalletTxnArchive, WithdrawalRequest, WithdrawalStatus
+
+PAGE_SIZE = 50
+
+WITHDRAW_KINDS = ["WITHDRAW", "PAYOUT", "CASH_OUT"]
+COMMISSION_KINDS = ["ADJUST", "COMMISSION"]
+TABS = ("all", "deposit", "withdrawal", "commission")
+
+# Source tags double as the tiebreaker inside one timestamp ("txn" > "request")
+SRC_TXN = "txn"
+SRC_REQUEST = "request"
+
+COLUMNS = ("h_created", "h_src", "h_id", "h_kind", "h_bucket", "h_amount", "h_status")
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+# ---- cursor ----
+def encode_cursor(row: dict) -> str:
+    micros = (row["created_at"] - _EPOCH) // timedelta(microseconds=1)
+    return f"{micros}.{row['source']}.{row['obj_id']}"
+
+
+def decode_cursor(raw: str | None):
+    """'<epoch µs>.<src>.<id>' -> (datetime, src, id); None if missing/garbled."""
+    try:
+        micros, src, obj_id = (raw or "").split(".")
+        if src not in (SRC_TXN, SRC_REQUEST):
+            return None
+        return _EPOCH + timedelta(microseconds=int(micros)), src, int(obj_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def _after(src: str, cursor) -> Q:
+    """Rows of branch `src` that sort strictly after `cursor` (newest-first)."""
+    if cursor is None:
+        return Q()
+    at, cur_src, cur_id = cursor
+    q = Q(created_at__lt=at)
+    if src < cur_src:
+        q |= Q(created_at=at)
+    elif src == cur_src:
+        q |= Q(created_at=at, id__lt=cur_id)
+    return q
+
+
+# ---- branches ----
+def _ledger_branch(model, wallet, tab, cursor):
+    qs = model.objects.filter(wallet=wallet).filter(_after(SRC_TXN, cursor))
+    if tab == "deposit":
+        qs = qs.filter(kind="DEPOSIT")   # kind is a coded int column: exact names only
+    elif tab == "withdrawal":
+        qs = qs.filter(kind__in=WITHDRAW_KINDS)
+    elif tab == "commission":
+        qs = qs.filter(kind__in=COMMISSION_KINDS)
+    return qs.order_by().annotate(
+        h_created=F("created_at"),
+        h_src=Value(SRC_TXN, output_field=CharField()),
+        h_id=F("id"),
+        h_kind=F("kind"),
+        h_bucket=F("bucket"),
+        h_amount=F("amount_cents"),
+        h_status=Value("confirmed", output_field=CharField()),
+    ).values_list(*COLUMNS)
+
+
+def _request_branch(user, wallet, cursor):
+    """
+    Pending/failed requests always; confirmed ones only while no ledger row is linked
+    to them (WalletTxn.withdrawal, set on approve / by `link_wallet_txns` for old rows).
+    The check is a correlated NOT EXISTS on the indexed FK inside the page query.
+    """
+    linked = Q(Exists(WalletTxn.objects.filter(withdrawal_id=OuterRef("pk"))))
+    if getattr(wallet, "archived_upto", None):
+        linked |= Q(Exists(WalletTxnArchive.objects.filter(withdrawal_id=OuterRef("pk"))))
+    qs = (
+        WithdrawalRequest.objects.filter(user=user)
+        .filter(_after(SRC_REQUEST, cursor))
+        .exclude(Q(status=WithdrawalStatus.CONFIRMED) & linked)
+    )
+    return qs.order_by().annotate(
+        h_created=F("created_at"),
+        h_src=Value(SRC_REQUEST, output_field=CharField()),
+        h_id=F("id"),
+        # same column types as the ledger branches (small-int codes)
+        h_kind=Value("WITHDRAW", output_field=WalletTxn._meta.get_field("kind")),
+        h_bucket=Value("CASH", output_field=WalletTxn._meta.get_field("bucket")),
+        h_amount=F("amount_cents") * -1,   # show as debit
+        h_status=F("status"),
+    ).values_list(*COLUMNS)
+
+
+def history_page(user, wallet, *, tab: str = "all", cursor: str | None = None, limit: int = PAGE_SIZE):
+    """
+    One page of merged history. Returns (rows, next_cursor); next_cursor is "" on the last page.
+    Rows are dicts: source, obj_id, kind_lc, bucket, created_at, amount_cents, status.
+    """
+    if tab not in TABS:
+        tab = "all"
+    key = decode_cursor(cursor)
+
+    branches = [_ledger_branch(WalletTxn, wallet, tab, key)]
+    if getattr(wallet, "archived_upto", None):
+        branches.append(_ledger_branch(WalletTxnArchive, wallet, tab, key))
+    if tab in ("all", "withdrawal"):
+        branches.append(_request_branch(user, wallet, key))
+
+    qs = branches[0]
+    if len(branches) > 1:
+        qs = qs.union(*branches[1:], all=True)
+    raw = list(qs.order_by("-h_created", "-h_src", "-h_id")[: limit + 1])
+
+    rows = [
+        {
+            "created_at": created,
+            "source": src,
+            "obj_id": obj_id,
+            "kind_lc": (kind or "").lower(),
+            "bucket": (bucket or "CASH").lower(),
+            "amount_cents": int(amount or 0),
+            "status": status or "confirmed",
+        }
+        for created, src, obj_id, kind, bucket, amount, status in raw[:limit]
+    ]
+    next_cursor = encode_cursor(rows[-1]) if len(raw) > limit else ""
+    return rows, next_cursor
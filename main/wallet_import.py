@@ -0,0 +1,229 @@
+# wallet_import.py
+"""
+Bulk wallet adjustments from a back-office CSV upload.
+
+CSV (header row required, extra columns ignored):
+  user          user id or phone number (E.164, as stored); a missing Wallet row is created
+  amount        EUR, signed: 12.50 credits, -12.50 debits ("." decimal point, no thousands separators)
+  external_ref  idempotency key, unique per user within the file (max 64 chars)
+  bucket        CASH (default) or BONUS
+  memo          optional; defaults to "Bulk adjustment #<import id>"
+
+Flow:
+  - validate_upload(): streams the file once, resolves users in blocks, stores the
+    lines as WalletAdjustmentRow; any bad line rejects the whole import (dry-run report)
+  - apply_chunk(): posts the next N pending rows with Wallet.post_batch (one transaction,
+    one lock pass per chunk); rows whose external_ref is already in the ledger are
+    marked SKIPPED, so re-running an import or re-uploading the same file is harmless
+"""
+from __future__ import annotations
+
+import csv
+import io
+import re
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import (
+    LedgerEntry,
+    Wallet,
+    WalletAdjustmentImport,
+    WalletAdjustmentRow,
+)
+
+REQUIRED_COLUMNS = ("user", "amount", "external_ref")
+MAX_ERRORS_KEPT = 200
+RESOLVE_BLOCK = 1000
+
+
+def max_rows() -> int:
+    return int(getattr(settings, "WALLET_IMPORT_MAX_ROWS", 50000))
+
+
+def chunk_size() -> int:
+    return int(getattr(settings, "WALLET_IMPORT_CHUNK", 500))
+
+
+# ---- validation (dry run) ----
+# One explicit decimal point, at most two decimals: "12,50" or "1,250.00" is ambiguous
+# (a stripped comma would turn €12.50 into €1250.00), and Decimal() also takes "Infinity"/"1e9".
+AMOUNT_RE = re.compile(r"[+-]?\d+(\.\d{1,2})?")
+
+
+def _parse_cents(raw: str):
+    text = (raw or "").strip().replace("€", "").strip()
+    if not AMOUNT_RE.fullmatch(text):
+        return None
+    return int(Decimal(text) * 100)
+
+
+def _wallets_for(keys) -> dict:
+    """
+    {user key as written in the CSV: wallet_id} for ids and phones in one block.
+    Users without a Wallet row yet get an empty one (as everywhere else wallets are made on demand).
+    """
+    User = get_user_model()
+    ids = {k for k in keys if k.isdigit()}
+    phones = {k for k in keys if not k.isdigit()}
+    users = {}    # key → user id
+    if ids:
+        for uid in User.objects.filter(pk__in=[int(i) for i in ids]).values_list("pk", flat=True):
+            users[str(uid)] = uid
+    if phones:
+        for uid, phone in User.objects.filter(phone__in=phones).values_list("pk", "phone"):
+            users[str(phone)] = uid
+    if not users:
+        return {}
+
+    wallets = dict(Wallet.objects.filter(user_id__in=set(users.values())).values_list("user_id", "pk"))
+    missing = set(users.values()) - set(wallets)
+    if missing:
+        Wallet.objects.bulk_create([Wallet(user_id=uid) for uid in sorted(missing)], ignore_conflicts=True)
+        wallets.update(Wallet.objects.filter(user_id__in=missing).values_list("user_id", "pk"))
+    return {key: wallets[uid] for key, uid in users.items()}
+
+
+def validate_upload(fileobj, *, filename="", uploaded_by=None) -> WalletAdjustmentImport:
+    """Parse + validate an uploaded CSV; returns the saved import (VALIDATED or REJECTED)."""
+    batch = WalletAdjustmentImport.objects.create(filename=filename[:255], uploaded_by=uploaded_by)
+    errors = []
+    error_count = 0
+
+    def bad(line_no, msg):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_ERRORS_KEPT:
+            errors.append((line_no, msg))
+
+    reader = csv.DictReader(io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline=""))
+    columns = {(c or "").strip().lower() for c in (reader.fieldnames or [])}
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        bad(1, f"missing column(s): {', '.join(missing)}")
+
+    seen_refs = set()
+    pending = []      # (line_no, row dict) waiting for user resolution
+    total = credit = debit = 0
+
+    def flush():
+        nonlocal credit, debit
+        wallets = _wallets_for({r["user"] for _, r in pending})
+        rows = []
+        for line_no, r in pending:
+            wid = wallets.get(r["user"])
+            if wid is None:
+                bad(line_no, f"unknown user {r['user']!r}")
+                continue
+            if (wid, r["external_ref"]) in seen_refs:
+                bad(line_no, f"duplicate external_ref {r['external_ref']!r} for this user")
+                continue
+            seen_refs.add((wid, r["external_ref"]))
+            if r["amount_cents"] > 0:
+                credit += r["amount_cents"]
+            else:
+                debit += r["amount_cents"]
+            rows.append(WalletAdjustmentRow(
+                batch=batch, line_no=line_no, wallet_id=wid, amount_cents=r["amount_cents"],
+                bucket=r["bucket"], memo=r["memo"] or f"Bulk adjustment #{batch.pk}",
+                external_ref=r["external_ref"],
+            ))
+        if rows and not error_count:
+            WalletAdjustmentRow.objects.bulk_create(rows)
+        pending.clear()
+
+    if not missing:
+        for line_no, raw in enumerate(reader, start=2):
+            row = {(k or "").strip().lower(): (v or "").strip() for k, v in raw.items() if k}
+            if not any(row.values()):
+                continue
+            total += 1
+            if total > max_rows():
+                bad(line_no, f"more than {max_rows()} rows; split the file")
+                break
+            cents = _parse_cents(row.get("amount"))
+            bucket = (row.get("bucket") or "CASH").upper()
+            ref = row.get("external_ref", "")
+            if not row.get("user"):
+                bad(line_no, "user is empty")
+            elif not cents:
+                bad(line_no, f"amount {row.get('amount')!r} is not a non-zero EUR amount like 12.50 or -12.50")
+            elif bucket not in ("CASH", "BONUS"):
+                bad(line_no, f"bucket {bucket!r} must be CASH or BONUS")
+            elif not ref or len(ref) > 64:
+                bad(line_no, "external_ref is required (max 64 chars)")
+            elif len(row.get("memo", "")) > 255:
+                bad(line_no, "memo is longer than 255 chars")
+            else:
+                pending.append((line_no, {
+                    "user": row["user"], "amount_cents": cents, "bucket": bucket,
+                    "memo": row.get("memo", ""), "external_ref": ref,
+                }))
+            if len(pending) >= RESOLVE_BLOCK:
+                flush()
+        flush()
+
+    batch.total_rows = total
+    batch.credit_cents = credit
+    batch.debit_cents = debit
+    batch.errors = [f"line {n}: {msg}" for n, msg in sorted(errors)]   # user lookups report late
+    batch.error_count = error_count
+    if error_count:
+        batch.status = WalletAdjustmentImport.Status.REJECTED
+        batch.rows.all().delete()
+    batch.save()
+    return batch
+
+
+# ---- application ----
+def apply_chunk(batch: WalletAdjustmentImport, *, created_by=None) -> WalletAdjustmentImport:
+    """
+    Post the next chunk of pending rows in one transaction. Safe to call concurrently
+    (rows are claimed with SKIP LOCKED) and after a crash (ledger refs dedupe).
+    """
+    S = WalletAdjustmentImport.Status
+    if batch.status not in (S.VALIDATED, S.APPLYING):
+        return batch
+
+    with transaction.atomic():
+        rows = list(
+            batch.rows.select_for_update(skip_locked=True)
+            .filter(status=WalletAdjustmentRow.Status.PENDING)
+            .order_by("id")[: chunk_size()]
+        )
+        if rows:
+            applied = Wallet.post_batch(
+                [
+                    LedgerEntry(
+                        wallet_id=r.wallet_id,
+                        amount_cents=r.amount_cents,
+                        bucket=r.bucket,
+                        kind="ADJUST",
+                        memo=r.memo,
+                        external_ref=r.external_ref,
+                    )
+                    for r in rows
+                ],
+                created_by=created_by,
+            )
+            done = {(e.wallet_id, e.external_ref) for e in applied}
+            ok = [r.pk for r in rows if (r.wallet_id, r.external_ref) in done]
+            skip = [r.pk for r in rows if (r.wallet_id, r.external_ref) not in done]
+            WalletAdjustmentRow.objects.filter(pk__in=ok).update(status=WalletAdjustmentRow.Status.APPLIED)
+            WalletAdjustmentRow.objects.filter(pk__in=skip).update(status=WalletAdjustmentRow.Status.SKIPPED)
+            WalletAdjustmentImport.objects.filter(pk=batch.pk).update(
+                status=S.APPLYING,
+                applied_rows=F("applied_rows") + len(ok),
+                skipped_rows=F("skipped_rows") + len(skip),
+            )
+        if not batch.rows.filter(status=WalletAdjustmentRow.Status.PENDING).exists():
+            WalletAdjustmentImport.objects.filter(pk=batch.pk).exclude(status=S.DONE).update(
+                status=S.DONE, finished_at=timezone.now()
+            )
+
+    batch.refresh_from_db()
+    return batch
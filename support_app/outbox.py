@@ -0,0 +1,13 @@
+# outbox.py
+"""Outbox consumers for the support chat (autodiscovered by main.outbox.discover)."""
+from main.outbox import consumer
+
+
+@consumer("support.agent_requested")
+def notify_agents(payload):
+    from .models import ChatSession
+    from .notifications import notify_waiting_agent
+
+    sess = ChatSession.objects.filter(pk=payload.get("session_id")).first()
+    if sess is not None:
+        notify_waiting_agent(sess, preview_msg=payload.get("preview") or "")
@@ -10,7 +10,7 @@ from django.db import models  # for JSONField lookups (metadata__user_ref)
 
 from .models import ChatSession, Message, Event
 from . import bot
-from .notifications import notify_waiting_agent
+from main.outbox import emit
 
 
 def _payload_session(s: ChatSession) -> dict:
@@ -295,7 +295,8 @@ def agent_request(request):
 
         last = sess.messages.order_by("-id").first()
         preview = (last.body[:180] + "…") if last and last.body else ""
-        notify_waiting_agent(sess, preview_msg=preview)
+        # Email/Telegram go out from drain_outbox, not on this request
+        emit("support.agent_requested", {"session_id": sess.pk, "preview": preview})
 
     return JsonResponse({"status": sess.status})
 
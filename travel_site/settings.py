@@ -279,6 +279,25 @@ DEPOSIT_WEBHOOK_SECRET = os.getenv("DEPOSIT_WEBHOOK_SECRET", "")
 SUPPORT_TELEGRAM_URL = os.getenv("SUPPORT_TELEGRAM_URL", "https://t.me/bcts")
 TELEGRAM_VERIFY_TTL_MINUTES = int(os.getenv("TELEGRAM_VERIFY_TTL_MINUTES", "1"))
 
+# === Wallet ledger ===
+# Ledger rows older than this (and covered by a checkpoint) move to the archive table
+WALLET_TXN_ARCHIVE_DAYS = int(os.getenv("WALLET_TXN_ARCHIVE_DAYS", "180"))
+# Cached per-user wallet/dashboard summary (dropped on every ledger/progress commit)
+USER_SUMMARY_CACHE_SECONDS = int(os.getenv("USER_SUMMARY_CACHE_SECONDS", "300"))
+# Longest range (in months) one statement download may cover
+STATEMENT_MAX_MONTHS = int(os.getenv("STATEMENT_MAX_MONTHS", "24"))
+# Back-office CSV adjustments: max lines per file, rows posted per apply step
+WALLET_IMPORT_MAX_ROWS = int(os.getenv("WALLET_IMPORT_MAX_ROWS", "50000"))
+WALLET_IMPORT_CHUNK = int(os.getenv("WALLET_IMPORT_CHUNK", "500"))
+# Back-office bulk special orders: max directives (users × cycles × orders) per batch
+DIRECTIVE_BULK_MAX_ROWS = int(os.getenv("DIRECTIVE_BULK_MAX_ROWS", "20000"))
+# Midnight rollover (manage.py run_scheduler): snapshot users who logged in within this many days
+ROLLOVER_SNAPSHOT_ACTIVE_DAYS = int(os.getenv("ROLLOVER_SNAPSHOT_ACTIVE_DAYS", "30"))
+# Singleton settings (tasksettngs) are re-checked once per request; this bounds staleness elsewhere
+SINGLETON_RECHECK_SECONDS = int(os.getenv("SINGLETON_RECHECK_SECONDS", "5"))
+# Outbox events give up (status DEAD) after this many failed deliveries
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+
 # === Logging (optional but handy for email debugging) ===
 if os.getenv("ENABLE_EMAIL_LOGGING", "false").lower() == "true":
     LOGGING = {